@@ -0,0 +1,123 @@
+'''
+Benchmark for ConcatenateBuildTarget.
+
+Concatenates many small JS files, and a few big ones, with the old decode/re-encode
+build() and the streaming one.
+
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import argparse
+import codecs
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buildtools.maestro.fileio import ConcatenateBuildTarget
+
+
+def make_js(filename, size, seed=1):
+    rng = random.Random(seed)
+    line = 'function f{0}(a, b) {{ return a * {0} + b; }} // ünïcödé\n'
+    with open(filename, 'w', encoding='utf-8-sig') as f:
+        written = 0
+        chunk = ''.join(line.format(rng.randrange(10 ** 6)) for _ in range(1000))
+        while written < size:
+            f.write(chunk)
+            written += len(chunk)
+
+
+def legacy_build(bt):
+    '''
+    ConcatenateBuildTarget.build() as it was, minus the progress bar.
+    '''
+    with codecs.open(bt.target + '.tmp', 'w', encoding=bt.write_encoding) as outf:
+        for subj in bt.subjects:
+            with codecs.open(subj, 'r', encoding=bt.read_encoding) as f:
+                outf.write(f.read())
+    if os.path.isfile(bt.target):
+        os.remove(bt.target)
+    shutil.move(bt.target + '.tmp', bt.target)
+
+
+def run(tmpdir, nfiles, size, legacy, **kwargs):
+    sources = []
+    for i in range(nfiles):
+        src = os.path.join(tmpdir, 'src{}.js'.format(i))
+        if i == 0:
+            make_js(src, size)
+        else:
+            os.link(sources[0], src)
+        sources.append(src)
+    results = {}
+    for name, build in (('new', ConcatenateBuildTarget.build), ('legacy', legacy_build)):
+        if name == 'legacy' and not legacy:
+            continue
+        bt = ConcatenateBuildTarget(os.path.join(tmpdir, name + '.js'), sources, **kwargs)
+        start = time.perf_counter()
+        build(bt)
+        results[name] = time.perf_counter() - start
+    if legacy:
+        with open(os.path.join(tmpdir, 'new.js'), 'rb') as a, open(os.path.join(tmpdir, 'legacy.js'), 'rb') as b:
+            assert a.read() == b.read(), 'Output differs from the old implementation.'
+    for filename in os.listdir(tmpdir):
+        os.remove(os.path.join(tmpdir, filename))
+    return results
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    argp.add_argument('--files', type=int, default=3000, help='Number of small files.')
+    argp.add_argument('--small', type=int, default=16, help='Size of each small file, in KiB.')
+    argp.add_argument('--big', type=int, default=4, help='Number of big files.')
+    argp.add_argument('--big-size', type=int, default=64, help='Size of each big file, in MiB.')
+    args = argp.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    cases = [
+        ('{} x {}KiB'.format(args.files, args.small), args.files, args.small * 1024),
+        ('{} x {}MiB'.format(args.big, args.big_size), args.big, args.big_size * 1024 * 1024),
+    ]
+    variants = [
+        ('utf-8-sig', {}, True),
+        ('utf-8-sig, source map', {'source_map': True}, False),
+        ('utf-8-sig -> utf-16', {'write_encoding': 'utf-16'}, True),
+    ]
+    print('{:<16} {:<24} {:>14} {:>14}'.format('files', 'mode', 'legacy', 'new'))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for label, nfiles, size in cases:
+            total = nfiles * size / (1024 * 1024)
+            for mode, kwargs, comparable in variants:
+                results = run(tmpdir, nfiles, size, comparable, **kwargs)
+                old = '{:.1f} MiB/s'.format(total / results['legacy']) if 'legacy' in results else '-'
+                print('{:<16} {:<24} {:>14} {:>14}'.format(label, mode, old, '{:.1f} MiB/s'.format(total / results['new'])))
+
+
+if __name__ == '__main__':
+    main()
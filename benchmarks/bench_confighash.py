@@ -0,0 +1,107 @@
+'''
+Benchmark for BuildTarget.getConfigHash().
+
+Compares the YAML-dump-then-MD5 hash it used to do on every call with the structural hash from
+buildtools.maestro.utils.hashConfig(), memoized per target per run.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ruamel.yaml.compat import StringIO
+
+from buildtools.maestro.base_target import yaml, yaml_lock
+from buildtools.maestro.fileio import ReplaceTextTarget
+from buildtools.maestro.web import DartSCSSBuildTarget, UglifyJSTarget
+
+#: getConfigHash() calls per target per run: is_stale(), getArtifactKey() and writeCache().
+CALLS_PER_RUN = 3
+
+
+def legacy_config_hash(bt):
+    s = StringIO()
+    with yaml_lock:
+        yaml.dump(bt.get_config(), s)
+    return hashlib.md5(s.getvalue().encode('utf-8')).hexdigest()
+
+
+def make_targets(n):
+    targets = []
+    for i in range(n):
+        kind = i % 3
+        if kind == 0:
+            targets.append(ReplaceTextTarget('out/{}.js'.format(i), 'src/{}.js'.format(i), replacements={
+                r'@@VERSION@@': '1.2.{}'.format(i),
+                r'@@DEBUG@@': 'false',
+                r'/\*\s*strip\s*\*/.*': '',
+            }))
+        elif kind == 1:
+            targets.append(UglifyJSTarget('out/{}.min.js'.format(i), 'src/{}.js'.format(i), uglify_executable='/usr/bin/uglifyjs',
+                                          compress_opts=['sequences=true', 'dead_code=true'], mangle_opts=['toplevel']))
+        else:
+            targets.append(DartSCSSBuildTarget('out/{}.css'.format(i), ['src/{}.scss'.format(i)], import_paths=['style', 'vendor/style'],
+                                               sass_path='/usr/bin/sass'))
+    return targets
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    argp.add_argument('--targets', type=int, default=3000, help='Number of targets.')
+    args = argp.parse_args()
+
+    targets = make_targets(args.targets)
+
+    start = time.perf_counter()
+    for bt in targets:
+        for _ in range(CALLS_PER_RUN):
+            legacy_config_hash(bt)
+    legacy = time.perf_counter() - start
+
+    for bt in targets:
+        bt.resetMemos()
+    start = time.perf_counter()
+    for bt in targets:
+        for _ in range(CALLS_PER_RUN):
+            bt.getConfigHash()
+    new = time.perf_counter() - start
+
+    for bt in targets:
+        bt.resetMemos()
+    start = time.perf_counter()
+    for bt in targets:
+        bt.getConfigHash()
+    cold = time.perf_counter() - start
+
+    print('{} targets, {} getConfigHash() calls each:'.format(args.targets, CALLS_PER_RUN))
+    print('  {:<22} {:>9.1f}us/target'.format('yaml + md5', legacy / args.targets * 1e6))
+    print('  {:<22} {:>9.1f}us/target'.format('hashConfig, memoized', new / args.targets * 1e6))
+    print('  {:<22} {:>9.1f}us/target'.format('hashConfig, one call', cold / args.targets * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+'''
+Benchmark for CopyFilesTarget.
+
+Times a first build, a no-op rebuild and a rebuild after touching 1% of the files, against
+os_utils.copytree(), which the target used to run on every build.  Only the target's own work
+(scanning the source and try_build()) is timed, not the rest of BuildMaestro.run().
+
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buildtools import os_utils
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.fileio import CopyFilesTarget
+
+
+def make_tree(root, nfiles, per_dir=100, size=1024):
+    data = b'x' * size
+    for i in range(nfiles):
+        dirname = os.path.join(root, 'd{}'.format(i // (per_dir * per_dir)), 'd{}'.format(i // per_dir))
+        if i % per_dir == 0:
+            os.makedirs(dirname, exist_ok=True)
+        with open(os.path.join(dirname, 'f{}.txt'.format(i)), 'wb') as f:
+            f.write(data)
+
+
+def build(tmpdir):
+    bm = BuildMaestro()
+    bt = CopyFilesTarget(os.path.join(tmpdir, '.build', 'copy.manifest'), os.path.join(tmpdir, 'src'), os.path.join(tmpdir, 'new'))
+    bm.add(bt)
+    bm.run()
+    # Just the target: writing all_targets.yml for this many provides() takes longer than the copy.  provides()
+    # scanned the source before try_build() started, so time that separately.
+    start = time.perf_counter()
+    bt.resetMemos()
+    bt.scanSource()
+    return bt.timings['wall'] + time.perf_counter() - start
+
+
+def legacy(tmpdir):
+    start = time.perf_counter()
+    os_utils.copytree(os.path.join(tmpdir, 'src'), os.path.join(tmpdir, 'old'))
+    return time.perf_counter() - start
+
+
+def touch_some(tmpdir, nfiles, every=100):
+    for i in range(0, nfiles, every):
+        filename = os.path.join(tmpdir, 'src', 'd{}'.format(i // 10000), 'd{}'.format(i // 100), 'f{}.txt'.format(i))
+        with open(filename, 'ab') as f:
+            f.write(b'y')
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    argp.add_argument('--files', type=int, default=20000, help='Files in the source tree.')
+    args = argp.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cwd = os.getcwd()
+        os.chdir(tmpdir)
+        try:
+            make_tree(os.path.join(tmpdir, 'src'), args.files)
+            print('{:<20} {:>10} {:>10}'.format('build', 'copytree', 'target'))
+            print('{:<20} {:>9.2f}s {:>9.2f}s'.format('first', legacy(tmpdir), build(tmpdir)))
+            print('{:<20} {:>9.2f}s {:>9.2f}s'.format('no-op', legacy(tmpdir), build(tmpdir)))
+            touch_some(tmpdir, args.files)
+            print('{:<20} {:>9.2f}s {:>9.2f}s'.format('1% changed', legacy(tmpdir), build(tmpdir)))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
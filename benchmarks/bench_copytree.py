@@ -0,0 +1,94 @@
+'''
+Benchmark for os_utils.copytree().
+
+Copies a tree of small files with the old optree()/single_copy() loop and with copytree(),
+then copies it again over the result, which should copy nothing.
+
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buildtools import os_utils
+
+
+def make_tree(root, nfiles, per_dir=100, size=1024):
+    data = b'x' * size
+    for i in range(nfiles):
+        dirname = os.path.join(root, 'd{}'.format(i // (per_dir * per_dir)), 'd{}'.format(i // per_dir))
+        if i % per_dir == 0:
+            os.makedirs(dirname, exist_ok=True)
+        with open(os.path.join(dirname, 'f{}.txt'.format(i)), 'wb') as f:
+            f.write(data)
+
+
+def legacy_copytree(fromdir, todir):
+    '''
+    copytree() as it was, without the progress bar (which walked the tree a second time to count).
+    '''
+    os_utils.optree(fromdir, todir, os_utils.single_copy)
+
+
+def timed(func, *args, **kwargs):
+    # Don't make one run pay for writing back the last one's files.
+    if hasattr(os, 'sync'):
+        os.sync()
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    argp.add_argument('--files', type=int, default=100000, help='Files in the tree.')
+    argp.add_argument('--size', type=int, default=1024, help='Bytes per file.')
+    argp.add_argument('--jobs', '-j', type=int, default=None, help='Copying threads.  Default: as copy_files().')
+    args = argp.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        src = os.path.join(tmpdir, 'src')
+        make_tree(src, args.files, size=args.size)
+        print('{:<10} {:<10} {:>10} {:>10}'.format('run', 'strategy', 'legacy', 'copytree'))
+        for strategy in ('copy', 'reflink', 'hardlink'):
+            old = os.path.join(tmpdir, 'old')
+            new = os.path.join(tmpdir, 'new')
+            for run in ('first', 'no-op'):
+                legacy = timed(legacy_copytree, src, old) if strategy == 'copy' else None
+                current = timed(os_utils.copytree, src, new, strategy=strategy, jobs=args.jobs)
+                print('{:<10} {:<10} {:>10} {:>9.2f}s'.format(run, strategy, '-' if legacy is None else '{:.2f}s'.format(legacy), current))
+            shutil.rmtree(new)
+            if os.path.isdir(old):
+                shutil.rmtree(old)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+'''
+Throughput benchmark for the file hashing behind Maestro's caches.
+
+Hashes a pile of small files and one big file with every algorithm utils.available_hash_algorithms() offers, using both
+utils.hashfile() and the plain read() loop it used to have.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buildtools import utils
+
+
+def legacy_hashfile(filename, hasher, blocksize=65536):
+    '''
+    utils.hashfile() before mmap/readinto, for comparison.
+    '''
+    with open(filename, 'rb') as afile:
+        buf = afile.read(blocksize)
+        while len(buf) > 0:
+            hasher.update(buf)
+            buf = afile.read(blocksize)
+    return hasher.hexdigest()
+
+
+def make_files(tmpdir, nsmall, small_size, large_size):
+    small = []
+    for i in range(nsmall):
+        filename = os.path.join(tmpdir, 'small{}.bin'.format(i))
+        with open(filename, 'wb') as f:
+            f.write(os.urandom(small_size))
+        small.append(filename)
+    large = os.path.join(tmpdir, 'large.bin')
+    with open(large, 'wb') as f:
+        chunk = os.urandom(1024 * 1024)
+        for _ in range(large_size // len(chunk)):
+            f.write(chunk)
+    return small, [large]
+
+
+def bench(hashfile, filenames, algorithm, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for filename in filenames:
+            hashfile(filename, utils.new_hasher(algorithm))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    argp.add_argument('--small-files', type=int, default=2000, help='Number of small files.')
+    argp.add_argument('--small-size', type=int, default=4096, help='Size of each small file, in bytes.')
+    argp.add_argument('--large-size', type=int, default=256, help='Size of the large file, in MiB.')
+    argp.add_argument('--repeat', type=int, default=3, help='Best of this many runs is reported.')
+    args = argp.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        small, large = make_files(tmpdir, args.small_files, args.small_size, args.large_size * 1024 * 1024)
+        sets = [
+            ('small', small, args.small_files * args.small_size),
+            ('large', large, args.large_size * 1024 * 1024),
+        ]
+        print('{:>10} {:>6} {:>14} {:>14}'.format('algorithm', 'set', 'hashfile', 'legacy'))
+        for algorithm in utils.available_hash_algorithms():
+            for label, filenames, nbytes in sets:
+                # Warm the page cache so we're timing the hashing, not the disk.
+                bench(utils.hashfile, filenames, algorithm, 1)
+                new = bench(utils.hashfile, filenames, algorithm, args.repeat)
+                old = bench(legacy_hashfile, filenames, algorithm, args.repeat)
+                mib = nbytes / (1024 * 1024)
+                print('{:>10} {:>6} {:>9.0f} MiB/s {:>9.0f} MiB/s'.format(algorithm, label, mib / new, mib / old))
+
+
+if __name__ == '__main__':
+    main()
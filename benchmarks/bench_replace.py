@@ -0,0 +1,125 @@
+'''
+Throughput benchmark for ReplaceTextTarget.
+
+Generates a SQL-dump-like file and runs the same replacements through the old character-at-a-time loop and the
+chunked engine in buildtools.maestro.textstream, checking that both write the same bytes.
+
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import argparse
+import codecs
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buildtools.maestro.fileio import ReplaceTextTarget
+from buildtools.maestro.utils import callLambda
+
+REPLACEMENTS = {
+    '@@SCHEMA@@': 'prod',
+    '@@OWNER@@': 'app_user',
+    r'^-- Dumped.*$': '-- (header removed)',
+    r'\bDEFINER=`[^`]+`@`[^`]+`': 'DEFINER=CURRENT_USER',
+}
+
+
+def make_dump(filename, size, seed=1):
+    rng = random.Random(seed)
+    written = 0
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        f.write('-- Dumped from database version 13.2\r\n')
+        while written < size:
+            if rng.random() < 0.01:
+                line = 'CREATE DEFINER=`root`@`localhost` VIEW @@SCHEMA@@.v{} AS SELECT 1;\n'.format(rng.randrange(1000))
+            else:
+                line = "INSERT INTO @@SCHEMA@@.t{} VALUES ({}, '{}', '@@OWNER@@');\n".format(
+                    rng.randrange(50), rng.randrange(10 ** 9), ''.join(rng.choice('abcdefghij ') for _ in range(rng.randrange(20, 120))))
+            f.write(line)
+            written += len(line)
+
+
+def legacy_build(bt):
+    '''
+    ReplaceTextTarget.build() as it was, minus the progress bar.
+    '''
+    def process_line(outf, line):
+        for needle, replacement in bt.replacements.items():
+            needle = callLambda(needle)
+            line = re.sub(needle, replacement, line)
+        outf.write(line)
+    with codecs.open(bt.subject, 'r', encoding=bt.read_encoding) as inf:
+        with codecs.open(bt.target, 'w', encoding=bt.write_encoding) as outf:
+            linebuf = ''
+            while True:
+                block = inf.read(4096)
+                block = block.replace('\r\n', '\n')
+                block = block.replace('\r', '\n')
+                if not block:
+                    process_line(outf, linebuf)
+                    break
+                for c in block:
+                    linebuf += c
+                    if c in '\r\n':
+                        process_line(outf, linebuf)
+                        linebuf = ''
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    argp.add_argument('--size', type=int, nargs='+', default=[8, 64], help='Input sizes, in MiB.')
+    argp.add_argument('--legacy-max', type=int, default=8, help="Don't run the old loop on inputs bigger than this many MiB.")
+    args = argp.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print('{:>8} {:>14} {:>14}'.format('MiB', 'legacy', 'streaming'))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in args.size:
+            src = os.path.join(tmpdir, 'dump.sql')
+            make_dump(src, size * 1024 * 1024)
+
+            bt = ReplaceTextTarget(os.path.join(tmpdir, 'new.sql'), src, REPLACEMENTS)
+            start = time.perf_counter()
+            bt.build()
+            new = time.perf_counter() - start
+
+            legacy = '-'
+            if size <= args.legacy_max:
+                old = ReplaceTextTarget(os.path.join(tmpdir, 'old.sql'), src, REPLACEMENTS)
+                start = time.perf_counter()
+                legacy_build(old)
+                seconds = time.perf_counter() - start
+                legacy = '{:.1f} MiB/s'.format(size / seconds)
+                with open(old.target, 'rb') as a, open(bt.target, 'rb') as b:
+                    assert a.read() == b.read(), 'Output differs from the old implementation.'
+            print('{:>8} {:>14} {:>14}'.format(size, legacy, '{:.1f} MiB/s'.format(size / new)))
+
+
+if __name__ == '__main__':
+    main()
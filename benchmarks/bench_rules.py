@@ -0,0 +1,109 @@
+'''
+Benchmark for BuildMaestro.loadRules().
+
+Saves a synthetic graph in the text rules format and the binary one, then times loading each.  The binary load is
+checked against the original targets' serialize() output.
+
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buildtools.maestro import BuildMaestro, rulesfile
+from buildtools.maestro.fileio import ConcatenateBuildTarget, CopyFileTarget, PrependToFileTarget, ReplaceTextTarget
+
+for cls in (ConcatenateBuildTarget, CopyFileTarget, PrependToFileTarget, ReplaceTextTarget):
+    BuildMaestro.RecognizeType(cls)
+
+
+def make_maestro(n):
+    bm = BuildMaestro()
+    for i in range(n):
+        kind = i % 4
+        if kind == 0:
+            bm.add(ReplaceTextTarget('out/{}.js'.format(i), 'src/{}.js'.format(i), replacements={
+                r'@@VERSION@@': '1.2.{}'.format(i),
+                r'@@DEBUG@@': 'false',
+            }))
+        elif kind == 1:
+            bm.add(PrependToFileTarget('out/{}.css'.format(i), 'src/{}.css'.format(i), '/* generated */\n', dependencies=['out/{}.js'.format(i - 1)]))
+        elif kind == 2:
+            bm.add(ConcatenateBuildTarget('out/{}.bundle.js'.format(i), ['out/{}.js'.format(i - 2), 'src/{}.js'.format(i)]))
+        else:
+            bm.add(CopyFileTarget('dist/{}.js'.format(i), 'out/{}.bundle.js'.format(i - 1)))
+    return bm
+
+
+def time_load(filename, repeat):
+    best = None
+    for _ in range(repeat):
+        bm = BuildMaestro()
+        start = time.perf_counter()
+        bm.loadRules(filename)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, bm
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    argp.add_argument('--rules', type=int, default=5000, help='Number of rules.')
+    argp.add_argument('--repeat', type=int, default=3, help='Keep the best of this many loads.')
+    argp.add_argument('--skip-text', action='store_true', default=False, help="Don't time the text format.  It is slow.")
+    args = argp.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    bm = make_maestro(args.rules)
+    expected = [bt.serialize() for bt in bm.alltargets]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        textfile = os.path.join(tmpdir, 'rules.txt')
+        binfile = os.path.join(tmpdir, 'rules.bin')
+        bm.saveRules(textfile)
+        bm.saveRules(binfile, binary=True)
+
+        print('{} rules:'.format(args.rules))
+        if not args.skip_text:
+            seconds, _ = time_load(textfile, 1)
+            print('  {:<24} {:>9.3f}s {:>9} bytes'.format('text', seconds, os.path.getsize(textfile)))
+        seconds, loaded = time_load(binfile, args.repeat)
+        assert [bt.serialize() for bt in loaded.alltargets] == expected
+        print('  {:<24} {:>9.3f}s {:>9} bytes'.format('binary ({})'.format('msgpack' if rulesfile.msgpack is not None else 'pure python'), seconds, os.path.getsize(binfile)))
+        if rulesfile.msgpack is not None:
+            rulesfile.msgpack = None
+            seconds, _ = time_load(binfile, args.repeat)
+            print('  {:<24} {:>9.3f}s'.format('binary (pure python)', seconds))
+
+        start = time.perf_counter()
+        rulesfile.RulesFile(binfile).getRules('Prepend')
+        print('  {:<24} {:>9.3f}s'.format('one type, no targets', time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
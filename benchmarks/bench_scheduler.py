@@ -0,0 +1,132 @@
+'''
+Micro-benchmark for BuildMaestro's scheduler.
+
+Builds a synthetic, layered graph of no-op targets and times how long it takes
+to schedule all of them, without any actual build work or cache I/O.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.base_target import SingleBuildTarget
+
+
+class NullTarget(SingleBuildTarget):
+    BT_LABEL = 'NULL'
+
+    def try_build(self):
+        self.dirty = False
+
+
+def make_graph(ntargets, width, fanin, seed=1):
+    '''
+    ntargets targets in layers of `width`, each depending on up to `fanin` targets from earlier layers.
+    '''
+    rng = random.Random(seed)
+    rules = []
+    for i in range(ntargets):
+        deps = []
+        if i >= width:
+            layer_start = (i // width) * width
+            deps = ['t{}'.format(rng.randrange(0, layer_start)) for _ in range(fanin)]
+        rules.append(('t{}'.format(i), deps))
+    # Real buildscripts don't add targets in dependency order.
+    rng.shuffle(rules)
+    bm = BuildMaestro()
+    for target, deps in rules:
+        bm.add(NullTarget(target, dependencies=deps))
+    return bm
+
+
+def prepare(bm):
+    for bt in bm.alltargets:
+        bt.maestro = bm
+        bt.built = False
+    bm.targetsCompleted = set()
+    bm.targetsDirty = set()
+    keys = bm.buildProviderIndex()
+    bm.buildDependencyGraph()
+    return keys
+
+
+def legacy_schedule(bm, keys):
+    '''
+    The polling loop BuildMaestro.run() used to have, for comparison.
+    '''
+    keys = list(keys)
+    completed = []
+    loop = 0
+    bm.targetsCompleted = completed
+    while len(bm.targets) > len(completed) and loop < 100:
+        loop += 1
+        for bt in bm.alltargets:
+            if bt.canBuild(bm, keys) and any([target not in completed for target in bt.provides()]):
+                bt.try_build()
+                completed += bt.provides()
+    return len(completed) == len(bm.targets)
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    argp.add_argument('--targets', type=int, nargs='+', default=[1000, 10000], help='Graph sizes to test.')
+    argp.add_argument('--width', type=int, default=500, help='Targets per layer.')
+    argp.add_argument('--fanin', type=int, default=3, help='Dependencies per target.')
+    argp.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1)
+    argp.add_argument('--legacy-max', type=int, default=2000, help='Skip the legacy loop on graphs bigger than this.  It is quadratic.')
+    args = argp.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print('{:>8} {:>12} {:>12} {:>12}'.format('targets', 'cycles', 'scheduler', 'legacy'))
+    for ntargets in args.targets:
+        bm = make_graph(ntargets, args.width, args.fanin)
+        bm.jobs = args.jobs
+        prepare(bm)
+        start = time.perf_counter()
+        bm.checkForCycles()
+        cycles = time.perf_counter() - start
+
+        start = time.perf_counter()
+        assert bm._run_scheduler()
+        assert len(bm.targetsCompleted) == ntargets
+        new = time.perf_counter() - start
+
+        legacy = '-'
+        if ntargets <= args.legacy_max:
+            bm = make_graph(ntargets, args.width, args.fanin)
+            keys = prepare(bm)
+            start = time.perf_counter()
+            assert legacy_schedule(bm, keys)
+            legacy = '{:.3f}s'.format(time.perf_counter() - start)
+        print('{:>8} {:>11.3f}s {:>11.3f}s {:>12}'.format(ntargets, cycles, new, legacy))
+
+
+if __name__ == '__main__':
+    main()
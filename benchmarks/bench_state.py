@@ -0,0 +1,131 @@
+'''
+Benchmark for no-op builds with the build state database vs. per-target YAML cache files.
+
+Builds a few thousand tiny copy targets in a temporary directory, then times a
+build where nothing has changed.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buildtools import os_utils
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.base_target import SingleBuildTarget, yaml, yaml_lock
+
+
+class TouchTarget(SingleBuildTarget):
+    BT_LABEL = 'TOUCH'
+
+    built_count = 0
+
+    def build(self):
+        TouchTarget.built_count += 1
+        shutil.copyfile(self.files[0], self.target)
+
+
+class LegacyTouchTarget(TouchTarget):
+    '''
+    Uses the one-YAML-file-per-target cache from before BuildMaestro.state.
+    '''
+    def getCacheFile(self):
+        # BuildMaestro.run() deletes {builddir}/cache/ after migrating it.
+        filename = hashlib.md5(self.name.encode('utf-8')).hexdigest()+'.yml'
+        return os.path.join(self.maestro.builddir, 'legacy-cache', filename)
+
+    def writeCache(self):
+        configHash = self.getConfigHash()
+        targetHash = self.getTargetHash()
+        os_utils.ensureDirExists(os.path.dirname(self.getCacheFile()))
+        with open(self.getCacheFile(), 'w') as f, yaml_lock:
+            yaml.dump_all([self.CACHE_VER, configHash, targetHash, self.serialize_file_times(), self.serialize_file_hashes(), self.get_config()], f)
+
+    def readCache(self):
+        self.lastConfigHash=''
+        self.lastTargetHash=''
+        self.lastFileTimes={}
+        self.lastFileHashes={}
+        self.lastConfig={}
+        if os.path.isfile(self.getCacheFile()):
+            with open(self.getCacheFile(), 'r') as f, yaml_lock:
+                cachedata = list(yaml.load_all(f))
+                if len(cachedata)==6 and cachedata[0] == self.CACHE_VER:
+                    _, self.lastConfigHash, self.lastTargetHash, self.lastFileTimes, self.lastFileHashes, self.lastConfig = cachedata
+
+
+def make_maestro(cls, ntargets, jobs):
+    bm = BuildMaestro()
+    bm.jobs = jobs
+    for i in range(ntargets):
+        bm.add(cls(os.path.join('out', 'f{}.txt'.format(i)), files=[os.path.join('src', 'f{}.txt'.format(i))]))
+    return bm
+
+
+def run(cls, ntargets, jobs):
+    bm = make_maestro(cls, ntargets, jobs)
+    TouchTarget.built_count = 0
+    start = time.perf_counter()
+    bm.run()
+    bm.state.close()
+    return time.perf_counter() - start, TouchTarget.built_count
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    argp.add_argument('--targets', type=int, default=2000)
+    argp.add_argument('--jobs', '-j', type=int, default=1)
+    argp.add_argument('--runs', type=int, default=3, help='No-op builds to time.  Best is reported.')
+    args = argp.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    workdir = tempfile.mkdtemp(prefix='bench_state')
+    try:
+        with os_utils.Chdir(workdir, quiet=True):
+            os.makedirs('src')
+            os.makedirs('out')
+            for i in range(args.targets):
+                with open(os.path.join('src', 'f{}.txt'.format(i)), 'w') as f:
+                    f.write(hashlib.md5(str(i).encode('ascii')).hexdigest() * 32)
+            print('{:>10} {:>10} {:>10}'.format('cache', 'first', 'no-op'))
+            for name, cls in (('yaml', LegacyTouchTarget), ('state.db', TouchTarget)):
+                shutil.rmtree('.build', ignore_errors=True)
+                first, _ = run(cls, args.targets, args.jobs)
+                noop = []
+                for _ in range(args.runs):
+                    elapsed, rebuilt = run(cls, args.targets, args.jobs)
+                    assert rebuilt == 0, rebuilt
+                    noop.append(elapsed)
+                print('{:>10} {:>9.3f}s {:>9.3f}s'.format(name, first, min(noop)))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
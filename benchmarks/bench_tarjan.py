@@ -0,0 +1,140 @@
+'''
+Benchmark for the TarjanGraph used by BuildMaestro.checkForCycles().
+
+Compares the current iterative implementation to the old recursive one, on a
+layered random DAG and on a long linear chain (which the old one can't handle).
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import argparse
+import os
+import random
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buildtools.maestro import TarjanGraph
+
+
+class LegacyTarjanGraphVertex(object):
+    def __init__(self, ID: int, refs: List[int]):
+        self.ID=ID
+        self.refs = refs
+        self.disc = -1
+        self.low = -1
+        self.stackMember = False
+
+
+class LegacyTarjanGraph(object):
+    '''
+    The recursive implementation checkForCycles() used to use, for comparison.
+    '''
+    def __init__(self):
+        self.vertices = {}
+        self.time = 0
+        self.cycles=[]
+
+    def add_edge(self, ID: int, refs: List[int]):
+        self.vertices[ID] = LegacyTarjanGraphVertex(ID, refs)
+
+    def _sccutil(self, vertex, stack):
+        vertex.disc = self.time
+        vertex.low = self.time
+        self.time+=1
+        stack.append(vertex.ID)
+        vertex.stackMember=True
+
+        for vID in vertex.refs:
+            other_vertex = self.vertices[vID]
+            if other_vertex.disc == -1:
+                self._sccutil(other_vertex, stack)
+                vertex.low=min(vertex.low,other_vertex.low)
+            else:
+                vertex.low=min(vertex.low,other_vertex.disc)
+        w=-1
+        if vertex.low == vertex.disc:
+            cycle=[]
+            while w!=vertex.ID:
+                w = stack.pop()
+                cycle += [w]
+                self.vertices[w].stackMember=False
+            self.cycles += [cycle]
+
+    def SCC(self):
+        stack=[]
+        for vertex in self.vertices.values():
+            if vertex.disc == -1:
+                self._sccutil(vertex, stack)
+
+
+def layered_graph(n, width=500, fanin=3, seed=1):
+    rng = random.Random(seed)
+    edges = []
+    for i in range(n):
+        refs = []
+        if i >= width:
+            layer_start = (i // width) * width
+            refs = [rng.randrange(0, layer_start) for _ in range(fanin)]
+        edges.append((i, refs))
+    rng.shuffle(edges)
+    return edges
+
+
+def chain_graph(n):
+    # Each vertex depends on the next, so a depth-first search has to walk the whole chain.
+    return [(i, [i + 1] if i + 1 < n else []) for i in range(n)]
+
+
+def bench(cls, edges):
+    start = time.perf_counter()
+    tg = cls()
+    for ID, refs in edges:
+        tg.add_edge(ID, refs)
+    try:
+        tg.SCC()
+    except RecursionError:
+        return 'RecursionError', None
+    return '{:.3f}s'.format(time.perf_counter() - start), sum([1 for c in tg.cycles if len(c) > 1])
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    argp.add_argument('--vertices', type=int, nargs='+', default=[10000, 100000], help='Graph sizes to test.')
+    args = argp.parse_args()
+
+    print('{:>8} {:>8} {:>16} {:>16}'.format('graph', 'vertices', 'iterative', 'recursive'))
+    for n in args.vertices:
+        for name, edges in (('layered', layered_graph(n)), ('chain', chain_graph(n))):
+            results = []
+            for cls in (TarjanGraph, LegacyTarjanGraph):
+                elapsed, cycles = bench(cls, edges)
+                if cycles:
+                    # The legacy implementation doesn't check whether a visited vertex is still on the stack.
+                    elapsed += ' ({} bogus cycles)'.format(cycles)
+                results.append(elapsed)
+            print('{:>8} {:>8} {:>16} {:>16}'.format(name, n, *results))
+
+
+if __name__ == '__main__':
+    main()
@@ -22,7 +22,7 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 
 '''
-import logging, os, re
+import logging, os, re, threading
 import colorama
 
 class NullIndenter(object):
@@ -65,18 +65,27 @@ def colorize(text):
 class IndentLogger(object):
     '''
     Indents stuff.
-    '''
 
-    INDENT = 0
+    Indentation is tracked per-thread, so worker threads (see BuildMaestro's --jobs) don't trample each other's nesting.
+    '''
 
     def __init__(self, logger=None):
         self.log = logger
         self.useAnsiColors=False
+        self._local = threading.local()
         if isinstance(self.log, str):
             self.log = logging.getLogger(self.log)
         if self.log is None:
             self.log = logging.getLogger()
 
+    @property
+    def INDENT(self):
+        return getattr(self._local, 'indent', 0)
+
+    @INDENT.setter
+    def INDENT(self, value):
+        self._local.indent = value
+
     def __enter__(self):
         self.INDENT += 1
         return self
@@ -23,17 +23,29 @@ SOFTWARE.
 
 '''
 import codecs
+import heapq
+import itertools
+import json
 import logging
 import os
 import re
 import sys
 import shutil
 import argparse
+import time
 
 from collections import defaultdict
-from buildtools import os_utils
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from buildtools import os_utils, tracing
+from buildtools.utils import DEFAULT_HASH_ALGORITHM, available_hash_algorithms
 from buildtools.bt_logging import NullIndenter, log
+from buildtools.maestro.artifacts import ArtifactCache
 from buildtools.maestro.base_target import BuildTarget
+from buildtools.maestro.remote_cache import backend_from_uri
+from buildtools.maestro.rulesfile import RulesFile, is_rules_file, write_rules
+from buildtools.maestro.filecache import FileInfoCache
+from buildtools.maestro.statedb import BuildStateDB
+from buildtools.maestro.watch import new_watcher
 from buildtools.maestro.fileio import (ConcatenateBuildTarget, CopyFilesTarget,
                                        CopyFileTarget, MoveFileTarget,
                                        ReplaceTextTarget)
@@ -49,56 +61,97 @@ yaml = YAML(typ='safe', pure=True)
 yaml.register_class(SerializableLambda)
 yaml.register_class(SerializableFileLambda)
 
-class TarjanGraphVertex(object):
-    def __init__(self, ID: int, refs: List[int]):
-        self.ID=ID
-        self.refs = refs
-        self.disc = -1
-        self.low = -1
-        self.stackMember = False
+class TarjanGraph(object):
+    '''
+    Tarjan's strongly connected components algorithm.
 
+    Iterative, so long dependency chains don't run into the recursion limit, and vertex state is kept in
+    parallel arrays indexed by insertion order rather than one object per vertex.
 
-class TarjanGraph(object):
+    After SCC(), self.cycles holds every strongly connected component with more than one vertex.
+    '''
     def __init__(self):
-        self.cur_id = 0 # Used for populating the graph.
-        #self.graph = defaultdict(list)
-        self.vertices = {}
-        self.time = 0
+        self.ids = []      # index -> vertex ID
+        self.indexOf = {}  # vertex ID -> index
+        self.refs = []     # index -> List[vertex ID]
         self.cycles=[]
 
+    def _index(self, ID: int) -> int:
+        idx = self.indexOf.get(ID)
+        if idx is None:
+            idx = self.indexOf[ID] = len(self.ids)
+            self.ids.append(ID)
+            self.refs.append([])
+        return idx
+
     def add_edge(self, ID: int, refs: List[int]):
-        self.vertices[ID] = TarjanGraphVertex(ID, refs)
-        #for ref in refs:
-        #    self.graph[ID].append(ref)
-
-    def _sccutil(self, vertex, stack):
-        vertex.disc = self.time
-        vertex.low = self.time
-        self.time+=1
-        stack.append(vertex.ID)
-        vertex.stackMember=True
-
-        for vID in vertex.refs:
-            other_vertex = self.vertices[vID]
-            if other_vertex.disc == -1:
-                self._sccutil(other_vertex, stack)
-                vertex.low=min(vertex.low,other_vertex.low)
-            else:
-                vertex.low=min(vertex.low,other_vertex.disc)
-        w=-1
-        if vertex.low == vertex.disc:
-            cycle=[]
-            while w!=vertex.ID:
-                w = stack.pop()
-                cycle += [w]
-                self.vertices[w].stackMember=False
-            self.cycles += [cycle]
+        self.refs[self._index(ID)] = refs
 
     def SCC(self):
-        stack=[]
-        for vertex in self.vertices.values():
-            if vertex.disc == -1:
-                self._sccutil(vertex, stack)
+        indexOf = self.indexOf
+        ids = self.ids
+        adj = self.refs
+        n = len(ids)
+        disc = [-1] * n
+        low = [0] * n
+        nextEdge = [0] * n
+        onStack = bytearray(n)
+        stack = []
+        cycles = self.cycles
+        time = 0
+        for root in range(n):
+            if disc[root] != -1:
+                continue
+            disc[root] = low[root] = time
+            time += 1
+            stack.append(root)
+            onStack[root] = 1
+            work = [root]
+            while work:
+                v = work[-1]
+                edges = adj[v]
+                i = nextEdge[v]
+                nedges = len(edges)
+                lowV = low[v]
+                while i < nedges:
+                    w = indexOf[edges[i]]
+                    i += 1
+                    if disc[w] == -1:
+                        break
+                    if onStack[w] and disc[w] < lowV:
+                        lowV = disc[w]
+                else:
+                    # All edges visited, v is done.
+                    work.pop()
+                    if work:
+                        parent = work[-1]
+                        if lowV < low[parent]:
+                            low[parent] = lowV
+                    if lowV == disc[v]:
+                        if stack[-1] == v:
+                            # Lone vertex, not a cycle.  Skip building a list for it.
+                            stack.pop()
+                            onStack[v] = 0
+                            continue
+                        cycle = []
+                        while True:
+                            w = stack.pop()
+                            onStack[w] = 0
+                            cycle.append(ids[w])
+                            if w == v:
+                                break
+                        cycles.append(cycle)
+                    else:
+                        low[v] = lowV
+                    continue
+                # Descend into w, picking v back up at the next edge afterwards.
+                low[v] = lowV
+                nextEdge[v] = i
+                disc[w] = low[w] = time
+                time += 1
+                stack.append(w)
+                onStack[w] = 1
+                work.append(w)
 
 class BuildMaestro(object):
     ALL_TYPES = {}
@@ -106,15 +159,63 @@ class BuildMaestro(object):
     def __init__(self, hidden_build_dir='.build'):
         self.alltargets = []
         self.targets = []
-        self.targetsCompleted = []
+        #: Provided file/target -> IDs of the BuildTargets providing it.  Rebuilt by buildProviderIndex() each run.
+        self.providers = {}
+
+        #: Everything provided by targets that have finished this run.
+        self.targetsCompleted = set()
+        #: Absolute paths of everything provided by targets that were actually rebuilt this run.
+        self.targetsDirty = set()
+        # abspath -> IDs of its providers, for findProvider() and findProviderIDs().
+        self._providersByPath = None
+
+        #: Decide what's stale, and why, but don't build anything.
+        self.dry_run = False
+        #: With dry_run, report every reason for every target, not just the first reason for stale ones.
+        self.explain = False
+        #: BuildTarget.ID -> BuildTarget.explain() result, from the last dry run.
+        self.explanations = {}
+
+        #: After each run, print this many of the slowest targets and the critical path.
+        self.report_timings = 0
+        #: IDs of targets in the order they finished in the last run.
+        self.buildOrder = []
+        #: Target ID -> IDs of the targets it waits on, and of the targets waiting on it.  Set by buildDependencyGraph().
+        self.upstreamOf = []
+        self.downstreamOf = []
+
+        #: If set, run() writes a Chrome trace-event JSON file here.
+        self.trace_file = None
 
         self.verbose = False
         self.colors = False
         self.show_commands = False
 
+        #: Maximum number of targets built at once.
+        self.jobs = os.cpu_count() or 1
+
+        #: Most files hashed at once, across all targets.
+        self.hash_jobs = os.cpu_count() or 1
+
+        #: What file contents, configs and target lists get hashed with.  Recorded in every cache record.
+        self.hash_algorithm = DEFAULT_HASH_ALGORITHM
+
+        #: Where the project lives: the current directory when the maestro was made.  Artifact keys use paths relative
+        #: to it.
+        self.project_root = os.getcwd()
+
         self.builddir = hidden_build_dir
         self.all_targets_file = os.path.join(self.builddir, 'all_targets.yml')
 
+        #: Cache records for every target.  Replaces the old per-target files in {builddir}/cache/.
+        self.state = BuildStateDB(os.path.join(self.builddir, 'state.db'))
+
+        #: Optional cache of target outputs.  See enableArtifactCache().
+        self.artifacts = None
+
+        #: stat() and hash memo shared by all targets.
+        self.fileCache = FileInfoCache(self.hash_algorithm, self.hash_jobs)
+
         # This will get Maestro to delete the listed directories, if they are present during --clean.
         self.other_dirs_to_clean=[]
 
@@ -128,11 +229,27 @@ class BuildMaestro(object):
 
     def build_argparser(self):
         argp = argparse.ArgumentParser()
+        argp.add_argument('--affected-by', type=str, nargs='+', default=None, metavar='FILE', help='List the targets that would be rebuilt if FILE changed, and exit.')
+        argp.add_argument('--artifact-cache', action='store_true', default=False, help='Restore outputs of targets whose inputs match an earlier build instead of rebuilding them.')
+        argp.add_argument('--artifact-cache-size', type=int, default=1024, help='Size limit of the artifact cache, in MiB. (Default: %(default)s)')
+        argp.add_argument('--artifact-cache-strategy', choices=ArtifactCache.STRATEGIES, default='reflink', help='How outputs are restored from the artifact cache.  reflink and hardlink fall back to copy. (Default: %(default)s)')
         argp.add_argument('--clean', action='store_true', default=False, help='Cleans everything.')
+        argp.add_argument('--dry-run', action='store_true', default=False, help='Work out which targets are stale, and why, without building anything.  Prints a JSON object per stale target.')
+        argp.add_argument('--explain', action='store_true', default=False, help='Like --dry-run, but prints every reason for every target, including up-to-date ones.')
+        argp.add_argument('--hash-algorithm', choices=available_hash_algorithms(), default=DEFAULT_HASH_ALGORITHM, help='What to hash files and configs with.  Changing it invalidates every target\'s cache. (Default: %(default)s)')
+        argp.add_argument('--hash-jobs', type=int, default=os.cpu_count() or 1, help='Number of files to hash simultaneously, across all targets. (Default: number of CPUs)')
+        argp.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help='Number of targets to build simultaneously. (Default: number of CPUs)')
         argp.add_argument('--no-colors', action='store_true', default=False, help='Disables colors.')
+        argp.add_argument('--only', type=str, nargs='+', default=None, metavar='TARGET', help='Only build TARGET and whatever it depends on.')
         argp.add_argument('--rebuild', action='store_true', default=False, help='Clean rebuild of project.')
+        argp.add_argument('--remote-cache', type=str, default=None, metavar='URI', help='Share the artifact cache through a directory (local or NFS) or an HTTP server that takes GET and PUT.  Implies --artifact-cache.')
+        argp.add_argument('--remote-cache-read-only', action='store_true', default=False, help='Only fetch from --remote-cache, never upload to it.')
         argp.add_argument('--show-commands', action='store_true', default=False, help='Echoes the line used to execute commands. (echo=True in os_utils.cmd())')
+        argp.add_argument('--timings', type=int, nargs='?', const=10, default=0, metavar='N', help='After building, print the N (default: 10) slowest targets and the critical path.  Timings are always saved to {builddir}/timings.json.')
+        argp.add_argument('--trace', type=str, default=None, metavar='FILE', help='Write a Chrome trace-event JSON file of the build, for chrome://tracing or ui.perfetto.dev.')
         argp.add_argument('--verbose', action='store_true', default=False, help='Show hidden buildsteps.')
+        argp.add_argument('--watch', action='store_true', default=False, help='After building, keep watching source files and rebuild whatever depends on them when they change.')
+        argp.add_argument('--watch-poll', type=float, default=None, metavar='SECONDS', help='With --watch, stat() every file this often instead of using inotify.')
         return argp
 
     def parse_args(self, argp=None, args=None):
@@ -148,15 +265,49 @@ class BuildMaestro(object):
 
         self.show_commands = self.args.show_commands
         self.colors = not self.args.no_colors
+        self.jobs = max(1, self.args.jobs)
+        self.hash_algorithm = self.args.hash_algorithm
+        self.hash_jobs = max(1, self.args.hash_jobs)
+        self.explain = self.args.explain
+        self.report_timings = self.args.timings
+        self.trace_file = self.args.trace
+        self.dry_run = self.args.dry_run or self.explain
+        if self.args.artifact_cache or self.args.remote_cache:
+            remote = backend_from_uri(self.args.remote_cache) if self.args.remote_cache else None
+            self.enableArtifactCache(self.args.artifact_cache_size * 1024 * 1024, self.args.artifact_cache_strategy,
+                                     remote=remote, push=not self.args.remote_cache_read_only)
 
         if self.colors:
             log.enableANSIColors()
 
-        if self.args.rebuild or self.args.clean:
+        if self.args.affected_by:
+            if self._prepare():
+                for bt in self.getAffectedBy(self.args.affected_by):
+                    print(bt.name, flush=True)
+            return
+
+        if (self.args.rebuild or self.args.clean) and not self.dry_run:
             self.clean()
         if self.args.clean:
             return
-        self.run()
+        if self.args.watch:
+            self.watch(poll_interval=self.args.watch_poll)
+        elif self.args.only:
+            self.build_only(self.args.only)
+        else:
+            self.run()
+
+    def enableArtifactCache(self, max_size=1024 * 1024 * 1024, strategy='reflink', remote=None, push=True):
+        '''
+        Keep outputs of BuildTargets with CACHE_ARTIFACTS set in {builddir}/artifacts, and restore them from there
+        instead of rebuilding when their inputs and config match an earlier build.
+
+        :param max_size: Bytes.  The least recently used outputs are thrown out after each run to stay under this.
+        :param strategy: 'copy', 'reflink' or 'hardlink'.
+        :param remote: Optional buildtools.maestro.remote_cache.RemoteCacheBackend to share outputs with other machines.
+        :param push: Upload newly built outputs to remote.
+        '''
+        self.artifacts = ArtifactCache(os.path.join(self.builddir, 'artifacts'), max_size, strategy, remote=remote, push=push)
 
     def clean(self):
         older_files = set()
@@ -169,6 +320,7 @@ class BuildMaestro(object):
         for bt in self.alltargets:
             bt.maestro = self
             bt.clean()
+        self.state.close()
         for xtradir in self.other_dirs_to_clean:
             if os.path.isdir(xtradir):
                 if self.colors:
@@ -196,7 +348,14 @@ class BuildMaestro(object):
     def RecognizeType(cls):
         BuildMaestro.ALL_TYPES[cls.BT_TYPE] = cls
 
-    def saveRules(self, filename):
+    def saveRules(self, filename, binary=False):
+        '''
+        :param binary: Write a binary rules file (see buildtools.maestro.rulesfile) instead of the text format and its
+            .yml twin.  It loads far faster.
+        '''
+        if binary:
+            write_rules(filename, [rule.serialize() for rule in self.alltargets])
+            return
         serialized = {}
         for rule in self.alltargets:
             serialized[rule.name] = rule.serialize()
@@ -220,10 +379,20 @@ class BuildMaestro(object):
                     yaml.dump(target, f)
                 f.write(u'\n')
 
-    def loadRules(self, filename):
-        REGEX_RULEHEADER = re.compile('\[([A-Za-z0-9]+) ([^:]+)\]:(.*)$')
+    def loadRules(self, filename, types=None):
+        '''
+        Replaces every target with those saved by saveRules().
+
+        :param types: With a binary rules file, only load rules with these BT_TYPEs.  The rest aren't even decoded.
+        '''
+        REGEX_RULEHEADER = re.compile(r'\[([A-Za-z0-9_-]+) ([^:]+)\]:(.*)$')
         self.targets = []
         self.alltargets = []
+        if is_rules_file(filename):
+            for data in RulesFile(filename).iterRules(types):
+                self.add(self.newTargetFromRule(data))
+            log.info('Loaded %d rules from %s', len(self.alltargets), filename)
+            return
         with codecs.open(filename, 'r') as f:
             context = {}
             yamlbuf = ''
@@ -244,7 +413,7 @@ class BuildMaestro(object):
                     context = {
                         'type': typeID,
                         'target': ruleKey,
-                        'dependencies': [x.strip() for x in depends.split(',') if x != ''],
+                        'dependencies': [x.strip() for x in depends.split(',') if x.strip() != ''],
                         'files': [],
                         'provides': []
                     }
@@ -261,13 +430,21 @@ class BuildMaestro(object):
     def addFromRules(self, context, yamlbuf):
         # print(repr(yamlbuf))
         if yamlbuf.strip() != '':
-            yml = yaml.full_load(yamlbuf)
+            yml = yaml.load(yamlbuf)
             for k, v in yml.items():
                 context[k] = v
-        cls = self.ALL_TYPES[context['type']]
-        bt = cls()
-        bt.deserialize(context)
-        self.add(bt)
+        self.add(self.newTargetFromRule(context))
+
+    def newTargetFromRule(self, data):
+        '''
+        :param data: BuildTarget.serialize() output.  The type must have been registered with RecognizeType().
+        '''
+        cls = self.ALL_TYPES[data['type']]
+        # Most constructors need arguments that only deserialize() knows about.
+        bt = cls.__new__(cls)
+        BuildTarget.__init__(bt, list(data.get('provides') or [data.get('target')]), name=data.get('name', ''))
+        bt.deserialize(data)
+        return bt
 
     def get_max_label_length(self):
         max_len = 0
@@ -275,7 +452,51 @@ class BuildMaestro(object):
             max_len = max(max_len, len(bt.get_label()))
         return max_len
 
+    def buildProviderIndex(self):
+        '''
+        Maps everything provided by a target to the targets providing it, so nobody has to scan alltargets.
+        '''
+        providers = defaultdict(list)
+        targets = []
+        for bt in self.alltargets:
+            provides = bt.provides()
+            targets += provides
+            for provided in provides:
+                providers[provided].append(bt.ID)
+        # What targets provide may have changed since add(), e.g. CopyFilesTarget's source tree.
+        self.targets = targets
+        self._providersByPath = None
+        for provided, btIDs in providers.items():
+            if len(btIDs) > 1:
+                log.warning('%s has %d providers: %r', provided, len(btIDs), [self.alltargets[x].name for x in btIDs])
+        self.providers = dict(providers)
+        return self.providers
+
+    def findProvider(self, filename):
+        '''
+        :param filename: Absolute path.
+        :returns str: Name of the target that provides filename, or None.
+        '''
+        btIDs = self._getProvidersByPath().get(filename)
+        return self.alltargets[btIDs[-1]].name if btIDs else None
+
+    def findProviderIDs(self, target):
+        '''
+        :param target: Something provided by a target, as given to it, or its absolute path.
+        :returns list: IDs of the targets providing it.  Empty if nothing does.
+        '''
+        if target in self.providers:
+            return self.providers[target]
+        return self._getProvidersByPath().get(os.path.abspath(target), [])
+
+    def _getProvidersByPath(self):
+        if self._providersByPath is None:
+            self._providersByPath = {os.path.abspath(provided): btIDs for provided, btIDs in self.providers.items()}
+        return self._providersByPath
+
     def checkForCycles(self):
+        if not self.providers:
+            self.buildProviderIndex()
         with log.info('Checking for dependency cycles...'):
             # Using Tarjan's Strongly Connected Cycles algorithm
             tg = TarjanGraph()
@@ -287,17 +508,12 @@ class BuildMaestro(object):
                     if not isinstance(depend, str):
                         log.critical('Build target %s has invalid dependency %s.',bt.name,depend)
                         sys.exit(1)
-                    providers=[]
-                    for obt in self.alltargets:
-                        if depend in obt.provides():
-                            #log.info('%s provides %s, which %s needs', obt.name, depend, bt.name)
-                            providers += [obt]
-                    if len(providers) > 1:
-                        log.warning('Build target %s has %d providers for dependency %s: %r',bt.name,len(providers),depend,[x.name for x in providers])
-                    elif len(providers) == 0:
-                        log.critical('Build target %s has no providers for dependency %s: %r',bt.name,depend,[x.name for x in providers])
+                    providers = self.providers.get(depend, [])
+                    if len(providers) == 0:
+                        log.critical('Build target %s has no providers for dependency %s.',bt.name,depend)
                         sys.exit(1)
-                    refs.append(providers[-1].ID)
+                    # Duplicates were already reported by buildProviderIndex().
+                    refs.append(providers[-1])
                 with log.debug('Dependency tree:'):
                     with log.debug('[%s] (%d,[%s])',bt.name,bt.ID,', '.join([str(x) for x in refs])):
                         for refID in refs:
@@ -315,8 +531,14 @@ class BuildMaestro(object):
                     foundCycles=True
             return foundCycles
 
-    def _write_targets(self):
+    def _write_targets(self, merge=False):
+        '''
+        :param merge: Keep what the last run listed, because not every target was built this time.
+        '''
         alltargets = set()
+        if merge and os.path.isfile(self.all_targets_file):
+            with open(self.all_targets_file, 'r', encoding='utf-8') as f:
+                alltargets.update(yaml.load(f) or [])
         for bt in self.alltargets:
             if bt.built:
                 for targetfile in bt.provides():
@@ -325,80 +547,462 @@ class BuildMaestro(object):
         with open(self.all_targets_file, 'w', encoding='utf-8') as f:
             yaml.dump(list(alltargets), f)
 
-    def run(self, verbose=None):
-        if verbose is not None:
-            self.verbose = verbose
+    def _build_worker(self, bt, indent):
+        # Keep the worker's log output nested the same way as the main thread's.
+        log.INDENT = indent
+        with tracing.span(bt.name, 'target', id=bt.ID, type=type(bt).__name__) as args:
+            if self.dry_run:
+                self.explanations[bt.ID] = bt.explain(self.explain)
+            else:
+                bt.try_build()
+            if args is not None:
+                args['dirty'] = bt.dirty
+        return bt
 
-        new_targets=[]
-        for t in self.targets:
-            if t in new_targets:
-                log.warn('Target %s added more than once.', t)
+    def getCriticalPath(self):
+        '''
+        The chain of dependent targets with the most wall time between them, from the last run.  No amount of
+        --jobs will make the build faster than this.
+
+        :returns tuple: (seconds, [BuildTarget, ...] from first to last)
+        '''
+        finish = {}
+        via = {}
+        # Everything a target waited on finished before it did.
+        for ID in self.buildOrder:
+            before = None
+            for upID in self.upstreamOf[ID]:
+                if upID in finish and (before is None or finish[upID] > finish[before]):
+                    before = upID
+            finish[ID] = self.alltargets[ID].timings.get('wall', 0.0) + (finish[before] if before is not None else 0.0)
+            via[ID] = before
+        if not finish:
+            return 0.0, []
+        path = []
+        ID = max(finish, key=finish.get)
+        seconds = finish[ID]
+        while ID is not None:
+            path.append(self.alltargets[ID])
+            ID = via[ID]
+        path.reverse()
+        return seconds, path
+
+    def _write_timings(self, start, end):
+        critical_seconds, critical_path = self.getCriticalPath()
+        data = {
+            'wall': end - start,
+            'jobs': self.jobs,
+            'critical-path': {
+                'seconds': critical_seconds,
+                'targets': [bt.name for bt in critical_path],
+            },
+            'targets': [],
+        }
+        for ID in self.buildOrder:
+            bt = self.alltargets[ID]
+            if not bt.timings:
+                # Skipped; someone else provided everything it does.
+                continue
+            entry = {'target': bt.name, 'dirty': bt.dirty}
+            entry.update({k: v for k, v in bt.timings.items() if k not in ('start', 'end')})
+            entry['start'] = bt.timings['start'] - start
+            entry['end'] = bt.timings['end'] - start
+            data['targets'].append(entry)
+        os_utils.ensureDirExists(self.builddir)
+        with open(os.path.join(self.builddir, 'timings.json'), 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+        if self.report_timings > 0:
+            slowest = sorted(data['targets'], key=lambda entry: entry['wall'], reverse=True)[:self.report_timings]
+            with log.info('Slowest targets:'):
+                for entry in slowest:
+                    log.info('%8.3fs wall %8.3fs cpu %8.3fs stale %8.3fs cache  %s', entry['wall'], entry['cpu'], entry['staleness'], entry['cache-io'], entry['target'])
+            with log.info('Critical path: %.3fs of %.3fs total.', critical_seconds, data['wall']):
+                for bt in critical_path:
+                    log.info('%8.3fs  %s', bt.timings.get('wall', 0.0), bt.name)
+
+    def _report_explanations(self):
+        stale = 0
+        seconds = 0.0
+        for bt in self.alltargets:
+            result = self.explanations.get(bt.ID)
+            if result is None:
+                continue
+            seconds += result['seconds']
+            if result['stale']:
+                stale += 1
+            if result['stale'] or self.explain:
+                print(json.dumps(result), flush=True)
+        log.info('%d of %d targets would be rebuilt.  %.3fs spent deciding.', stale, len(self.explanations), seconds)
+
+    def buildDependencyGraph(self):
+        '''
+        Works out which targets wait on which, from the provider index.  Sets upstreamOf and downstreamOf.
+        '''
+        providers = self.providers
+        self.upstreamOf = [None] * len(self.alltargets)
+        self.downstreamOf = [[] for _ in self.alltargets]
+        for bt in self.alltargets:
+            bt.addImplicitDependencies(providers)
+            upstream = set()
+            for dep in bt.dependencies:
+                upstream.update(providers.get(dep, []))
+            self.upstreamOf[bt.ID] = upstream
+            for upID in upstream:
+                self.downstreamOf[upID].append(bt.ID)
+
+    def getDownstream(self, IDs):
+        '''
+        :returns set: IDs, plus the IDs of everything that depends on them, directly or not.
+        '''
+        return self._closure(IDs, self.downstreamOf)
+
+    def getUpstream(self, IDs):
+        '''
+        :returns set: IDs, plus the IDs of everything they depend on, directly or not.
+        '''
+        return self._closure(IDs, self.upstreamOf)
+
+    @staticmethod
+    def _closure(IDs, edges):
+        found = set(IDs)
+        todo = list(found)
+        while todo:
+            for nextID in edges[todo.pop()]:
+                if nextID not in found:
+                    found.add(nextID)
+                    todo.append(nextID)
+        return found
+
+    def getAffectedBy(self, filenames):
+        '''
+        What would be rebuilt if filenames changed.  Needs buildDependencyGraph().
+
+        :param filenames: Source files, or outputs of other targets.
+        :returns list: BuildTargets, in the order they were added.
+        '''
+        index = self.getSourceIndex()
+        IDs = set()
+        for filename in filenames:
+            path = os.path.abspath(filename)
+            while path not in index and os.path.dirname(path) != path:
+                # A file we've never seen counts as a change to the directory it's in.
+                path = os.path.dirname(path)
+            IDs.update(index.get(path, ()))
+            # Someone's output: everything waiting on its provider.
+            for providerID in self.findProviderIDs(filename):
+                IDs.update(self.downstreamOf[providerID])
+        return [self.alltargets[ID] for ID in sorted(self.getDownstream(IDs))]
+
+    def _run_scheduler(self, selected=None):
+        '''
+        Builds everything in dependency order, keeping up to self.jobs targets in flight.  Needs
+        buildDependencyGraph().
+
+        :param selected: IDs of the targets to build.  Everything else is taken to be up to date.  Default: all.
+        :returns bool: False if the build was halted.
+        '''
+        if selected is None:
+            selected = range(len(self.alltargets))
+        wanted = [False] * len(self.alltargets)
+        for ID in selected:
+            wanted[ID] = True
+        # Count what each target is waiting on.
+        waiting_on = [0] * len(self.alltargets)
+        self.buildOrder = []
+        for bt in self.alltargets:
+            if wanted[bt.ID]:
+                waiting_on[bt.ID] = sum(1 for upID in self.upstreamOf[bt.ID] if wanted[upID])
             else:
-                new_targets.append(t)
+                self.targetsCompleted.update(bt.provides())
 
-        if self.checkForCycles():
-            return
-        keys = []
-        alldeps=[]
-        for target in self.alltargets:
-            keys += target.provides()
-            alldeps += target.dependencies
-            target.built=False
-        alldeps=list(set(alldeps))
+        # Lowest ID first, so -j1 builds in the order targets were added.
+        ready = [bt.ID for bt in self.alltargets if wanted[bt.ID] and waiting_on[bt.ID] == 0]
+        heapq.heapify(ready)
+
+        def mark_completed(bt):
+            self.buildOrder.append(bt.ID)
+            for childID in self.downstreamOf[bt.ID]:
+                if not wanted[childID]:
+                    continue
+                waiting_on[childID] -= 1
+                if waiting_on[childID] == 0:
+                    heapq.heappush(ready, childID)
+
+        running = {}
+        exclusive = False
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix='maestro') as pool:
+            try:
+                while ready or running:
+                    while ready and not failed and not exclusive and len(running) < self.jobs:
+                        bt = self.alltargets[ready[0]]
+                        parallel_safe = bt.is_parallel_safe()
+                        if not parallel_safe and len(running) > 0:
+                            # Wait for everything else to finish first.
+                            break
+                        heapq.heappop(ready)
+                        if self.targetsCompleted.issuperset(bt.provides()):
+                            # Everything it provides was already built by someone else.
+                            mark_completed(bt)
+                            continue
+                        running[pool.submit(self._build_worker, bt, log.INDENT)] = bt
+                        exclusive = not parallel_safe
+                    if len(running) == 0:
+                        break
+                    done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        bt = running.pop(future)
+                        if not bt.is_parallel_safe():
+                            exclusive = False
+                        try:
+                            future.result()
+                        except Exception as e:
+                            failed.append((bt, e))
+                            continue
+                        self.targetsCompleted.update(bt.provides())
+                        if bt.dirty:
+                            # iterChangedFiles() compares absolute paths.
+                            self.targetsDirty.update(os.path.abspath(changed) for changed in bt.getChangedOutputs())
+                        bt.built = True
+                        mark_completed(bt)
+                    # Let whatever is still running finish, but don't start anything new.
+                    if failed and len(running) == 0:
+                        break
+            except KeyboardInterrupt:
+                # Builds already under way can't be stopped, so let them finish before cleaning up after them, or
+                # they'd write their outputs back afterwards.  The rest never started and have nothing to clean.
+                started = {future: bt for future, bt in running.items() if not future.cancel()}
+                wait(started.keys())
+                # A dry run never touches outputs or state.
+                if not self.dry_run:
+                    for bt in started.values():
+                        bt._set_failed()
+                    self._write_targets()
+                log.critical('Cancelled via KeyboardInterrupt.')
+                return False
+        if failed:
+            if not self.dry_run:
+                for bt, e in failed:
+                    bt._set_failed()
+                self._write_targets()
+            log.critical('An exception occurred, build halted.')
+            for bt, e in failed:
+                log.error('%s: %s', bt.name, e, exc_info=(type(e), e, e.__traceback__))
+            return False
+        return True
+
+    def run(self, verbose=None, jobs=None):
+        '''
+        :returns bool: False if the build was halted, None if there was a dependency cycle.
+        '''
+        if verbose is not None:
+            self.verbose = verbose
+        if jobs is not None:
+            self.jobs = max(1, jobs)
+
+        if not self._prepare():
+            return None
         # Redundant
         #for target in self.alltargets:
         #    for reqfile in callLambda(target.files):
         #        if reqfile in keys and reqfile not in target.dependencies:
         #            target.dependencies.append(reqfile)
-        loop = 0
         #progress = tqdm(total=len(self.targets), unit='target', desc='Building', leave=False)
-        self.targetsCompleted = []
-        self.targetsDirty = []
-        while len(self.targets) > len(self.targetsCompleted) and loop < 100:
-            loop += 1
-            for bt in self.alltargets:
-                bt.maestro = self
-                if bt.canBuild(self, keys) and any([target not in self.targetsCompleted for target in bt.provides()]):
-                    try:
-                        bt.try_build()
-                        # progress.update(1)
-                        self.targetsCompleted += bt.provides()
-                        if bt.dirty:
-                            self.targetsDirty += bt.provides()
-                    except Exception as e:
-                        bt._set_failed()
-                        self._write_targets()
-                        log.critical('An exception occurred, build halted.')
-                        log.exception(e)
-                        return
-                    except KeyboardInterrupt:
-                        bt._set_failed()
-                        self._write_targets()
-                        log.critical('Cancelled via KeyboardInterrupt.')
-                        return
-                    bt.built=True
-            log.debug('%d > %d, loop = %d',len(self.targets), len(self.targetsCompleted), loop)
-        log.debug('%d > %d, loop = %d',len(self.targets), len(self.targetsCompleted), loop)
+        return self._build()
+
+    def build_only(self, targets):
+        '''
+        Build just the given targets and whatever they need, directly or not.
+
+        :param targets: Files or names provided by targets, as passed to add(), or absolute paths to them.
+        :returns bool: Same as run().  False if something in targets isn't provided by anything.
+        '''
+        if not self._prepare():
+            return None
+        IDs = set()
+        for target in targets:
+            found = self.findProviderIDs(target)
+            if not found:
+                log.critical('Nothing provides %s.', target)
+                return False
+            IDs.update(found)
+        selected = self.getUpstream(IDs)
+        log.info('Building %d of %d targets.', len(selected), len(self.alltargets))
+        return self._build(selected)
+
+    def _prepare(self):
+        '''
+        Sets up the provider index and dependency graph for a run.
+
+        :returns bool: False if there's a dependency cycle.
+        '''
+        for target in self.alltargets:
+            target.resetMemos()
+        self.buildProviderIndex()
+        if self.checkForCycles():
+            return False
+        for target in self.alltargets:
+            target.maestro = self
+            target.built=False
+            target.dirty=False
+        self.buildDependencyGraph()
+        # Files may have changed since the last run() in this process.
+        self.fileCache.algorithm = self.hash_algorithm
+        self.fileCache.jobs = self.hash_jobs
+        self.fileCache.clear()
+        return True
+
+    def _build(self, selected=None):
+        '''
+        Schedules selected (target IDs, default: all) and does the bookkeeping after.  The graph must already be set
+        up by run().
+
+        :returns bool: False if the build was halted.
+        '''
+        self.targetsCompleted = set()
+        self.targetsDirty = set()
+        self.explanations = {}
+        for target in self.alltargets:
+            target.timings = {}
+        if self.trace_file:
+            tracing.start()
+        start = time.perf_counter()
+        try:
+            completed = self._run_scheduler(selected)
+        finally:
+            self.fileCache.shutdown()
+            if not self.dry_run:
+                # Even if we halted, whatever did get built shouldn't be rebuilt next time.
+                with tracing.span('flush', 'cache-io'):
+                    self.state.flush()
+            if self.trace_file:
+                tracing.stop().write(self.trace_file)
+                log.info('Wrote trace to %s.', self.trace_file)
+        if not completed:
+            return False
+        if self.dry_run:
+            self._report_explanations()
+            return True
+        self._write_timings(start, time.perf_counter())
         # progress.close()
-        self._write_targets()
-        if loop >= 100:
-            incompleteTargets=[t for t in self.targets if t not in self.targetsCompleted]
-            if len(incompleteTargets)>0:
-                with log.critical("Failed to resolve dependencies.  The following targets are left unresolved. Exiting."):
-                    for t in incompleteTargets:
-                        log.critical(t)
-            orphanDeps=[t for t in alldeps if t not in self.targets]
+        self._write_targets(merge=selected is not None)
+        incompleteTargets=[t for t in self.targets if t not in self.targetsCompleted]
+        if len(incompleteTargets)>0:
+            with log.critical("Failed to resolve dependencies.  The following targets are left unresolved. Exiting."):
+                for t in incompleteTargets:
+                    log.critical(t)
+            alldeps = set()
+            for target in self.alltargets:
+                alldeps.update(target.dependencies)
+            orphanDeps=[t for t in alldeps if t not in self.providers]
             if len(orphanDeps)>0:
                 with log.critical("Failed to resolve dependencies.  The following dependencies are orphaned. Exiting."):
                     for t in orphanDeps:
                         log.critical(t)
             #sys.exit(1)
         with log.info('Cleaning up...'):
-            cachefiles = []
-            for bt in self.alltargets:
-                cachefiles.append(os.path.basename(bt.getCacheFile()))
-            for filename in os.listdir(os.path.join(self.builddir, 'cache')):
-                if filename not in cachefiles:
-                    filename = os.path.join(self.builddir, 'cache', filename)
-                    log.debug('<red>RM</red> %s', filename)
-                    os.remove(filename)
+            log.debug('File cache: %d/%d stat hits, %d/%d hash hits.',
+                      self.fileCache.stat_hits, self.fileCache.stat_hits + self.fileCache.stat_misses,
+                      self.fileCache.hash_hits, self.fileCache.hash_hits + self.fileCache.hash_misses)
+            if self.artifacts is not None:
+                log.debug('Artifact cache: %d hits, %d misses, %d stored.', self.artifacts.hits, self.artifacts.misses, self.artifacts.stores)
+                if self.artifacts.remote is not None:
+                    log.debug('Remote artifact cache: %d hits, %d misses, %d uploaded.', self.artifacts.remote_hits, self.artifacts.remote_misses, self.artifacts.remote_stores)
+                if self.artifacts.stores > 0:
+                    removed, freed = self.artifacts.evict()
+                    if removed > 0:
+                        log.debug('Evicted %d artifact cache entries (%s).', removed, os_utils.sizeof_fmt(freed))
+            pruned = self.state.prune([bt.name for bt in self.alltargets])
+            if pruned > 0:
+                log.debug('Removed %d stale cache records.', pruned)
+            legacy_cache_dir = os.path.join(self.builddir, 'cache')
+            if os.path.isdir(legacy_cache_dir):
+                # Everything still relevant was migrated into self.state by BuildTarget.readCache().
+                log.debug('<red>RMTREE</red> %s', legacy_cache_dir)
+                shutil.rmtree(legacy_cache_dir, ignore_errors=True)
+        return True
+
+    def getSourceIndex(self):
+        '''
+        Reverse index of source files, for watch() and getAffectedBy().  Outputs of other targets aren't in it: the dependency graph
+        already covers them.
+
+        Built from each target's getInputFiles().  Directories are in it along with everything under them, so files
+        added to them are noticed too.
+
+        :returns dict: Absolute path -> set of IDs of the targets that read it.
+        '''
+        index = defaultdict(set)
+        for bt in self.alltargets:
+            for filename in bt.getInputFiles():
+                if filename in self.providers:
+                    continue
+                path = os.path.abspath(filename)
+                if self.findProvider(path) is not None:
+                    continue
+                index[path].add(bt.ID)
+                if os.path.isdir(path):
+                    dirs, files = os_utils.scan_tree(path, stat=False)
+                    for relpath in itertools.chain(dirs, files):
+                        subpath = os.path.join(path, relpath)
+                        if self.findProvider(subpath) is None:
+                            index[subpath].add(bt.ID)
+        return dict(index)
+
+    def watch(self, poll_interval=None, debounce=0.05):
+        '''
+        Build everything, then keep the graph loaded and rebuild whatever depends on each source file that changes,
+        until interrupted.
+
+        :param poll_interval: Poll with stat() this often, in seconds, instead of using inotify.
+        :param debounce: Seconds to wait for more changes before rebuilding, so a save or checkout touching several
+            files only rebuilds once.
+        '''
+        if self.run() is None:
+            return
+        index = self.getSourceIndex()
+        watcher = new_watcher(poll_interval)
+        watcher.setPaths(index)
+        log.info('Watching %d files.  Press Ctrl+C to stop.', len(index))
+        try:
+            while True:
+                changed = watcher.wait()
+                while True:
+                    more = watcher.wait(debounce)
+                    if not more:
+                        break
+                    changed |= more
+                affected = set()
+                for path in changed:
+                    affected.update(index.get(path, ()))
+                if not affected:
+                    continue
+                start = time.perf_counter()
+                self.fileCache.invalidate(changed)
+                selected = self.getDownstream(affected)
+                regraph = False
+                for ID in selected:
+                    bt = self.alltargets[ID]
+                    provided = bt.provides()
+                    bt.resetMemos()
+                    bt.built = False
+                    bt.dirty = False
+                    regraph = regraph or bt.provides() != provided
+                if regraph:
+                    # Someone's outputs changed, so the graph may have too.
+                    self.buildProviderIndex()
+                    if self.checkForCycles():
+                        return
+                    self.buildDependencyGraph()
+                    selected = self.getDownstream(affected)
+                with log.info('%d file(s) changed, checking %d target(s)...', len(changed), len(selected)):
+                    self._build(selected)
+                log.info('Finished in %.3fs.  Watching for changes...', time.perf_counter() - start)
+                # Targets may have picked up new input files.
+                index = self.getSourceIndex()
+                watcher.setPaths(index)
+        except KeyboardInterrupt:
+            log.info('Stopped watching.')
+        finally:
+            watcher.close()
@@ -0,0 +1,279 @@
+'''
+Content-addressed cache of build outputs.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+
+from buildtools import os_utils, utils
+from buildtools.bt_logging import log
+
+
+class ArtifactCache(object):
+    '''
+    Keeps copies of target outputs, keyed by BuildTarget.getArtifactKey(), so a target whose inputs and config match an
+    earlier build gets its outputs put back instead of being rebuilt.
+
+    Layout: {root}/{key[:2]}/{key}/ holds manifest.json and one file per output, named by its index in the manifest.
+    The manifest's mtime is bumped on every hit, and evict() throws out the least recently used entries first.
+
+    If a remote backend (see buildtools.maestro.remote_cache) is given, it's a second tier: local misses are looked
+    up there, and new entries are pushed there as uncompressed tarballs of the entry directory.  Their manifests record
+    the SHA-256 of every file, and everything fetched from a remote is checked against it before it's used.
+    '''
+
+    MANIFEST = 'manifest.json'
+    STRATEGIES = ('copy', 'reflink', 'hardlink')
+
+    def __init__(self, root: str, max_size: int = 1024 * 1024 * 1024, strategy: str = 'reflink', remote=None, push: bool = True):
+        '''
+        :param root: Directory to keep everything in.  Created on demand.
+        :param max_size: evict() trims the cache to this many bytes.
+        :param strategy: How outputs are restored.  One of STRATEGIES; reflink and hardlink fall back to copy.
+        :param remote: Optional RemoteCacheBackend.
+        :param push: Upload new entries to remote.  Turn off for machines that should only read from it.
+        '''
+        if strategy not in self.STRATEGIES:
+            raise ValueError('Unknown artifact cache strategy {!r}.'.format(strategy))
+        self.root = root
+        self.max_size = max_size
+        self.strategy = strategy
+        self.remote = remote
+        self.push = push
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.remote_hits = 0
+        self.remote_misses = 0
+        self.remote_stores = 0
+
+    def _getEntryDir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def restore(self, key: str, filenames) -> bool:
+        '''
+        Puts the outputs stored under key back at filenames.
+
+        :returns bool: False if there was nothing to restore, in which case the caller should build as usual.
+        '''
+        entry = self._getEntryDir(key)
+        manifest_file = os.path.join(entry, self.MANIFEST)
+        manifest = self._readManifest(manifest_file)
+        if manifest is None and self.remote is not None and self._pull(key):
+            manifest = self._readManifest(manifest_file)
+        if manifest is None or manifest.get('files') != list(filenames):
+            with self._lock:
+                self.misses += 1
+            return False
+        try:
+            for i, filename in enumerate(filenames):
+                dirname = os.path.dirname(filename)
+                if dirname != '':
+                    os.makedirs(dirname, exist_ok=True)
+                os_utils.clone_file(os.path.join(entry, str(i)), filename, self.strategy)
+            os.utime(manifest_file)
+        except OSError as e:
+            log.warning('Failed to restore %s from the artifact cache: %s', key, e)
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def _readManifest(self, manifest_file):
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key: str, filenames) -> bool:
+        '''
+        Copies filenames into the cache under key.  Skipped if any of them isn't a regular file.
+        '''
+        filenames = list(filenames)
+        if not all(os.path.isfile(filename) for filename in filenames):
+            return False
+        entry = self._getEntryDir(key)
+        if os.path.isdir(entry):
+            return True
+        # Build the entry somewhere private, then move it into place in one go so readers never see half of it.
+        tmpdir = os.path.join(self.root, 'tmp', '{}.{}.{}'.format(key, os.getpid(), threading.get_ident()))
+        try:
+            os.makedirs(tmpdir, exist_ok=True)
+            size = 0
+            digests = []
+            for i, filename in enumerate(filenames):
+                blob = os.path.join(tmpdir, str(i))
+                # Never hardlink on the way in: the target may well rewrite its outputs in place next time.
+                os_utils.clone_file(filename, blob, 'copy' if self.strategy == 'copy' else 'reflink')
+                size += os.path.getsize(blob)
+                if self.remote is not None:
+                    # Only there to check remote transfers with, so purely local caches don't read every output twice.
+                    digests.append(utils.sha256sum(blob))
+            manifest = {'files': filenames, 'size': size}
+            if self.remote is not None:
+                manifest['sha256'] = digests
+            with open(os.path.join(tmpdir, self.MANIFEST), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            os.rename(tmpdir, entry)
+        except OSError as e:
+            # Most likely someone else stored the same key first.
+            if not os.path.isdir(entry):
+                log.warning('Failed to store %s in the artifact cache: %s', key, e)
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            return os.path.isdir(entry)
+        with self._lock:
+            self.stores += 1
+        if self.remote is not None and self.push:
+            self._push(key)
+        return True
+
+    def _push(self, key: str) -> None:
+        entry = self._getEntryDir(key)
+        try:
+            with tempfile.TemporaryFile() as f:
+                with tarfile.open(fileobj=f, mode='w') as tar:
+                    # Manifest first, so a reader can bail out early.
+                    names = [self.MANIFEST] + sorted((name for name in os.listdir(entry) if name != self.MANIFEST), key=int)
+                    for name in names:
+                        tar.add(os.path.join(entry, name), arcname=name, recursive=False)
+                f.seek(0)
+                self.remote.put(key, f)
+        except Exception as e:
+            # The build itself is fine; the rest of the team just won't get this one.
+            log.warning('Failed to upload %s to the remote artifact cache: %s', key, e)
+            return
+        with self._lock:
+            self.remote_stores += 1
+
+    def _pull(self, key: str) -> bool:
+        '''
+        Fetches key from the remote, verifies it, and adds it to the local cache.
+        '''
+        entry = self._getEntryDir(key)
+        tmpdir = os.path.join(self.root, 'tmp', '{}.{}.{}.remote'.format(key, os.getpid(), threading.get_ident()))
+        try:
+            with tempfile.TemporaryFile() as f:
+                if not self.remote.get(key, f):
+                    with self._lock:
+                        self.remote_misses += 1
+                    return False
+                f.seek(0)
+                os.makedirs(tmpdir, exist_ok=True)
+                self._unpack(f, tmpdir)
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            os.rename(tmpdir, entry)
+        except Exception as e:
+            if not os.path.isdir(entry):
+                log.warning('Failed to fetch %s from the remote artifact cache: %s', key, e)
+                with self._lock:
+                    self.remote_misses += 1
+                return False
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        with self._lock:
+            self.remote_hits += 1
+        return True
+
+    def _unpack(self, f, tmpdir: str) -> None:
+        '''
+        Extracts an entry tarball into tmpdir, refusing anything that isn't exactly what _push() would have made, then
+        checks every file against the manifest.  Raises ValueError if anything is off.
+        '''
+        with tarfile.open(fileobj=f, mode='r:') as tar:
+            members = tar.getmembers()
+            if len(members) == 0 or members[0].name != self.MANIFEST:
+                raise ValueError('manifest missing')
+            for member in members:
+                if not member.isreg() or (member.name != self.MANIFEST and not member.name.isdigit()):
+                    raise ValueError('unexpected member {!r}'.format(member.name))
+                with tar.extractfile(member) as src, open(os.path.join(tmpdir, member.name), 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.chmod(os.path.join(tmpdir, member.name), member.mode & 0o777)
+        manifest = self._readManifest(os.path.join(tmpdir, self.MANIFEST))
+        if manifest is None or len(manifest.get('sha256', [])) != len(manifest.get('files', [])):
+            raise ValueError('bad manifest')
+        for i, digest in enumerate(manifest['sha256']):
+            blob = os.path.join(tmpdir, str(i))
+            if not os.path.isfile(blob) or utils.sha256sum(blob) != digest:
+                raise ValueError('file {} failed verification'.format(i))
+
+    def detach(self, filenames):
+        '''
+        Gives each of filenames its own inode again, if it was hardlinked out of the cache, so writing to it can't
+        change what's stored.
+        '''
+        if self.strategy != 'hardlink':
+            return
+        for filename in filenames:
+            try:
+                if os.stat(filename).st_nlink < 2:
+                    continue
+            except OSError:
+                continue
+            tmpfile = filename + '.detach'
+            os_utils.clone_file(filename, tmpfile, 'copy')
+            os.replace(tmpfile, filename)
+
+    def evict(self):
+        '''
+        Removes least recently used entries until the cache is no bigger than max_size.
+
+        :returns tuple: (entries removed, bytes freed)
+        '''
+        entries = []
+        total = 0
+        if not os.path.isdir(self.root):
+            return 0, 0
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir() or len(prefix.name) != 2:
+                continue
+            for entry in os.scandir(prefix.path):
+                manifest_file = os.path.join(entry.path, self.MANIFEST)
+                try:
+                    mtime = os.stat(manifest_file).st_mtime_ns
+                    with open(manifest_file, 'r', encoding='utf-8') as f:
+                        size = json.load(f)['size']
+                except (OSError, ValueError, KeyError):
+                    # Half-written or damaged.  Get rid of it first.
+                    mtime, size = 0, 0
+                entries.append((mtime, size, entry.path))
+                total += size
+        removed = freed = 0
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size and mtime != 0:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+            freed += size
+        return removed, freed
@@ -22,18 +22,26 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 
 '''
+import contextlib
 import hashlib
+import json
 import os
+import sys
+import threading
+import time
 
 from pathlib import Path
 
 from ruamel.yaml import YAML
 from ruamel.yaml.compat import StringIO
 yaml = YAML(typ='safe', pure=True)
+# YAML instances keep emitter/parser state, so targets building on different threads need to take turns.
+yaml_lock = threading.RLock()
 
-from buildtools import os_utils, utils
+from buildtools import os_utils, tracing, utils
 from buildtools.bt_logging import log
-from buildtools.maestro.utils import callLambda
+from buildtools.maestro.filecache import FileInfoCache
+from buildtools.maestro.utils import callLambda, hashConfig
 
 
 class BuildTarget(object):
@@ -46,6 +54,16 @@ class BuildTarget(object):
 
     CHECK_MTIMES = True
     CHECK_HASHES = True
+    #: Skip the mtime and hash checks for files whose (size, mtime_ns, inode, ctime_ns) haven't changed since the last build.
+    CHECK_STATS = True
+
+    #: Set to False for targets that change process-wide state (cwd, environment) while building.
+    #: BuildMaestro will never run these alongside other targets when --jobs > 1.
+    PARALLEL_SAFE = True
+
+    #: Set to True for targets whose outputs depend on nothing but their input files and get_config(), so
+    #: BuildMaestro.artifacts can restore them instead of rebuilding.
+    CACHE_ARTIFACTS = False
 
     def __init__(self, targets=None, files=[], dependencies=[], provides=[], name=''):
         self._all_provides = targets if isinstance(targets, list) else [targets]+provides
@@ -55,7 +73,8 @@ class BuildTarget(object):
         except ValueError:
             self.name = self._all_provides[0] if name == '' else name
         self.files = files
-        self.dependencies = dependencies
+        # Copied, since addImplicitDependencies() appends to it and subclasses love mutable default args.
+        self.dependencies = list(dependencies)
 
         self.maestro = None
 
@@ -71,15 +90,114 @@ class BuildTarget(object):
         self.lastTargetHash=''
         self.lastFileTimes={}
         self.lastFileHashes={}
+        self.lastFileStats={}
         self.lastConfig={}
 
+        #: Seconds spent in the last try_build(): wall, cpu (this thread only, so not subprocesses), staleness,
+        #: cache-io, build, plus start and end (time.perf_counter()).
+        self.timings = {}
+
+        # (hash algorithm, getConfigHash()), until resetMemos().
+        self._configHash=None
+        # provides(), until resetMemos() or invalidateProvides().
+        self._provides=None
+
+    def resetMemos(self):
+        '''
+        Forget values computed once per run.  BuildMaestro.run() calls this on every target before it starts; call it
+        yourself if you change a target's configuration during a run.
+        '''
+        self._configHash=None
+        self._provides=None
+
+    @contextlib.contextmanager
+    def timePhase(self, phase):
+        '''
+        Adds the time spent in the with block to self.timings[phase], and records it as a span when tracing.
+        '''
+        start = time.perf_counter()
+        try:
+            with tracing.span(phase, 'phase'):
+                yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0.0) + time.perf_counter() - start
+
     def try_build(self):
+        self.timings = {'staleness': 0.0, 'cache-io': 0.0, 'build': 0.0}
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            self.files = callLambda(self.files)
+            with self.timePhase('cache-io'):
+                self.readCache()
+            self.dirty = False
+            with self.timePhase('staleness'):
+                stale = self.is_stale()
+            if stale:
+                with self.logStart():
+                    artifacts = self.maestro.artifacts if self.CACHE_ARTIFACTS else None
+                    with self.timePhase('cache-io'):
+                        key = self.getArtifactKey() if artifacts is not None else None
+                        restored = key is not None and artifacts.restore(key, self.provides())
+                    if restored:
+                        log.debug('%s: Restored from the artifact cache.', self.name)
+                    else:
+                        if artifacts is not None:
+                            artifacts.detach(self.provides())
+                        with self.timePhase('build'):
+                            self.build()
+                        if key is not None:
+                            with self.timePhase('cache-io'):
+                                artifacts.store(key, self.provides())
+                    # Our outputs just changed under the shared stat/hash memo.
+                    self.maestro.fileCache.invalidate(self.provides() if restored else self.getChangedOutputs())
+                    with self.timePhase('cache-io'):
+                        self.writeCache()
+                    self.dirty = True
+        finally:
+            end = time.perf_counter()
+            self.timings.update(wall=end - start, cpu=time.thread_time() - cpu_start, start=start, end=end)
+
+    def getChangedOutputs(self):
+        '''
+        What the last build() changed, so BuildMaestro only dirties those for downstream targets.  Override this if
+        build() only touches some of provides().
+
+        :returns list: Filenames, which may include files build() deleted.  Default: provides().
+        '''
+        return self.provides()
+
+    def explain(self, all_reasons=False):
+        '''
+        Works out whether this target is stale, and why, without building it.  Used by --dry-run and --explain.
+
+        Targets that override is_stale() can't be asked without side effects (network requests, state files), so they
+        are assumed stale with reason "custom".
+
+        :param all_reasons: Keep going after the first reason.  Costs more hashing.
+        :returns dict: {'target': name, 'stale': bool, 'reasons': [iterStaleReasons() entries], 'seconds': float}
+        '''
+        start = time.perf_counter()
         self.files = callLambda(self.files)
         self.readCache()
-        if self.is_stale():
-            with self.logStart():
-                self.build()
-                self.writeCache()
+        reasons = []
+        if type(self).is_stale is not BuildTarget.is_stale:
+            reasons.append({'reason': 'custom'})
+        else:
+            for reason in self.iterStaleReasons():
+                if reason.get('change') == 'dirty':
+                    reason['by'] = self.maestro.findProvider(reason['file'])
+                reasons.append(reason)
+                if not all_reasons:
+                    break
+        # So BuildMaestro propagates it downstream as if we'd been built.
+        self.dirty = len(reasons) > 0
+        return {
+            'target': self.name,
+            'stale': self.dirty,
+            'reasons': reasons,
+            'seconds': round(time.perf_counter() - start, 6),
+        }
 
     def clean(self):
         with log.info('Cleaning %s...', self.name):
@@ -102,29 +220,69 @@ class BuildTarget(object):
     def get_config(self):
         return {}
 
+    def is_parallel_safe(self):
+        return self.PARALLEL_SAFE
+
     def should_echo_commands(self):
         return self.maestro.show_commands or self.show_commands
 
     def is_stale(self):
+        for _ in self.iterStaleReasons():
+            return True
+        return False
+
+    def iterStaleReasons(self):
+        '''
+        Yields a dict for each reason this target needs rebuilding, cheapest checks first, stopping as soon as the
+        caller does.  Override this rather than is_stale() so --explain can see your reasons.
+
+        'reason' is one of:
+            always: The target rebuilds every time.
+            no-cache: Never built, or its cache record is from an older version or hash algorithm.
+            target-hash: provides() changed.
+            config-hash: get_config() changed.
+            file: 'file' changed; 'change' is one of iterChangedFiles()'s reasons.
+        '''
         if self.lastTargetHash == '':
             self.readCache()
+        if self.lastTargetHash == '':
+            log.debug('[is stale] No cache')
+            yield {'reason': 'no-cache'}
+            return
         if self.getTargetHash() != self.lastTargetHash:
             with log.debug('[is stale] Target hash changed'):
                 log.debug('self.getTargetHash(): %r', self.getTargetHash())
                 log.debug('self.lastTargetHash:  %r', self.lastTargetHash)
-            return True
+            yield {'reason': 'target-hash'}
         if self.getConfigHash() != self.lastConfigHash:
             log.debug('[is stale] Config hash changed')
-            return True
-        if self.haveFilesChanged(): #self.checkMTimes(self.files+self.dependencies, self.provides(), config=self.get_config())
-            return True
-        return False
+            yield {'reason': 'config-hash'}
+        for filename, change in self.iterChangedFiles():
+            yield {'reason': 'file', 'file': filename, 'change': change}
 
     def build(self):
         pass
 
+    def calcProvides(self):
+        '''
+        Everything this target builds.  Override this rather than provides(), which caches the result.
+        '''
+        return self._all_provides
+
     def provides(self):
-        return list(set(self._all_provides))
+        '''
+        :returns tuple: calcProvides() without duplicates, in order.  Computed once per run.
+        '''
+        if self._provides is None:
+            self._provides = tuple(dict.fromkeys(self.calcProvides()))
+        return self._provides
+
+    def invalidateProvides(self):
+        '''
+        Makes the next provides() call ask calcProvides() again.  For targets whose outputs are only known once
+        build() has run.
+        '''
+        self._provides=None
 
     def get_label(self):
         return self.BT_LABEL or self.BT_TYPE.upper() or type(self).__class__.__name__
@@ -161,25 +319,81 @@ class BuildTarget(object):
             'name': self.name,
             'files': callLambda(self.files),
             'dependencies': self.dependencies,
-            'provides': self.provides(),
+            'provides': list(self.provides()),
             'show_commands': self.show_commands
         }
 
     def getFilesToCompare(self):
-        return [os.path.abspath(__file__)]+callLambda(self.files)+self.provides()+self.dependencies
+        return [os.path.abspath(__file__)]+callLambda(self.files)+list(self.provides())+self.dependencies
+
+    def getInputFiles(self):
+        '''
+        Every file and directory this target reads, for BuildMaestro.getSourceIndex().  Directories get expanded there.
+        '''
+        return callLambda(self.files)+self.getFilesToCompare()+self.dependencies
 
-    def serialize_file_times(self):
-        file_mtimes={}
+    def statFile(self, filename):
+        '''
+        :param filename: Absolute path.
+        :returns os.stat_result: None if filename isn't a regular file.
+        '''
+        return self.maestro.fileCache.stat(filename)
+
+    @staticmethod
+    def getFileSignature(st):
+        return FileInfoCache.getSignature(st)
+
+    def stat_files_to_compare(self):
+        '''
+        :returns dict: abspath -> os.stat_result, for every file in getFilesToCompare() that exists.
+        '''
+        file_stats={}
         for filename in self.getFilesToCompare():
-            if os.path.isfile(filename):
-                file_mtimes[os.path.abspath(filename)]=os.path.getmtime(filename)
-        return file_mtimes
+            filename = os.path.abspath(filename)
+            if filename not in file_stats:
+                st = self.statFile(filename)
+                if st is not None:
+                    file_stats[filename]=st
+        return file_stats
+
+    def hashFile(self, filename, signature):
+        '''
+        Hashes filename, unless anyone already hashed it while it had the same stat signature.
+        '''
+        return self.maestro.fileCache.hash(filename, signature)
+
+    def hashFiles(self, files):
+        '''
+        hashFile() for a list of (filename, signature) pairs, done in parallel on BuildMaestro.fileCache's pool.
+
+        :returns dict: filename -> hash
+        '''
+        return self.maestro.fileCache.hashMany(files)
+
+    def serialize_file_times(self, file_stats=None):
+        if file_stats is None:
+            file_stats = self.stat_files_to_compare()
+        return {filename: st.st_mtime for filename, st in file_stats.items()}
 
-    def serialize_file_hashes(self):
+    def serialize_file_stats(self, file_stats=None):
+        if file_stats is None:
+            file_stats = self.stat_files_to_compare()
+        return {filename: self.getFileSignature(st) for filename, st in file_stats.items()}
+
+    def serialize_file_hashes(self, file_stats=None):
+        if file_stats is None:
+            file_stats = self.stat_files_to_compare()
         file_hashes={}
-        for filename in self.getFilesToCompare():
-            if os.path.isfile(filename):
-                file_hashes[os.path.abspath(filename)]=utils.hashfile(filename, hashlib.md5())
+        tohash=[]
+        for filename, st in file_stats.items():
+            signature = self.getFileSignature(st)
+            if self.CHECK_STATS and filename in self.lastFileHashes and self.lastFileStats.get(filename) == signature:
+                # Untouched since we last hashed it.
+                file_hashes[filename]=self.lastFileHashes[filename]
+            else:
+                file_hashes[filename]=None
+                tohash.append((filename, signature))
+        file_hashes.update(self.hashFiles(tohash))
         return file_hashes
 
     def genVirtualTarget(self, vid=None):
@@ -188,118 +402,214 @@ class BuildTarget(object):
         return os.path.join('.build', 'tmp', 'virtual-targets', vid)
 
     def deserialize(self, data):
-        self.target = data['target']
+        # The text rules format calls it 'target', serialize() calls it 'name'.
+        self.name = data.get('name', data.get('target'))
+        self.target = data.get('target', self.name)
         self.files = data.get('files', [])
         self.dependencies = data.get('dependencies', [])
         self._all_provides = data.get('provides', [])
+        self._provides = None
+        self.show_commands = data.get('show_commands', False)
 
     def getCacheFile(self):
+        '''
+        Where this target's cache lived before BuildMaestro.state.  Only read to migrate old caches.
+        '''
         filename = hashlib.md5(self.name.encode('utf-8')).hexdigest()+'.yml'
         return os.path.join(self.maestro.builddir, 'cache', filename)
 
+    def getHashAlgorithm(self):
+        # Subclasses call genVirtualTarget() before BuildTarget.__init__(), so self.maestro may not exist yet.
+        maestro = getattr(self, 'maestro', None)
+        return maestro.hash_algorithm if maestro is not None else utils.DEFAULT_HASH_ALGORITHM
+
+    def newHasher(self):
+        return utils.new_hasher(self.getHashAlgorithm())
+
     def getConfigHash(self):
-        s = StringIO()
-        yaml.dump(self.get_config(), s)
-        return hashlib.md5(s.getvalue().encode('utf-8')).hexdigest()
+        algorithm = self.getHashAlgorithm()
+        memo = getattr(self, '_configHash', None)
+        if memo is None or memo[0] != algorithm:
+            self._configHash = (algorithm, hashConfig(self.get_config(), utils.new_hasher(algorithm)))
+        return self._configHash[1]
 
     def getTargetHash(self):
-        return hashlib.md5(';'.join(self.provides()).encode('utf-8')).hexdigest()
+        hasher = self.newHasher()
+        hasher.update(';'.join(self.provides()).encode('utf-8'))
+        return hasher.hexdigest()
+
+    def getArtifactKey(self):
+        '''
+        Hash of everything that decides what build() produces: our type, get_config(), what we provide, and the
+        contents of every input in getFilesToCompare().
+
+        Paths are made relative to BuildMaestro.project_root, and the modules our class is defined in go by module
+        name, so checkouts in different places (and different installs of buildtools) share keys.
+        '''
+        provides = [os.path.abspath(filename) for filename in self.provides()]
+        modules = {}
+        for cls in type(self).__mro__:
+            module_file = getattr(sys.modules.get(cls.__module__), '__file__', None)
+            if module_file is not None:
+                modules.setdefault(os.path.abspath(module_file), cls.__module__)
+        inputs = {}
+        tohash = []
+        for filename in self.getFilesToCompare():
+            filename = os.path.abspath(filename)
+            if filename in inputs or filename in provides:
+                continue
+            # Dependencies that aren't files (target names, virtual targets) stay None.
+            inputs[filename] = None
+            st = self.statFile(filename)
+            if st is not None:
+                tohash.append((filename, self.getFileSignature(st)))
+        inputs.update(self.hashFiles(tohash))
+        hasher = self.newHasher()
+        hasher.update(json.dumps([
+            '{}.{}'.format(type(self).__module__, type(self).__qualname__),
+            self.getConfigHash(),
+            [self.getPortablePath(filename) for filename in provides],
+            sorted((modules.get(filename) or self.getPortablePath(filename), digest) for filename, digest in inputs.items()),
+        ]).encode('utf-8'))
+        return hasher.hexdigest()
+
+    def getPortablePath(self, filename):
+        '''
+        :returns str: filename relative to BuildMaestro.project_root, with / separators, or absolute if it's outside.
+        '''
+        filename = os.path.abspath(filename)
+        root = self.maestro.project_root
+        try:
+            relpath = os.path.relpath(filename, root)
+        except ValueError:
+            # Another drive.
+            return filename
+        if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+            return filename
+        return relpath.replace(os.sep, '/')
 
     def writeCache(self):
-        configHash = self.getConfigHash()
-        targetHash = self.getTargetHash()
-        os_utils.ensureDirExists(os.path.dirname(self.getCacheFile()))
-        with open(self.getCacheFile(), 'w') as f:
-            yaml.dump_all([self.CACHE_VER, configHash, targetHash, self.serialize_file_times(), self.serialize_file_hashes(), self.get_config()], f)
+        file_stats = self.stat_files_to_compare()
+        self.maestro.state.put(self.name, {
+            'version':     self.CACHE_VER,
+            'hash-algorithm': self.getHashAlgorithm(),
+            'config-hash': self.getConfigHash(),
+            'target-hash': self.getTargetHash(),
+            'file-times':  self.serialize_file_times(file_stats),
+            'file-stats':  self.serialize_file_stats(file_stats),
+            'file-hashes': self.serialize_file_hashes(file_stats),
+            'config':      self.get_config(),
+        })
+
+    def readLegacyCache(self):
+        '''
+        Reads the one-YAML-file-per-target cache used before BuildMaestro.state, if present.
+        '''
+        if not os.path.isfile(self.getCacheFile()):
+            return None
+        try:
+            with open(self.getCacheFile(), 'r') as f, yaml_lock:
+                cachedata = list(yaml.load_all(f))
+            if len(cachedata)==6:
+                _V, _CH, _TH, _LFT, _LFH, _CFG = cachedata
+                return {
+                    'version':     _V,
+                    'config-hash': _CH,
+                    'target-hash': _TH,
+                    'file-times':  _LFT,
+                    'file-hashes': _LFH,
+                    'config':      _CFG,
+                }
+        except Exception as e:
+            log.exception(e)
+        return None
 
     def readCache(self):
         self.lastConfigHash=''
         self.lastTargetHash=''
         self.lastFileTimes={}
         self.lastFileHashes={}
+        self.lastFileStats={}
         self.lastConfig={}
-        if os.path.isfile(self.getCacheFile()):
-            try:
-                with open(self.getCacheFile(), 'r') as f:
-                    cachedata = list(yaml.load_all(f))
-                    if len(cachedata)==6 and cachedata[0] == self.CACHE_VER:
-                        _, _CH, _TH, _LFT, _LFH, _CFG = cachedata
-                        self.lastConfigHash=_CH
-                        self.lastTargetHash=_TH
-                        self.lastFileTimes=_LFT
-                        self.lastFileHashes=_LFH
-                        self.lastConfig=_CFG
-            except Exception as e:
-                log.exception(e)
-                pass
+        cachedata = self.maestro.state.get(self.name)
+        if cachedata is None:
+            cachedata = self.readLegacyCache()
+            if cachedata is not None:
+                # Migrate it.
+                self.maestro.state.put(self.name, cachedata)
+        # Everything hashed in here is meaningless under a different algorithm, so treat that like no cache at all.
+        # Caches from before this was recorded were all MD5.
+        if cachedata is not None and cachedata.get('version') == self.CACHE_VER \
+                and cachedata.get('hash-algorithm', 'md5') == self.getHashAlgorithm():
+            self.lastConfigHash=cachedata['config-hash']
+            self.lastTargetHash=cachedata['target-hash']
+            self.lastFileTimes=cachedata['file-times']
+            self.lastFileHashes=cachedata['file-hashes']
+            self.lastFileStats=cachedata.get('file-stats', {})
+            self.lastConfig=cachedata['config']
+
+    def iterChangedFiles(self):
+        '''
+        Yields (filename, reason) for each file that changed since the last build, stopping as soon as the caller does.
 
-    def haveFilesChanged(self):
+        Files are stat'd one at a time, and only hashed if their stat signature changed.  Hashing is left until every
+        cheaper check has come up empty, and then done for all remaining files at once, in parallel.
+
+        Reasons: missing, new, dirty (rebuilt by another target this run), mtime, hash.
+        '''
         if self.lastTargetHash == '':
             self.readCache()
-        curFileTimes = self.serialize_file_times()
-        if self.CHECK_MTIMES:
-            for filename, mtime in self.lastFileTimes.items():
-                filename=os.path.abspath(filename)
-                if filename not in curFileTimes.keys():
-                    log.debug('File %s is currently missing.', filename)
-                    return True
-                if abs(curFileTimes[filename] - mtime) > 0.1:
-                    log.debug('File %s has a changed mtime. abs(%d - %d) > 1', filename, curFileTimes[filename], mtime)
-                    return True
-        if self.CHECK_HASHES:
-            curFileHashes = self.serialize_file_hashes()
-            for filename, hashed in self.lastFileHashes.items():
-                filename=os.path.abspath(filename)
-                if filename not in curFileHashes.keys():
+        seen = set()
+        tohash = []
+        for filename in self.getFilesToCompare():
+            filename = os.path.abspath(filename)
+            if filename in seen:
+                continue
+            seen.add(filename)
+            st = self.statFile(filename)
+            if st is None:
+                if filename in self.lastFileTimes:
                     log.debug('File %s is currently missing.', filename)
-                    return True
-                if curFileHashes[filename] != hashed:
-                    log.debug('File %s has a changed hash. (%s != %s)', filename, curFileHashes[filename], hashed)
-                    return True
-        for filename, mtime in curFileTimes.items():
-            filename=os.path.abspath(filename)
+                    yield filename, 'missing'
+                continue
             if filename in self.maestro.targetsDirty:
                 log.debug('File %s was dirtied by another BuildTarget.', filename)
-                return True
-
-            if filename not in self.lastFileTimes.keys():
+                yield filename, 'dirty'
+                continue
+            if filename not in self.lastFileTimes:
                 log.debug('File %s is new.', filename)
-                return True
+                yield filename, 'new'
+                continue
+            signature = self.getFileSignature(st)
+            if self.CHECK_STATS and self.lastFileStats.get(filename) == signature:
+                continue
+            if self.CHECK_MTIMES and abs(st.st_mtime - self.lastFileTimes[filename]) > 0.1:
+                log.debug('File %s has a changed mtime. abs(%d - %d) > 1', filename, st.st_mtime, self.lastFileTimes[filename])
+                yield filename, 'mtime'
+                continue
+            if self.CHECK_HASHES:
+                tohash.append((filename, signature))
+        for filename in self.lastFileTimes.keys():
+            if filename not in seen:
+                log.debug('File %s is currently missing.', filename)
+                yield filename, 'missing'
+        if tohash:
+            hashes = self.hashFiles(tohash)
+            for filename, _ in tohash:
+                if hashes[filename] != self.lastFileHashes.get(filename):
+                    log.debug('File %s has a changed hash. (%s != %s)', filename, hashes[filename], self.lastFileHashes.get(filename))
+                    yield filename, 'hash'
+
+    def haveFilesChanged(self):
+        for _ in self.iterChangedFiles():
+            return True
         return False
 
     def getChangedFiles(self):
         '''
         Slower than haveFilesChanged.
         '''
-        if self.lastTargetHash == '':
-            self.readCache()
-        o = []
-        if self.CHECK_MTIMES:
-            curFileTimes = self.serialize_file_times()
-            for filename, mtime in self.lastFileTimes.items():
-                filename=os.path.abspath(filename)
-                if filename not in curFileTimes.keys():
-                    log.debug('File %s is currently missing.', filename)
-                    o += [filename]
-                if curFileTimes[filename] != mtime:
-                    log.debug('File %s has a changed mtime.', filename)
-                    o += [filename]
-        if self.CHECK_HASHES:
-            curFileHashes = self.serialize_file_hashes()
-            for filename, hashed in self.lastFileHashes.items():
-                filename=os.path.abspath(filename)
-                if filename not in curFileHashes.keys():
-                    log.debug('File %s is currently missing.', filename)
-                    o += [filename]
-                if curFileHashes[filename] != hashed:
-                    log.debug('File %s has a changed hash.', filename)
-                    o += [filename]
-        for filename, mtime in curFileTimes.items():
-            filename=os.path.abspath(filename)
-            if filename not in self.lastFileTimes.keys():
-                log.debug('File %s is new.', filename)
-                o += [filename]
-        return o
+        return [filename for filename, reason in self.iterChangedFiles() if reason != 'dirty']
 
 
     def checkMTimes(self, inputs, targets, config=None):
@@ -311,7 +621,8 @@ class BuildTarget(object):
 
         if config is not None:
             s = StringIO()
-            yaml.dump(config, s)
+            with yaml_lock:
+                yaml.dump(config, s)
             configHash = hashlib.md5(s.getvalue().encode('utf-8')).hexdigest()
             targetHash = hashlib.md5(';'.join(targets).encode('utf-8')).hexdigest()
 
@@ -359,13 +670,22 @@ class BuildTarget(object):
 
         return False
 
-    def canBuild(self, maestro, keys):
+    def addImplicitDependencies(self, keys):
+        '''
+        Any of our input files provided by another target become dependencies.
+
+        :param keys:
+            Everything provided by every target.  Pass BuildMaestro.providers rather than a list.
+        '''
         #self.files = list(callLambda(self.files))
         #for dep in list(set(self.dependencies + self.files)):
         if not self._lambdas_called:
             for reqfile in callLambda(self.files):
                 if reqfile in keys and reqfile not in self.dependencies:
                     self.dependencies.append(reqfile)
+
+    def canBuild(self, maestro, keys):
+        self.addImplicitDependencies(keys)
         for dep in list(set(self.dependencies)):
             if dep not in maestro.targetsCompleted:
                 log.debug('%s: Waiting on %s.',self.name,dep)
@@ -381,3 +701,8 @@ class SingleBuildTarget(BuildTarget):
     def __init__(self, target=None, files=[], dependencies=[], provides=[], name=''):
         self.target=target
         super(SingleBuildTarget, self).__init__([target], files=files, dependencies=dependencies, provides=provides, name=name)
+
+    def deserialize(self, data):
+        super(SingleBuildTarget, self).deserialize(data)
+        if self._all_provides:
+            self.target = self._all_provides[0]
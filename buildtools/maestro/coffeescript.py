@@ -34,6 +34,7 @@ from buildtools.maestro.base_target import SingleBuildTarget
 class CoffeeBuildTarget(SingleBuildTarget):
     BT_TYPE = 'CoffeeScript'
     BT_LABEL = 'COFFEE'
+    CACHE_ARTIFACTS = True
 
     CHECK_MTIMES = False
     def __init__(self, target=None, files=[], dependencies=[], coffee_opts=['--no-header','-bc'], coffee_executable=None, make_map=False, coffee_concat_executable=None):
@@ -54,6 +55,19 @@ class CoffeeBuildTarget(SingleBuildTarget):
         super(CoffeeBuildTarget, self).__init__(target, files, dependencies)
         self.coffee_opts=coffee_opts
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['opts'] = self.coffee_opts
+        dat['exec'] = self.coffee_executable
+        dat['coffee-concat-executable'] = self.coffee_concat_executable
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.coffee_opts = data.get('opts', ['--no-header','-bc'])
+        self.coffee_executable = data.get('exec')
+        self.coffee_concat_executable = data.get('coffee-concat-executable')
+
     def get_config(self):
         return {
             'opts':                     self.coffee_opts,
@@ -111,6 +125,7 @@ class CoffeeBuildTarget(SingleBuildTarget):
 class JS2CoffeeBuildTarget(SingleBuildTarget):
     BT_TYPE = 'JS2Coffee'
     BT_LABEL = 'JS2COFFEE'
+    CACHE_ARTIFACTS = True
     def __init__(self, target=None, files=[], dependencies=[], j2coffee_opts=['-i', '2'], js2coffee_path=None):
         if js2coffee_path is None:
             js2coffee_path = os_utils.which('js2coffee')
@@ -120,6 +135,17 @@ class JS2CoffeeBuildTarget(SingleBuildTarget):
         super(JS2CoffeeBuildTarget, self).__init__(target, files, [os.path.abspath(__file__)]+dependencies)
         self.js2coffee_opts = j2coffee_opts
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['opts'] = self.js2coffee_opts
+        dat['exec'] = self.js2coffee_path
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.js2coffee_opts = data.get('opts', ['-i', '2'])
+        self.js2coffee_path = data.get('exec')
+
     def get_config(self):
         return {
             'opts': self.js2coffee_opts,
@@ -42,6 +42,7 @@ class EDataType(enum.Enum):
 class ConvertDataBuildTarget(SingleBuildTarget):
     BT_TYPE = 'ConvertData'
     BT_LABEL = 'CONVERT'
+    CACHE_ARTIFACTS = True
     def __init__(self, target=None, filename='', dependencies=[], from_type=EDataType.JSON, to_type=EDataType.JSON, indent_chars=None, pretty_print=False):
         self.from_type=from_type
         self.to_type=to_type
@@ -50,6 +51,21 @@ class ConvertDataBuildTarget(SingleBuildTarget):
 
         super().__init__(target, [filename, os.path.abspath(__file__)], dependencies)
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['from'] = self.from_type.value
+        dat['to'] = self.to_type.value
+        dat['indent-chars'] = self.indent_chars
+        dat['pretty-print'] = self.pretty_print
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.from_type = EDataType(data.get('from', EDataType.JSON.value))
+        self.to_type = EDataType(data.get('to', EDataType.JSON.value))
+        self.indent_chars = data.get('indent-chars')
+        self.pretty_print = data.get('pretty-print', False)
+
     def get_label(self):
         return '{} {} -> {}'.format(self.BT_LABEL, self.from_type.name, self.to_type.name)
 
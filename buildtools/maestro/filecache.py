@@ -0,0 +1,173 @@
+'''
+Process-wide stat() and file hash memo for Maestro.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import os
+import stat
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from buildtools import tracing, utils
+
+
+class FileInfoCache(object):
+    '''
+    Shared by every BuildTarget in a BuildMaestro, so a file listed by many targets is only stat'd and hashed once.
+
+    Hashes are keyed by (path, stat signature), so they can't go stale.  stat() results are kept until invalidate()
+    is called for the path, which BuildTarget.try_build() does for everything it provides().
+
+    hashMany() spreads work over a pool of up to `jobs` threads, shared by every caller.  A file that one thread is
+    already hashing is waited on rather than hashed again.
+    '''
+
+    #: hashMany() hashes everything on the calling thread if there's less than this much to read.
+    PARALLEL_MIN_BYTES = 1024 * 1024
+
+    def __init__(self, algorithm=utils.DEFAULT_HASH_ALGORITHM, jobs=1):
+        #: Name passed to utils.new_hasher().  Call clear() after changing it.
+        self.algorithm = algorithm
+        #: Most files hashed at once by hashMany().  Call shutdown() after changing it.
+        self.jobs = jobs
+
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._hashes = {}
+        # filename -> (signature, Future) for hashes in progress.
+        self._pending = {}
+        self._pool = None
+
+        self.stat_hits = 0
+        self.stat_misses = 0
+        self.hash_hits = 0
+        self.hash_misses = 0
+
+    @staticmethod
+    def getSignature(st):
+        return [st.st_size, st.st_mtime_ns, st.st_ino, st.st_ctime_ns]
+
+    def stat(self, filename: str):
+        '''
+        :param filename: Absolute path.
+        :returns os.stat_result: None if filename isn't a regular file.
+        '''
+        with self._lock:
+            if filename in self._stats:
+                self.stat_hits += 1
+                return self._stats[filename]
+            self.stat_misses += 1
+        try:
+            st = os.stat(filename)
+            if not stat.S_ISREG(st.st_mode):
+                st = None
+        except (OSError, ValueError):
+            st = None
+        with self._lock:
+            self._stats[filename] = st
+        return st
+
+    def hash(self, filename: str, signature) -> str:
+        '''
+        :param filename: Absolute path.
+        :param signature: getSignature() of the file as it is now.
+        '''
+        with self._lock:
+            cached = self._hashes.get(filename)
+            if cached is not None and cached[0] == signature:
+                self.hash_hits += 1
+                return cached[1]
+            pending = self._pending.get(filename)
+            if pending is not None and pending[0] == signature:
+                self.hash_hits += 1
+                future = pending[1]
+            else:
+                self.hash_misses += 1
+                future = Future()
+                self._pending[filename] = (signature, future)
+                pending = None
+        if pending is not None:
+            return future.result()
+        try:
+            with tracing.span('hash', 'hash', file=filename, size=signature[0]):
+                hashed = utils.hashsum(filename, self.algorithm)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(hashed)
+        finally:
+            with self._lock:
+                if self._pending.get(filename, (None, None))[1] is future:
+                    del self._pending[filename]
+                if future.done() and future.exception() is None:
+                    self._hashes[filename] = (signature, hashed)
+        return hashed
+
+    def hashMany(self, files):
+        '''
+        Same as calling hash() on each file, but on the pool when there's enough to be worth it.
+
+        :param files: List of (filename, signature) pairs.
+        :returns dict: filename -> hash.
+        '''
+        if self.jobs <= 1 or len(files) < 2 or sum(signature[0] for _, signature in files) < self.PARALLEL_MIN_BYTES:
+            return {filename: self.hash(filename, signature) for filename, signature in files}
+        pool = self._getPool()
+        futures = [(filename, pool.submit(self.hash, filename, signature)) for filename, signature in files]
+        return {filename: future.result() for filename, future in futures}
+
+    def _getPool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix='hash')
+            return self._pool
+
+    def shutdown(self):
+        '''
+        Stop the hashing threads.  They're started again on demand.
+        '''
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def invalidate(self, filenames):
+        '''
+        Forget what we know about filenames, because something just wrote to them.
+        '''
+        with self._lock:
+            for filename in filenames:
+                filename = os.path.abspath(filename)
+                self._stats.pop(filename, None)
+                self._hashes.pop(filename, None)
+
+    def clear(self):
+        '''
+        Forget everything and reset the counters.
+        '''
+        with self._lock:
+            self._stats.clear()
+            self._hashes.clear()
+            self.stat_hits = self.stat_misses = 0
+            self.hash_hits = self.hash_misses = 0
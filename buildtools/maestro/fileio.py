@@ -23,6 +23,8 @@ SOFTWARE.
 
 '''
 import codecs
+import functools
+import json
 import os
 import re
 import shutil
@@ -31,6 +33,9 @@ import zipfile
 
 from buildtools import log, os_utils, utils
 from buildtools.maestro.base_target import SingleBuildTarget
+from buildtools.maestro.sourcemap import SourceMapWriter, column_width
+from buildtools.maestro.textstream import (CHUNK_SIZE, Replacer, copy_normalizing_newlines, iter_line_chunks,
+                                           passthrough_codec, skip_bom)
 from buildtools.maestro.utils import callLambda
 
 
@@ -38,14 +43,31 @@ class CopyFileTarget(SingleBuildTarget):
     BT_TYPE = 'CopyFile'
     BT_LABEL = 'COPY'
 
-    def __init__(self, target=None, filename=None, dependencies=[], verbose=False):
+    def __init__(self, target=None, filename=None, dependencies=[], verbose=False, strategy='copy'):
+        #: 'copy', 'reflink', 'hardlink' or 'symlink'.  See os_utils.clone_file().
+        self.strategy = strategy
         super(CopyFileTarget, self).__init__(target, [filename], dependencies)
         self.name = f'{filename} -> {target}'
 
+    def serialize(self):
+        data = super(CopyFileTarget, self).serialize()
+        if self.strategy != 'copy':
+            data['strategy'] = self.strategy
+        return data
+
+    def deserialize(self, data):
+        super(CopyFileTarget, self).deserialize(data)
+        self.strategy = data.get('strategy', 'copy')
+
+    def get_config(self):
+        if self.strategy != 'copy':
+            return {'strategy': self.strategy}
+        return {}
+
     def build(self):
         os_utils.ensureDirExists(os.path.dirname(self.target), noisy=False)
-        os_utils.single_copy(self.files[0], self.target, verbose=False, as_file=True)
-        self.touch(self.target)
+        # No touch() afterwards: the copy keeps the source's mtime, and staleness goes by stat signatures and hashes.
+        os_utils.single_copy(self.files[0], self.target, verbose=False, as_file=True, strategy=self.strategy, file_cache=self.maestro.fileCache)
 
 
 class MoveFileTarget(SingleBuildTarget):
@@ -64,13 +86,17 @@ class MoveFileTarget(SingleBuildTarget):
 class ReplaceTextTarget(SingleBuildTarget):
     BT_TYPE = 'ReplaceText'
     BT_LABEL = 'REPLACETEXT'
+    CACHE_ARTIFACTS = True
 
-    def __init__(self, target=None, filename=None, replacements=None, dependencies=[], read_encoding='utf-8-sig', write_encoding='utf-8-sig', display_progress=False):
+    def __init__(self, target=None, filename=None, replacements=None, dependencies=[], read_encoding='utf-8-sig', write_encoding='utf-8-sig', display_progress=False, multiline=False):
         self.replacements = replacements
         self.subject = filename
         self.read_encoding = read_encoding
         self.write_encoding = write_encoding
         self.display_progress = display_progress
+        #: Run each replacement over the whole file instead of line by line, so needles can span lines.  ^ and $ match
+        #: at every line.  Reads the whole file into memory.
+        self.multiline = multiline
         super().__init__(target, [filename], dependencies)
 
     def serialize(self):
@@ -80,6 +106,8 @@ class ReplaceTextTarget(SingleBuildTarget):
         dat['write-encoding'] = self.write_encoding
         if self.display_progress:
             dat['display-progress'] = self.display_progress
+        if self.multiline:
+            dat['multiline'] = self.multiline
         return dat
 
     def deserialize(self, data):
@@ -88,81 +116,60 @@ class ReplaceTextTarget(SingleBuildTarget):
         self.read_encoding = data['read-encoding']
         self.write_encoding = data['write-encoding']
         self.display_progress = data.get('display-progress', False)
+        self.multiline = data.get('multiline', False)
         self.subject = data['files'][0]
 
     def get_config(self):
-        return {
+        config = {
             'replacements': self.replacements,
             'read-encoding': self.read_encoding,
             'write-encoding': self.write_encoding
         }
+        if self.multiline:
+            config['multiline'] = True
+        return config
 
     def build(self):
-        def process_line(outf, line):
-            for needle, replacement in self.replacements.items():
-                needle = callLambda(needle)
-                # if isinstance(replacement, SerializableLambda):
-                #    replacement = replacement()
-                line = re.sub(needle, replacement, line)
-            outf.write(line)
+        replacer = Replacer(self.replacements, multiline=self.multiline)
         os_utils.ensureDirExists(os.path.dirname(self.target))
         nbytes = os.path.getsize(self.subject)
-        with codecs.open(self.subject, 'r', encoding=self.read_encoding) as inf:
-            with codecs.open(self.target + '.out', 'w', encoding=self.write_encoding) as outf:
+        # Universal newlines: \r\n and \r come out as \n, and we only write \n.
+        with open(self.subject, 'r', encoding=self.read_encoding) as inf:
+            with open(self.target + '.out', 'w', encoding=self.write_encoding, newline='\n') as outf:
                 progBar = tqdm.tqdm(total=nbytes, unit='B', leave=False) if self.display_progress else None
-                linebuf = ''
                 nlines = 0
-                nbytes = 0
-                lastbytecount = 0
-                lastcheck = 0
+                nchars = 0
                 longest_line = 0
-                while True:
-                    block = inf.read(4096)
-                    block = block.replace('\r\n', '\n')
-                    block = block.replace('\r', '\n')
-                    if not block:  # EOF
-                        process_line(outf, linebuf)
-                        nlines += 1
-                        charsInLine = len(linebuf)
-                        if charsInLine > longest_line:
-                            longest_line = charsInLine
-                        break
-                    for c in block:
-                        nbytes += 1
-                        if self.display_progress:
-                            # if nbytes % 10 == 1:
-                            cms = utils.current_milli_time()
-                            if cms - lastcheck >= 250:
-                                progBar.set_postfix({'linebuf': len(linebuf), 'nlines': nlines})
-                                progBar.update(nbytes - lastbytecount)
-                                lastcheck = cms
-                                lastbytecount = nbytes
-                        linebuf += c
-                        if c in '\r\n':
-                            process_line(outf, linebuf)
-                            nlines += 1
-                            charsInLine = len(linebuf)
-                            if charsInLine > longest_line:
-                                longest_line = charsInLine
-                            linebuf = ''
+                chunks = [inf.read()] if self.multiline else iter_line_chunks(inf)
+                for chunk in chunks:
+                    if self.display_progress:
+                        nlines += chunk.count('\n')
+                        nchars += len(chunk)
+                        longest_line = max(longest_line, max(map(len, chunk.split('\n'))))
+                        progBar.set_postfix({'nlines': nlines})
+                        progBar.update(min(len(chunk), nbytes - progBar.n))
+                    outf.write(replacer.sub(chunk))
                 if self.display_progress:
                     progBar.close()
                     with log.info('Completed.'):
                         log.info('Lines.......: %d', nlines)
-                        log.info('Chars.......: %d', nbytes)
+                        log.info('Chars.......: %d', nchars)
                         log.info('Longest line: %d chars', longest_line)
         shutil.move(self.target + '.out', self.target)
 
 class PrependToFileTarget(SingleBuildTarget):
     BT_TYPE = 'Prepend'
     BT_LABEL = 'PREPEND'
+    CACHE_ARTIFACTS = True
 
-    def __init__(self, target, filename, text='', dependencies=[], read_encoding='utf-8-sig', write_encoding='utf-8-sig', display_progress=False):
+    def __init__(self, target, filename, text='', dependencies=[], read_encoding='utf-8-sig', write_encoding='utf-8-sig', display_progress=False, normalize_newlines=True):
         self.text = text
         self.subject = filename
         self.read_encoding = read_encoding
         self.write_encoding = write_encoding
         self.display_progress = display_progress
+        #: Turn \r\n and \r in filename into \n.  Without it, and with matching encodings, the file is copied by the kernel.
+        self.normalize_newlines = normalize_newlines
         super().__init__(target, [filename], dependencies)
 
     def serialize(self):
@@ -173,6 +180,8 @@ class PrependToFileTarget(SingleBuildTarget):
         dat['write-encoding'] = self.write_encoding
         if self.display_progress:
             dat['display-progress'] = self.display_progress
+        if not self.normalize_newlines:
+            dat['normalize-newlines'] = self.normalize_newlines
         return dat
 
     def deserialize(self, data):
@@ -182,144 +191,366 @@ class PrependToFileTarget(SingleBuildTarget):
         self.read_encoding = data['read-encoding']
         self.write_encoding = data['write-encoding']
         self.display_progress = data.get('display-progress', False)
+        self.normalize_newlines = data.get('normalize-newlines', True)
         self.subject = data['files'][0]
 
     def get_config(self):
-        return {
+        config = {
             'subject': self.subject,
             'text': self.text,
             'read-encoding': self.read_encoding,
             'write-encoding': self.write_encoding
         }
+        if not self.normalize_newlines:
+            config['normalize-newlines'] = False
+        return config
 
     def build(self):
-        linebuf = ''
-        nlines = 0
-        lastbytecount = 0
-        lastcheck = 0
-        longest_line = 0
         os_utils.ensureDirExists(os.path.dirname(self.target))
         nbytes = os.path.getsize(self.subject)
-        with codecs.open(self.subject, 'r', encoding=self.read_encoding) as inf:
-            with codecs.open(self.target + '.out', 'w', encoding=self.write_encoding) as outf:
-                progBar = tqdm.tqdm(total=nbytes, unit='B', leave=False) if self.display_progress else None
-                outf.write(self.text)
-                while True:
-                    block = inf.read(4096)
-                    block = block.replace('\r\n', '\n')
-                    block = block.replace('\r', '\n')
-                    if not block:  # EOF
-                        outf.write(linebuf)
-                        nlines += 1
-                        charsInLine = len(linebuf)
-                        if charsInLine > longest_line:
-                            longest_line = charsInLine
-                        break
-                    for c in block:
-                        nbytes += 1
-                        if self.display_progress:
-                            # if nbytes % 10 == 1:
-                            cms = utils.current_milli_time()
-                            if cms - lastcheck >= 250:
-                                progBar.set_postfix({'linebuf': len(linebuf), 'nlines': nlines})
-                                progBar.update(nbytes - lastbytecount)
-                                lastcheck = cms
-                                lastbytecount = nbytes
-                        linebuf += c
-                        if c in '\r\n':
-                            outf.write(linebuf)
-                            nlines += 1
-                            charsInLine = len(linebuf)
-                            if charsInLine > longest_line:
-                                longest_line = charsInLine
-                            linebuf = ''
-                if self.display_progress:
-                    progBar.close()
-                    with log.info('Completed.'):
-                        log.info('Lines.......: %d', nlines)
-                        log.info('Chars.......: %d', nbytes)
-                        log.info('Longest line: %d chars', longest_line)
+        progBar = tqdm.tqdm(total=nbytes, unit='B', leave=False) if self.display_progress else None
+        if passthrough_codec(self.read_encoding, self.write_encoding) is not None:
+            # Same bytes either way: no need to decode anything.
+            with open(self.subject, 'rb') as inf, open(self.target + '.out', 'wb') as outf:
+                outf.write(self.text.encode(self.write_encoding))
+                skip_bom(inf, self.read_encoding)
+                if self.normalize_newlines:
+                    copy_normalizing_newlines(inf, outf)
+                else:
+                    os_utils.copy_fileobj(inf, outf)
+        else:
+            with open(self.subject, 'r', encoding=self.read_encoding, newline=None if self.normalize_newlines else '') as inf:
+                with open(self.target + '.out', 'w', encoding=self.write_encoding, newline='') as outf:
+                    outf.write(self.text)
+                    shutil.copyfileobj(inf, outf, CHUNK_SIZE)
+        if self.display_progress:
+            progBar.update(nbytes)
+            progBar.close()
+            log.info('Completed: %s.', os_utils.sizeof_fmt(nbytes))
         shutil.move(self.target + '.out', self.target)
 
 class ConcatenateBuildTarget(SingleBuildTarget):
     BT_TYPE = 'Concatenate'
     BT_LABEL = 'CONCAT'
+    CACHE_ARTIFACTS = True
 
-    def __init__(self, target, files, dependencies=[], read_encoding='utf-8-sig', write_encoding='utf-8-sig'):
+    def __init__(self, target, files, dependencies=[], read_encoding='utf-8-sig', write_encoding='utf-8-sig', source_map=False):
         self.write_encoding = write_encoding
         self.read_encoding = read_encoding
         self.subjects = files
+        #: Also write target + '.map', a JS/CSS source map of where each line came from, and point target at it.
+        self.source_map = source_map
         super(ConcatenateBuildTarget, self).__init__(target, dependencies=dependencies, files=[os.path.abspath(__file__)] + files)
 
+    @property
+    def map_file(self):
+        return self.target + '.map'
+
+    def calcProvides(self):
+        provides = super(ConcatenateBuildTarget, self).calcProvides()
+        if self.source_map:
+            provides = list(provides) + [self.map_file]
+        return provides
+
     def serialize(self):
         data = super(ConcatenateBuildTarget, self).serialize()
-        if os.path.abspath(__file__) in data['files']:
-            data['files'].remove(os.path.abspath(__file__))
+        # Not remove(): data['files'] is self.files.
+        data['files'] = [filename for filename in data['files'] if filename != os.path.abspath(__file__)]
         data['encoding'] = {
             'read': self.read_encoding,
             'write': self.write_encoding
         }
+        if self.source_map:
+            data['source-map'] = self.source_map
         return data
 
     def deserialize(self, data):
         super(ConcatenateBuildTarget, self).deserialize(data)
-        if os.path.abspath(__file__) not in data['files']:
-            data['files'].append(os.path.abspath(__file__))
+        self.subjects = list(self.files)
+        self.files = [os.path.abspath(__file__)] + self.subjects
         enc = data.get('encoding', {})
         self.read_encoding = enc.get('read', 'utf-8-sig')
         self.write_encoding = enc.get('write', 'utf-8-sig')
+        self.source_map = data.get('source-map', False)
 
     def get_config(self):
-        return {
+        config = {
             'read-encoding': self.read_encoding,
             'write-encoding': self.write_encoding
         }
+        if self.source_map:
+            config['source-map'] = True
+        return config
 
     def build(self):
-        with codecs.open(self.target + '.tmp', 'w', encoding=self.write_encoding) as outf:
-            for subj in tqdm.tqdm(self.subjects, leave=False):
-                with codecs.open(subj, 'r', encoding=self.read_encoding) as f:
-                    outf.write(f.read())
+        smap = SourceMapWriter(self.target, self.map_file) if self.source_map else None
+        codec = passthrough_codec(self.read_encoding, self.write_encoding)
+        if codec is not None:
+            # Same bytes either way, so the files are only copied, minus the BOMs read_encoding would have eaten.
+            with open(self.target + '.tmp', 'wb') as outf:
+                if self.subjects and codecs.lookup(self.write_encoding).name == 'utf-8-sig':
+                    outf.write(codecs.BOM_UTF8)
+                for subj in tqdm.tqdm(self.subjects, leave=False):
+                    with open(subj, 'rb') as f:
+                        skip_bom(f, self.read_encoding)
+                        if smap is None:
+                            os_utils.copy_fileobj(f, outf)
+                        else:
+                            self._copyMapped(smap, subj, iter(functools.partial(f.read, CHUNK_SIZE), b''), outf.write, b'\n', codec)
+                if smap is not None:
+                    outf.write(self._getMapComment(smap).encode(codec))
+        else:
+            with open(self.target + '.tmp', 'w', encoding=self.write_encoding, newline='') as outf:
+                if self.subjects:
+                    # Gets the BOM out even if every subject is empty.
+                    outf.write('')
+                for subj in tqdm.tqdm(self.subjects, leave=False):
+                    with open(subj, 'r', encoding=self.read_encoding, newline='') as f:
+                        if smap is None:
+                            shutil.copyfileobj(f, outf, CHUNK_SIZE)
+                        else:
+                            self._copyMapped(smap, subj, iter(functools.partial(f.read, CHUNK_SIZE), ''), outf.write, '\n')
+                if smap is not None:
+                    outf.write(self._getMapComment(smap))
+        if smap is not None:
+            smap.write(self.map_file + '.tmp')
+            os.replace(self.map_file + '.tmp', self.map_file)
         if os.path.isfile(self.target):
             os.remove(self.target)
         shutil.move(self.target + '.tmp', self.target)
 
+    def _copyMapped(self, smap, subj, chunks, write, newline, codec=None):
+        newlines = 0
+        tail = 0
+        for chunk in chunks:
+            write(chunk)
+            n = chunk.count(newline)
+            if n:
+                newlines += n
+                tail = column_width(chunk[chunk.rindex(newline) + 1:], codec)
+            else:
+                tail += column_width(chunk, codec)
+        smap.append(subj, newlines, tail)
+
+    def _getMapComment(self, smap):
+        return ('\n' if smap.column else '') + smap.getURLComment() + '\n'
+
 
 class CopyFilesTarget(SingleBuildTarget):
+    '''
+    Mirrors the files in source into destination.
+
+    target is a manifest of every file copied, with the (size, mtime_ns) its source had, so later builds only copy
+    what was added or changed, and remove what was deleted from source.
+    '''
     BT_TYPE = 'CopyFiles'
     BT_LABEL = 'COPYFILES'
 
-    def __init__(self, target, source, destination, dependencies=[], verbose=False, ignore=None, show_progress=False):
+    MANIFEST_VERSION = 1
+
+    def __init__(self, target, source, destination, dependencies=[], verbose=False, ignore=None, show_progress=False, strategy='copy'):
         self.source = source
         self.destination = destination
         self.verbose = verbose
         self.ignore=ignore
-        self.provided_files=os_utils.get_file_list(source, start=source, prefix=destination)
         self.show_progress=show_progress
+        #: How files get to destination: 'copy', 'reflink' or 'hardlink'.  See os_utils.clone_file().
+        self.strategy = strategy
         super(CopyFilesTarget, self).__init__(target, dependencies=dependencies, files=[self.source, self.destination, os.path.abspath(__file__)])
         self.name = f'{source} -> {destination}'
-
-    def is_stale(self):
-        return True
+        # (source files, changes), until resetMemos() or build().
+        self._scan = None
+        self._changes = None
+        # What the last build() copied or removed, until resetMemos().
+        self._changed = None
+
+    def resetMemos(self):
+        super(CopyFilesTarget, self).resetMemos()
+        self._scan = None
+        self._changes = None
+        self._changed = None
 
     def serialize(self):
         data = super(CopyFilesTarget, self).serialize()
         data['files'] = [self.source, self.destination]
+        if self.ignore is not None:
+            data['ignore'] = self.ignore
+        if self.verbose:
+            data['verbose'] = self.verbose
+        if self.show_progress:
+            data['show-progress'] = self.show_progress
+        if self.strategy != 'copy':
+            data['strategy'] = self.strategy
         return data
 
     def deserialize(self, data):
         super(CopyFilesTarget, self).deserialize(data)
         self.source, self.destination = data['files']
-
-    def provides(self):
-        return [self.target]+self.provided_files
+        self.files = [self.source, self.destination, os.path.abspath(__file__)]
+        self.ignore = data.get('ignore')
+        self.verbose = data.get('verbose', False)
+        self.show_progress = data.get('show-progress', False)
+        self.strategy = data.get('strategy', 'copy')
+        self._scan = None
+        self._changes = None
+        self._changed = None
+
+    @property
+    def provided_files(self):
+        return list(self.provides()[1:])
+
+    def calcProvides(self):
+        return [self.target]+[os.path.join(self.destination, relpath) for relpath in self.scanSource()]
 
     def get_config(self):
-        return [self.source, self.destination, self.ignore, self.provided_files]
+        config = [self.source, self.destination, self.ignore, self.provided_files]
+        if self.strategy != 'copy':
+            config.append(self.strategy)
+        return config
+
+    def getFilesToCompare(self):
+        # Every copied file is covered by the manifest, which is far cheaper than hashing them all.
+        return [os.path.abspath(__file__)]+self.dependencies
+
+    def getInputFiles(self):
+        # Not destination: it's ours.
+        return [self.source, os.path.abspath(__file__)]+self.dependencies
+
+    def scanSource(self):
+        '''
+        :returns dict: Path relative to source -> [size, mtime_ns], for every file that gets copied.  Once per run.
+        '''
+        if self._scan is None:
+            _, files = os_utils.scan_tree(self.source, ignore=self.ignore)
+            self._scan = {relpath: [st.st_size, st.st_mtime_ns] for relpath, st in files.items()}
+        return self._scan
+
+    def readManifest(self):
+        '''
+        :returns dict: Path relative to source -> [size, mtime_ns] as of the last build, or None.
+        '''
+        try:
+            with open(self.target, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(manifest, dict) or manifest.get('version') != self.MANIFEST_VERSION:
+            return None
+        if manifest.get('source') != os.path.abspath(self.source) or manifest.get('destination') != os.path.abspath(self.destination):
+            return None
+        return manifest.get('files', {})
+
+    def writeManifest(self, files):
+        tmpfile = self.target + '.tmp'
+        os_utils.ensureDirExists(os.path.dirname(self.target))
+        with open(tmpfile, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': self.MANIFEST_VERSION,
+                'source': os.path.abspath(self.source),
+                'destination': os.path.abspath(self.destination),
+                'files': files,
+            }, f, separators=(',', ':'))
+        os.replace(tmpfile, self.target)
+
+    def getChanges(self):
+        '''
+        Diffs scanSource() against the manifest and what's in destination.
+
+        :returns list: (relpath, change) pairs, change being one of iterChangedFiles()'s reasons: new, missing (from
+            destination), mtime (size or mtime changed), deleted (from source).
+        '''
+        if self._changes is None:
+            files = self.scanSource()
+            manifest = self.readManifest()
+            if manifest is None:
+                manifest = {}
+            # Names only: a stat per file is what we're trying to avoid.
+            _, existing = os_utils.scan_tree(self.destination, stat=False)
+            changes = []
+            for relpath, signature in files.items():
+                if relpath not in manifest:
+                    changes.append((relpath, 'new'))
+                elif relpath not in existing:
+                    changes.append((relpath, 'missing'))
+                elif manifest[relpath] != signature:
+                    changes.append((relpath, 'mtime'))
+            for relpath in manifest:
+                if relpath not in files and relpath in existing:
+                    changes.append((relpath, 'deleted'))
+            self._changes = changes
+        return self._changes
+
+    def iterStaleReasons(self):
+        for reason in super(CopyFilesTarget, self).iterStaleReasons():
+            yield reason
+            if reason['reason'] == 'no-cache':
+                return
+        if self.readManifest() is None:
+            yield {'reason': 'no-cache'}
+            return
+        for relpath, change in self.getChanges():
+            yield {'reason': 'file', 'file': os.path.join(self.source, relpath), 'change': change}
 
     def build(self):
-        os_utils.copytree(self.source, self.destination, verbose=self.verbose, ignore=self.ignore, progress=self.show_progress)
-        self.touch(self.target)
+        files = self.scanSource()
+        changes = self.getChanges()
+        tocopy = []
+        dirs = set()
+        deleted = 0
+        self._changed = [self.target]
+        prog = tqdm.tqdm(total=len(changes), desc='Copying...', unit='file', leave=True) if self.show_progress else None
+        for relpath, change in changes:
+            src = os.path.join(self.source, relpath)
+            dest = os.path.join(self.destination, relpath)
+            if change == 'deleted':
+                if self.verbose:
+                    log.info('Removing {}'.format(dest))
+                os.remove(dest)
+                self._removeEmptyParents(os.path.dirname(relpath))
+                self._changed.append(dest)
+                deleted += 1
+            elif change == 'new' and self._isCopied(dest, files[relpath]):
+                # Probably left there by a build from before the manifest.
+                pass
+            else:
+                dirs.add(os.path.dirname(dest))
+                tocopy.append((src, dest))
+                continue
+            if prog:
+                prog.update(1)
+        for dirname in sorted(dirs):
+            os.makedirs(dirname, exist_ok=True)
+        self._changed += [dest for _, dest in tocopy]
+        try:
+            os_utils.copy_files(tocopy, strategy=self.strategy, verbose=self.verbose, progress=prog)
+        finally:
+            if prog:
+                prog.close()
+        log.debug('%s: %d copied, %d removed, %d unchanged.', self.name, len(tocopy), deleted, len(files) - len(tocopy))
+        self.writeManifest(files)
+        self._changes = None
+
+    def getChangedOutputs(self):
+        if self._changed is None:
+            return super(CopyFilesTarget, self).getChangedOutputs()
+        return self._changed
+
+    def _isCopied(self, dest, signature):
+        try:
+            st = os.stat(dest)
+        except OSError:
+            return False
+        # copy_files() keeps mtimes, so compare those.
+        return [st.st_size, st.st_mtime_ns] == signature
+
+    def _removeEmptyParents(self, reldir):
+        while reldir:
+            try:
+                os.rmdir(os.path.join(self.destination, reldir))
+            except OSError:
+                # Not empty.
+                return
+            reldir = os.path.dirname(reldir)
 
 class RSyncRemoteTarget(SingleBuildTarget):
     BT_LABEL = 'RSYNC'
@@ -346,8 +577,8 @@ class RSyncRemoteTarget(SingleBuildTarget):
                     files += [source]
         super().__init__(target=self.genVirtualTarget(name.replace('\\', '_').replace('/', '_')), files=files, dependencies=dependencies, provides=provides, name=name)
 
-    def is_stale(self):
-        return True
+    def iterStaleReasons(self):
+        yield {'reason': 'always'}
 
     def build(self):
         # call rsync -Rrav --progress *.mp3 root@ss13.nexisonline.net:/host/ss13.nexisonline.net/htdocs/media/
@@ -386,6 +617,10 @@ class ExtractArchiveTarget(SingleBuildTarget):
         self.archive = archive
         super().__init__(target=self.genVirtualTarget(), files=[self.archive, self.target_dir, os.path.abspath(__file__)], dependencies=dependencies, provides=provides)
 
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.archive, self.target_dir = self.files[:2]
+
     def get_config(self):
         return [self.archive, self.target_dir]
     def build(self):
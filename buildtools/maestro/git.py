@@ -67,11 +67,18 @@ class GitSubmoduleCheckTarget(SingleBuildTarget):
     BT_TYPE = 'GitSubmodules'
     BT_LABEL = 'GIT SUBMODULES'
 
+    # Uses os_utils.Chdir, which is process-wide.
+    PARALLEL_SAFE = False
+
     def __init__(self, target=None, gitmodulesfile=None, gitconfigfile=None):
         self.gitconfigfile = gitconfigfile if gitconfigfile is not None else os.path.join('.git','config')
         self.gitmodulesfile = gitmodulesfile if gitmodulesfile is not None else '.gitmodules'
         super().__init__(target='.gitmodules-checked', files=[self.gitconfigfile,self.gitmodulesfile], dependencies=[], provides=[], name=self.gitmodulesfile)
 
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.gitconfigfile, self.gitmodulesfile = self.files
+
     def is_stale(self):
         if super().is_stale():
             return True
@@ -82,7 +89,7 @@ class GitSubmoduleCheckTarget(SingleBuildTarget):
                     return True
         return True
 
-    def provides(self):
+    def calcProvides(self):
         return [self.target, self.gitmodulesfile+'.yml', '.gitconfig.yml']
 
     def build(self):
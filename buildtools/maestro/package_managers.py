@@ -29,6 +29,9 @@ from buildtools.maestro.base_target import SingleBuildTarget
 
 
 class _NPMLikeBuildTarget(SingleBuildTarget):
+    # Uses os_utils.Chdir, which is process-wide.
+    PARALLEL_SAFE = False
+
     def __init__(self, invocation, base_command=None, working_dir='.', opts=[], files=[], target=None, dependencies=[], exe_path=None, specfile=None, lockfile=None, modules_dir=None):
         self.specfile = specfile
         self.lockfile = lockfile
@@ -45,6 +48,29 @@ class _NPMLikeBuildTarget(SingleBuildTarget):
             self.exe_path = os_utils.which(invocation)
         super().__init__(target=target, files=files, dependencies=dependencies)
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['invocation'] = self.invocation
+        dat['base-command'] = self.base_command
+        dat['working-dir'] = self.working_dir
+        dat['opts'] = self.opts
+        dat['exe-path'] = self.exe_path
+        dat['specfile'] = self.specfile
+        dat['lockfile'] = self.lockfile
+        dat['modules-dir'] = self.modules_dir
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.invocation = data['invocation']
+        self.base_command = data.get('base-command')
+        self.working_dir = data.get('working-dir', '.')
+        self.opts = data.get('opts', [])
+        self.exe_path = data.get('exe-path')
+        self.specfile = data.get('specfile')
+        self.lockfile = data.get('lockfile')
+        self.modules_dir = data.get('modules-dir')
+
     def get_lockfile(self):
         return self.lockfile
 
@@ -141,6 +167,15 @@ class ComposerBuildTarget(_NPMLikeBuildTarget):
         super().__init__('composer', base_command=base_command, modules_dir=modules_dir, working_dir=working_dir, opts=opts, target=target, exe_path=composer_path, files=[], dependencies=[], specfile=composer_json, lockfile=composer_lock)
         self.detectAutoloadedFiles()
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['composer-bin-dir'] = self.composer_bin_dir
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.composer_bin_dir = data.get('composer-bin-dir')
+
     def processOpts(self):
         o = [self.exe_path, self.base_command] + self.opts
         o += ['-d', self.working_dir]
@@ -0,0 +1,219 @@
+'''
+Second-tier (shared) storage for the artifact cache.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import os
+import shutil
+import threading
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+import requests
+
+from buildtools.bt_logging import log
+
+
+class RemoteCacheBackend(object):
+    '''
+    Somewhere ArtifactCache can share packed entries with other machines.
+
+    Entries are opaque blobs (tarballs, see ArtifactCache) named by their key.  Backends only move bytes around;
+    ArtifactCache verifies everything it fetches, so a backend doesn't have to be trustworthy, just atomic: a reader
+    must only ever see no blob at all, or a complete one.
+    '''
+
+    def get(self, key: str, fileobj) -> bool:
+        '''
+        Writes the blob stored under key to fileobj.
+
+        :returns bool: False if there's no such blob.
+        '''
+        raise NotImplementedError()
+
+    def put(self, key: str, fileobj) -> None:
+        '''
+        Stores everything readable from fileobj under key, replacing any existing blob.
+        '''
+        raise NotImplementedError()
+
+
+class DirectoryBackend(RemoteCacheBackend):
+    '''
+    Blobs in a local or network-mounted directory, as {root}/{key[:2]}/{key}.tar.
+
+    Blobs are written to a uniquely named temporary file next to their final name and then renamed over it, which is
+    atomic on local filesystems and NFS alike.
+    '''
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def getBlobFile(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + '.tar')
+
+    def get(self, key, fileobj):
+        try:
+            with open(self.getBlobFile(key), 'rb') as f:
+                shutil.copyfileobj(f, fileobj)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key, fileobj):
+        filename = self.getBlobFile(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmpfile = '{}.{}.tmp'.format(filename, uuid.uuid4().hex)
+        try:
+            with open(tmpfile, 'wb') as f:
+                shutil.copyfileobj(fileobj, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmpfile, filename)
+        except BaseException:
+            if os.path.isfile(tmpfile):
+                os.remove(tmpfile)
+            raise
+
+
+class HTTPBackend(RemoteCacheBackend):
+    '''
+    Blobs on a web server, fetched with GET {base_url}/{key} and stored with PUT {base_url}/{key}.
+
+    Works with anything that takes PUTs (nginx's dav module, most artifact stores, serve_directory()).
+    '''
+
+    def __init__(self, base_url: str, headers: dict = None, timeout: float = 30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        # Sessions aren't guaranteed thread-safe, and targets build on several threads.
+        self._local = threading.local()
+        self.headers = headers or {}
+
+    def _getSession(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers.update(self.headers)
+        return session
+
+    def getURL(self, key: str) -> str:
+        return '{}/{}'.format(self.base_url, quote(key))
+
+    def get(self, key, fileobj):
+        with self._getSession().get(self.getURL(key), stream=True, timeout=self.timeout) as r:
+            if r.status_code == 404:
+                return False
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size=65536):
+                fileobj.write(chunk)
+        return True
+
+    def put(self, key, fileobj):
+        r = self._getSession().put(self.getURL(key), data=fileobj, timeout=self.timeout,
+                                   headers={'Content-Type': 'application/x-tar'})
+        r.raise_for_status()
+
+
+def backend_from_uri(uri: str) -> RemoteCacheBackend:
+    '''
+    http:// and https:// URIs get an HTTPBackend, anything else is taken as a directory.
+    '''
+    if uri.startswith(('http://', 'https://')):
+        return HTTPBackend(uri)
+    if uri.startswith('file://'):
+        uri = uri[len('file://'):]
+    return DirectoryBackend(uri)
+
+
+class _DirectoryRequestHandler(BaseHTTPRequestHandler):
+    backend = None
+
+    def _getKey(self):
+        key = self.path.strip('/')
+        if key == '' or '/' in key or key.startswith('.'):
+            self.send_error(400, 'Bad key')
+            return None
+        return key
+
+    def do_GET(self):
+        key = self._getKey()
+        if key is None:
+            return
+        filename = self.backend.getBlobFile(key)
+        try:
+            f = open(filename, 'rb')
+        except FileNotFoundError:
+            self.send_error(404)
+            return
+        with f:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-tar')
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_PUT(self):
+        key = self._getKey()
+        if key is None:
+            return
+        length = int(self.headers.get('Content-Length', '-1'))
+        if length < 0:
+            self.send_error(411)
+            return
+        self.backend.put(key, _LimitedReader(self.rfile, length))
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        log.debug('%s - %s', self.address_string(), format % args)
+
+
+class _LimitedReader(object):
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size) if size > 0 else b''
+        self.remaining -= len(data)
+        return data
+
+
+def serve_directory(root: str, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    '''
+    Minimal HTTP cache server for HTTPBackend, storing blobs like DirectoryBackend does.  Meant for local testing and
+    small setups; it does no authentication.
+
+    :param port: 0 picks a free port; see server.server_address.
+    :returns: The server, already running on a daemon thread.  Call shutdown() on it to stop.
+    '''
+    handler = type('DirectoryRequestHandler', (_DirectoryRequestHandler,), {'backend': DirectoryBackend(root)})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name='remote-cache-server', daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,430 @@
+'''
+Binary rules files for BuildMaestro.saveRules()/loadRules().
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import enum
+import struct
+import sys
+
+from buildtools.maestro.utils import SerializableFileLambda, SerializableLambda
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+#: First bytes of every binary rules file.  The byte after it is the format version.
+MAGIC = b'BTRULES'
+VERSION = 1
+
+# Extension types, for what msgpack can't say on its own.
+EXT_TUPLE = 1
+EXT_SET = 2
+EXT_FROZENSET = 3
+EXT_ENUM = 4
+EXT_OBJECT = 5
+
+_HEADER = struct.Struct('>7sBI')
+
+#: 'module:qualname' -> class, for the only classes whose instances can be stored as plain objects (EXT_OBJECT).  A
+#: rules file can name any class it likes, so nothing else is ever created when loading one.
+OBJECT_TYPES = {}
+
+
+class RulesFormatError(ValueError):
+    pass
+
+
+def is_rules_file(filename):
+    '''
+    :returns bool: filename starts with MAGIC, whatever its version.
+    '''
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_rules(filename, rules):
+    '''
+    :param rules: BuildTarget.serialize() dicts, in the order they were added.
+    '''
+    sections = {}
+    order = []
+    for rule in rules:
+        sectionID = sections.setdefault(rule['type'], len(sections))
+        order.append(sectionID)
+    grouped = [[] for _ in sections]
+    for rule, sectionID in zip(rules, order):
+        grouped[sectionID].append(rule)
+    blobs = [packb(_toRows(section)) for section in grouped]
+    offset = 0
+    table = []
+    for typeID, sectionID in sections.items():
+        table.append([typeID, offset, len(blobs[sectionID]), len(grouped[sectionID])])
+        offset += len(blobs[sectionID])
+    index = packb({'sections': table, 'order': bytes(order) if len(sections) < 256 else order})
+    with open(filename, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(index)))
+        f.write(index)
+        for blob in blobs:
+            f.write(blob)
+
+
+def _toRows(rules):
+    # Rules of one type mostly have the same keys, so each set of keys (a shape) is only stored once.
+    shapes = {}
+    rows = []
+    for rule in rules:
+        shapeID = shapes.setdefault(tuple(rule), len(shapes))
+        rows.append([shapeID] + list(rule.values()))
+    return [[list(shape) for shape in shapes], rows]
+
+
+class RulesFile(object):
+    '''
+    A binary rules file.  Each rule type is stored separately, and only decoded when asked for.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self._data = f.read()
+        if len(self._data) < _HEADER.size:
+            raise RulesFormatError('{}: Not a rules file.'.format(filename))
+        magic, version, indexlen = _HEADER.unpack_from(self._data)
+        if magic != MAGIC:
+            raise RulesFormatError('{}: Not a rules file.'.format(filename))
+        if version != VERSION:
+            raise RulesFormatError('{}: Rules file is version {}, we can only read version {}.'.format(filename, version, VERSION))
+        start = _HEADER.size + indexlen
+        index = unpackb(self._data[_HEADER.size:start])
+        #: BT_TYPE -> (offset, length, number of rules)
+        self.sections = {typeID: (start + offset, length, count) for typeID, offset, length, count in index['sections']}
+        self._types = list(self.sections)
+        self._order = index['order']
+        self._decoded = {}
+
+    def getTypes(self):
+        return list(self._types)
+
+    def getRules(self, typeID):
+        '''
+        :returns list: serialize() dicts of every rule of type typeID.
+        '''
+        rules = self._decoded.get(typeID)
+        if rules is None:
+            offset, length, _ = self.sections[typeID]
+            shapes, rows = unpackb(self._data[offset:offset + length])
+            rules = self._decoded[typeID] = [dict(zip(shapes[row[0]], row[1:])) for row in rows]
+        return rules
+
+    def __len__(self):
+        return len(self._order)
+
+    def iterRules(self, types=None):
+        '''
+        Every rule, in the order they were saved.
+
+        :param types: Only decode and yield rules of these types.
+        '''
+        wanted = [types is None or typeID in types for typeID in self._types]
+        positions = [0] * len(self._types)
+        for sectionID in self._order:
+            if not wanted[sectionID]:
+                continue
+            yield self.getRules(self._types[sectionID])[positions[sectionID]]
+            positions[sectionID] += 1
+
+
+def register_object_type(cls):
+    '''
+    Lets instances of cls be saved in, and loaded from, rules files.  Only for classes that are plain data: loading
+    sets their __dict__ without calling __init__().  Usable as a class decorator.
+    '''
+    OBJECT_TYPES[_class_path(cls)] = cls
+    return cls
+
+
+def _find_enum(path):
+    # Never imports anything, and never goes through descriptors, so naming something in a rules file can't run code.
+    modname, _, qualname = path.partition(':')
+    obj = sys.modules.get(modname)
+    if obj is None:
+        raise RulesFormatError('Enum {} is from module {}, which has not been imported.  Import it before loading rules.'.format(path, modname))
+    for attr in qualname.split('.'):
+        obj = vars(obj).get(attr) if hasattr(obj, '__dict__') else None
+        if obj is None:
+            break
+    if not (isinstance(obj, type) and issubclass(obj, enum.Enum)):
+        raise RulesFormatError('{} is not an enum.Enum subclass.'.format(path))
+    return obj
+
+
+def _find_object_type(path):
+    cls = OBJECT_TYPES.get(path)
+    if cls is None:
+        raise RulesFormatError('{} is not an allowed object type.  See rulesfile.register_object_type().'.format(path))
+    return cls
+
+
+def _class_path(cls):
+    return '{}:{}'.format(cls.__module__, cls.__qualname__)
+
+
+def _baseType(value):
+    for base in (str, int, float):
+        if isinstance(value, base):
+            return base
+
+
+def _default(value):
+    # Called by msgpack for anything it can't pack itself.
+    if isinstance(value, tuple):
+        return msgpack.ExtType(EXT_TUPLE, packb(list(value)))
+    if isinstance(value, frozenset):
+        return msgpack.ExtType(EXT_FROZENSET, packb(list(value)))
+    if isinstance(value, set):
+        return msgpack.ExtType(EXT_SET, packb(list(value)))
+    if isinstance(value, enum.Enum):
+        return msgpack.ExtType(EXT_ENUM, packb([_class_path(type(value)), value.value]))
+    if isinstance(value, (str, int, float)):
+        # Subclasses; strict_types won't take them as-is.
+        return _baseType(value)(value)
+    if _class_path(type(value)) in OBJECT_TYPES:
+        return msgpack.ExtType(EXT_OBJECT, packb([_class_path(type(value)), vars(value)]))
+    raise TypeError('Cannot store {!r} in a rules file.'.format(value))
+
+
+def _ext_hook(code, data):
+    value = unpackb(data)
+    if code == EXT_TUPLE:
+        return tuple(value)
+    if code == EXT_SET:
+        return set(value)
+    if code == EXT_FROZENSET:
+        return frozenset(value)
+    if code == EXT_ENUM:
+        return _find_enum(value[0])(value[1])
+    if code == EXT_OBJECT:
+        cls = _find_object_type(value[0])
+        if not isinstance(value[1], dict) or not all(isinstance(k, str) for k in value[1]):
+            raise RulesFormatError('Bad attributes for {}.'.format(value[0]))
+        obj = cls.__new__(cls)
+        obj.__dict__.update(value[1])
+        return obj
+    raise RulesFormatError('Unknown extension type {}.'.format(code))
+
+
+def packb(value):
+    '''
+    msgpack-encode value, with lists and tuples, sets, enums and plain objects kept apart.
+    '''
+    if msgpack is not None:
+        return msgpack.packb(value, use_bin_type=True, strict_types=True, default=_default)
+    out = []
+    _pack(value, out)
+    return b''.join(out)
+
+
+def unpackb(data):
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False, ext_hook=_ext_hook)
+    value, end = _unpack(data, 0)
+    if end != len(data):
+        raise RulesFormatError('Trailing data.')
+    return value
+
+
+register_object_type(SerializableLambda)
+register_object_type(SerializableFileLambda)
+
+
+# A plain Python msgpack codec, for when the msgpack package isn't installed.  It reads and writes the same bytes.
+
+def _packLength(n, fixbase, fixmax, codes, out):
+    if n <= fixmax:
+        out.append(bytes((fixbase | n,)))
+    elif n < 0x100 and codes[0] is not None:
+        out.append(struct.pack('>BB', codes[0], n))
+    elif n < 0x10000:
+        out.append(struct.pack('>BH', codes[1], n))
+    else:
+        out.append(struct.pack('>BI', codes[2], n))
+
+
+def _packExt(code, data, out):
+    n = len(data)
+    fixed = {1: 0xd4, 2: 0xd5, 4: 0xd6, 8: 0xd7, 16: 0xd8}.get(n)
+    if fixed is not None:
+        out.append(struct.pack('>Bb', fixed, code))
+    elif n < 0x100:
+        out.append(struct.pack('>BBb', 0xc7, n, code))
+    elif n < 0x10000:
+        out.append(struct.pack('>BHb', 0xc8, n, code))
+    else:
+        out.append(struct.pack('>BIb', 0xc9, n, code))
+    out.append(data)
+
+
+def _pack(value, out):
+    t = type(value)
+    if t is str:
+        data = value.encode('utf-8')
+        _packLength(len(data), 0xa0, 31, (0xd9, 0xda, 0xdb), out)
+        out.append(data)
+    elif value is None:
+        out.append(b'\xc0')
+    elif t is bool:
+        out.append(b'\xc3' if value else b'\xc2')
+    elif t is int:
+        if 0 <= value < 0x80:
+            out.append(bytes((value,)))
+        elif -32 <= value < 0:
+            out.append(struct.pack('>b', value))
+        elif value >= 0:
+            if value < 0x100:
+                out.append(struct.pack('>BB', 0xcc, value))
+            elif value < 0x10000:
+                out.append(struct.pack('>BH', 0xcd, value))
+            elif value < 0x100000000:
+                out.append(struct.pack('>BI', 0xce, value))
+            else:
+                out.append(struct.pack('>BQ', 0xcf, value))
+        elif value >= -0x80:
+            out.append(struct.pack('>Bb', 0xd0, value))
+        elif value >= -0x8000:
+            out.append(struct.pack('>Bh', 0xd1, value))
+        elif value >= -0x80000000:
+            out.append(struct.pack('>Bi', 0xd2, value))
+        else:
+            out.append(struct.pack('>Bq', 0xd3, value))
+    elif t is float:
+        out.append(struct.pack('>Bd', 0xcb, value))
+    elif t is list:
+        _packLength(len(value), 0x90, 15, (None, 0xdc, 0xdd), out)
+        for item in value:
+            _pack(item, out)
+    elif t is dict:
+        _packLength(len(value), 0x80, 15, (None, 0xde, 0xdf), out)
+        for k, v in value.items():
+            _pack(k, out)
+            _pack(v, out)
+    elif t is bytes or t is bytearray:
+        _packLength(len(value), 0, -1, (0xc4, 0xc5, 0xc6), out)
+        out.append(bytes(value))
+    else:
+        if isinstance(value, tuple):
+            code, data = EXT_TUPLE, packb(list(value))
+        elif isinstance(value, frozenset):
+            code, data = EXT_FROZENSET, packb(list(value))
+        elif isinstance(value, set):
+            code, data = EXT_SET, packb(list(value))
+        elif isinstance(value, enum.Enum):
+            code, data = EXT_ENUM, packb([_class_path(type(value)), value.value])
+        elif isinstance(value, (str, int, float)):
+            _pack(_baseType(value)(value), out)
+            return
+        elif _class_path(t) in OBJECT_TYPES:
+            code, data = EXT_OBJECT, packb([_class_path(t), vars(value)])
+        else:
+            raise TypeError('Cannot store {!r} in a rules file.'.format(value))
+        _packExt(code, data, out)
+
+
+_UNPACK_FIXED = {
+    0xcc: struct.Struct('>B'), 0xcd: struct.Struct('>H'), 0xce: struct.Struct('>I'), 0xcf: struct.Struct('>Q'),
+    0xd0: struct.Struct('>b'), 0xd1: struct.Struct('>h'), 0xd2: struct.Struct('>i'), 0xd3: struct.Struct('>q'),
+    0xca: struct.Struct('>f'), 0xcb: struct.Struct('>d'),
+}
+_LENGTHS = {1: struct.Struct('>B'), 2: struct.Struct('>H'), 4: struct.Struct('>I')}
+# code -> (kind, width of the length field)
+_SIZED = {
+    0xd9: ('str', 1), 0xda: ('str', 2), 0xdb: ('str', 4),
+    0xc4: ('bin', 1), 0xc5: ('bin', 2), 0xc6: ('bin', 4),
+    0xdc: ('array', 2), 0xdd: ('array', 4),
+    0xde: ('map', 2), 0xdf: ('map', 4),
+    0xc7: ('ext', 1), 0xc8: ('ext', 2), 0xc9: ('ext', 4),
+}
+_FIXEXT = {0xd4: 1, 0xd5: 2, 0xd6: 4, 0xd7: 8, 0xd8: 16}
+
+
+def _unpack(data, pos):
+    code = data[pos]
+    pos += 1
+    if code <= 0x7f:
+        return code, pos
+    if code >= 0xe0:
+        return code - 0x100, pos
+    if 0xa0 <= code <= 0xbf:
+        end = pos + (code & 0x1f)
+        return data[pos:end].decode('utf-8'), end
+    if 0x90 <= code <= 0x9f:
+        return _unpackArray(data, pos, code & 0x0f)
+    if 0x80 <= code <= 0x8f:
+        return _unpackMap(data, pos, code & 0x0f)
+    if code == 0xc0:
+        return None, pos
+    if code == 0xc2:
+        return False, pos
+    if code == 0xc3:
+        return True, pos
+    fixed = _UNPACK_FIXED.get(code)
+    if fixed is not None:
+        return fixed.unpack_from(data, pos)[0], pos + fixed.size
+    if code in _FIXEXT:
+        n = _FIXEXT[code]
+        ext = struct.unpack_from('>b', data, pos)[0]
+        pos += 1
+        return _ext_hook(ext, data[pos:pos + n]), pos + n
+    sized = _SIZED.get(code)
+    if sized is None:
+        raise RulesFormatError('Bad msgpack type 0x{:02x} at {}.'.format(code, pos - 1))
+    kind, width = sized
+    n = _LENGTHS[width].unpack_from(data, pos)[0]
+    pos += width
+    if kind == 'str':
+        return data[pos:pos + n].decode('utf-8'), pos + n
+    if kind == 'bin':
+        return bytes(data[pos:pos + n]), pos + n
+    if kind == 'array':
+        return _unpackArray(data, pos, n)
+    if kind == 'map':
+        return _unpackMap(data, pos, n)
+    ext = struct.unpack_from('>b', data, pos)[0]
+    pos += 1
+    return _ext_hook(ext, data[pos:pos + n]), pos + n
+
+
+def _unpackArray(data, pos, n):
+    items = []
+    for _ in range(n):
+        item, pos = _unpack(data, pos)
+        items.append(item)
+    return items, pos
+
+
+def _unpackMap(data, pos, n):
+    items = {}
+    for _ in range(n):
+        k, pos = _unpack(data, pos)
+        items[k], pos = _unpack(data, pos)
+    return items, pos
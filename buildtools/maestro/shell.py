@@ -52,6 +52,10 @@ class CommandBuildTarget(BuildTarget):
             'echo': self.echo
         }
 
+    def is_parallel_safe(self):
+        # Chdir is process-wide.
+        return self.cwd in ('', '.')
+
     def build(self):
         with os_utils.Chdir(self.cwd):
             os_utils.cmd(self.cmd, show_output=self.show_output, echo=self.should_echo_commands() if self.echo is None else self.echo, critical=True, globbify=self.globbify)
@@ -0,0 +1,149 @@
+'''
+Source map (revision 3) writer for targets that stitch files together.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import json
+import os
+
+_BASE64 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+# UTF-8 continuation bytes, which don't start a character of their own.
+_UTF8_CONTINUATION = bytes(range(0x80, 0xC0))
+# UTF-8 lead bytes of 4-byte sequences, which come out as two UTF-16 code units.
+_UTF8_ASTRAL = bytes(range(0xF0, 0xF8))
+
+
+def vlq_encode(value: int) -> str:
+    '''
+    One source map field, as base64 VLQ.
+    '''
+    value = (-value << 1) | 1 if value < 0 else value << 1
+    out = ''
+    while True:
+        digit = value & 0x1F
+        value >>= 5
+        if value:
+            digit |= 0x20
+        out += _BASE64[digit]
+        if not value:
+            return out
+
+
+def column_width(data, codec=None) -> int:
+    '''
+    How many columns data takes up on a line, as far as a source map is concerned (UTF-16 code units).
+
+    :param data: str, or bytes in codec.
+    :param codec: passthrough_codec() name, for bytes.  Anything but utf-8 is one byte per character.
+    '''
+    if isinstance(data, str):
+        if data.isascii():
+            return len(data)
+        return len(data.encode('utf-16-le')) // 2
+    if codec == 'utf-8':
+        return len(data.translate(None, _UTF8_CONTINUATION)) + len(data) - len(data.translate(None, _UTF8_ASTRAL))
+    return len(data)
+
+
+class SourceMapWriter(object):
+    '''
+    Builds a source map for a file made by appending whole sources one after the other.  Every line from a source is
+    mapped to the start of the same line in that source.
+    '''
+
+    def __init__(self, filename: str, mapfile: str):
+        '''
+        :param filename: The generated file.
+        :param mapfile: Where the map will be written.  sources are made relative to it.
+        '''
+        self.filename = filename
+        self.mapfile = mapfile
+        self.sources = []
+        self._sourceIDs = {}
+        # Encoded segments, one string per generated line.
+        self._lines = ['']
+        self._column = 0
+        # Last segment written, for the relative fields.
+        self._lastColumn = 0
+        self._lastSource = 0
+        self._lastLine = 0
+
+    def append(self, source: str, newlines: int, tail: int):
+        '''
+        Record that source was just appended to the generated file.
+
+        :param newlines: Number of \\n in source.
+        :param tail: column_width() of whatever follows the last \\n (or of all of it, if there's no \\n).
+        '''
+        if not newlines and not tail:
+            return
+        sourceID = self._sourceIDs.get(source)
+        if sourceID is None:
+            sourceID = self._sourceIDs[source] = len(self.sources)
+            self.sources.append(source)
+        if self._lines[-1]:
+            self._lines[-1] += ','
+        self._lines[-1] += vlq_encode(self._column - self._lastColumn) + vlq_encode(sourceID - self._lastSource) + \
+            vlq_encode(-self._lastLine) + 'A'
+        self._lastSource = sourceID
+        self._lastLine = 0
+        self._lastColumn = self._column
+        if not newlines:
+            self._column += tail
+            return
+        # Every other line starts at column 0 and is one line further into the same source.
+        self._lines.extend(['AACA'] * (newlines - 1))
+        self._lines.append('AACA' if tail else '')
+        self._lastLine = newlines if tail else newlines - 1
+        self._lastColumn = 0
+        self._column = tail
+
+    @property
+    def column(self) -> int:
+        '''
+        Where the next source will start on the current generated line.
+        '''
+        return self._column
+
+    def getMap(self) -> dict:
+        mapdir = os.path.dirname(os.path.abspath(self.mapfile))
+        return {
+            'version': 3,
+            'file': os.path.basename(self.filename),
+            'sources': [os.path.relpath(os.path.abspath(source), mapdir).replace(os.sep, '/') for source in self.sources],
+            'names': [],
+            'mappings': ';'.join(self._lines),
+        }
+
+    def write(self, filename=None):
+        with open(filename or self.mapfile, 'w', encoding='utf-8') as f:
+            json.dump(self.getMap(), f, separators=(',', ':'))
+
+    def getURLComment(self) -> str:
+        '''
+        The comment that points browsers at the map, in CSS syntax if the generated file is a .css, JS otherwise.
+        '''
+        url = os.path.basename(self.mapfile)
+        if self.filename.lower().endswith('.css'):
+            return '/*# sourceMappingURL={} */'.format(url)
+        return '//# sourceMappingURL={}'.format(url)
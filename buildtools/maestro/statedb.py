@@ -0,0 +1,113 @@
+'''
+Consolidated build state storage for Maestro.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import json
+import os
+import sqlite3
+import threading
+
+from buildtools import os_utils
+
+
+class BuildStateDB(object):
+    '''
+    One SQLite database holding every target's cache record, keyed by target name.
+
+    Records are read one at a time as targets ask for them, and writes are held in memory until flush(),
+    so a no-op build touches a single file instead of one YAML document per target.
+    '''
+
+    #: Bump when the table layout changes.  Old databases are dropped rather than migrated.
+    SCHEMA_VER = 1
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._conn = None
+        self._lock = threading.RLock()
+        self._pending = {}
+
+    def _connect(self):
+        if self._conn is None:
+            os_utils.ensureDirExists(os.path.dirname(self.filename))
+            self._conn = sqlite3.connect(self.filename, check_same_thread=False)
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if row is None or row[0] != str(self.SCHEMA_VER):
+                with self._conn:
+                    self._conn.execute('DROP TABLE IF EXISTS targets')
+                    self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema', ?)", (str(self.SCHEMA_VER),))
+            self._conn.execute('CREATE TABLE IF NOT EXISTS targets (name TEXT PRIMARY KEY, data TEXT NOT NULL)')
+        return self._conn
+
+    def get(self, name: str) -> dict:
+        '''
+        :returns dict: The record last stored for name, or None.
+        '''
+        with self._lock:
+            if name in self._pending:
+                return self._pending[name]
+            row = self._connect().execute('SELECT data FROM targets WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def put(self, name: str, record: dict):
+        '''
+        Queues a record.  Nothing hits the disk until flush().
+        '''
+        with self._lock:
+            self._pending[name] = record
+
+    def flush(self):
+        with self._lock:
+            if len(self._pending) == 0:
+                return
+            rows = [(name, json.dumps(record, default=str)) for name, record in self._pending.items()]
+            conn = self._connect()
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO targets (name, data) VALUES (?, ?)', rows)
+            self._pending.clear()
+
+    def prune(self, keep) -> int:
+        '''
+        Deletes records for targets not in keep.
+
+        :returns int: Number of records removed.
+        '''
+        keep = set(keep)
+        with self._lock:
+            conn = self._connect()
+            orphans = [(name,) for (name,) in conn.execute('SELECT name FROM targets') if name not in keep]
+            if len(orphans) > 0:
+                with conn:
+                    conn.executemany('DELETE FROM targets WHERE name = ?', orphans)
+            for (name,) in orphans:
+                self._pending.pop(name, None)
+        return len(orphans)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
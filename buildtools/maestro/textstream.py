@@ -0,0 +1,289 @@
+'''
+Chunked text processing for the file I/O targets.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import codecs
+import re
+
+from buildtools.maestro.utils import callLambda
+
+#: Characters read at a time.
+CHUNK_SIZE = 1024 * 1024
+
+_REGEX_SPECIAL = frozenset('.^$*+?{}[]\\|()')
+# Bits of regex that can match a line break.
+_MAY_MATCH_NEWLINE = ('\n', '\\n', '\\s', '\\W', '\\D', '[^', '\\x', '\\0', '\\u', '\\U', '\\N', '(?s')
+# Bits of regex that care what comes before or after the line: where the string ends, or lookarounds.
+_SEES_PAST_LINE = ('$', '\\A', '\\Z', '\\B', '(?=', '(?!', '(?<')
+
+
+def iter_line_chunks(f, chunk_size=CHUNK_SIZE):
+    '''
+    Reads a text file in chunks that end on a line break, except the last, which is whatever follows the final line
+    break and may be empty.  Memory use is bounded by chunk_size plus the longest line.
+    '''
+    parts = []
+    while True:
+        block = f.read(chunk_size)
+        if not block:
+            break
+        end = block.rfind('\n') + 1
+        if end == 0:
+            parts.append(block)
+            continue
+        parts.append(block[:end])
+        yield ''.join(parts)
+        parts = [block[end:]]
+    yield ''.join(parts)
+
+
+def passthrough_codec(read_encoding, write_encoding):
+    '''
+    Can text read as read_encoding be copied into a file written as write_encoding byte for byte, BOMs aside?  Only
+    for codecs where \\r and \\n are always single bytes of their own, so newlines can be fixed up without decoding.
+
+    :returns str: The codec they share, or None if the text has to be transcoded.
+    '''
+    read = _baseCodec(read_encoding)
+    if read != _baseCodec(write_encoding):
+        return None
+    if read in ('utf-8', 'ascii') or read.startswith(('iso8859-', 'cp125')):
+        return read
+    return None
+
+
+def _baseCodec(encoding):
+    name = codecs.lookup(encoding).name
+    return 'utf-8' if name == 'utf-8-sig' else name
+
+
+def skip_bom(f, encoding):
+    '''
+    Moves binary file f past a UTF-8 BOM, if encoding is one that would have eaten it.
+    '''
+    if codecs.lookup(encoding).name != 'utf-8-sig':
+        return
+    start = f.tell()
+    if f.read(len(codecs.BOM_UTF8)) != codecs.BOM_UTF8:
+        f.seek(start)
+
+
+def copy_normalizing_newlines(fsrc, fdst, chunk_size=CHUNK_SIZE):
+    '''
+    Copies binary file fsrc to fdst, turning \\r\\n and lone \\r into \\n as it goes.  Only for passthrough_codec() codecs.
+
+    :returns int: Bytes read.
+    '''
+    nread = 0
+    pending_cr = False
+    while True:
+        chunk = fsrc.read(chunk_size)
+        if not chunk:
+            break
+        nread += len(chunk)
+        if pending_cr:
+            chunk = b'\r' + chunk
+        # A \r at the end might be the first half of a \r\n.
+        pending_cr = chunk.endswith(b'\r')
+        if pending_cr:
+            chunk = chunk[:-1]
+        fdst.write(chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n'))
+    if pending_cr:
+        fdst.write(b'\n')
+    return nread
+
+
+def split_lines(text):
+    '''
+    Like str.splitlines(keepends=True), but only \\n ends a line, and the empty string is one empty line.
+    '''
+    lines = text.split('\n')
+    last = lines.pop()
+    lines = [line + '\n' for line in lines]
+    if last or not lines:
+        lines.append(last)
+    return lines
+
+
+def _isLiteral(needle, replacement):
+    return (isinstance(needle, str) and isinstance(replacement, str) and needle != '' and '\n' not in needle
+            and _REGEX_SPECIAL.isdisjoint(needle) and '\\' not in replacement)
+
+
+def _overlaps(a, b):
+    # Could a match of a and a match of b share characters?
+    if a in b or b in a:
+        return True
+    for n in range(1, min(len(a), len(b))):
+        if a.endswith(b[:n]) or b.endswith(a[:n]):
+            return True
+    return False
+
+
+class _LiteralStep(object):
+    '''
+    Several plain-text needles, swapped in one pass.
+    '''
+
+    def __init__(self):
+        self.table = {}
+        self.pattern = None
+
+    def canAdd(self, needle, replacement):
+        if needle in self.table:
+            return False
+        for other, other_replacement in self.table.items():
+            # Earlier replacements mustn't be able to form later needles, and needles mustn't compete for text.  An
+            # empty replacement joins what was either side of it, which can form anything longer than a character.
+            joins = other_replacement == '' and len(needle) > 1
+            if joins or not set(other_replacement).isdisjoint(needle) or _overlaps(other, needle):
+                return False
+        return True
+
+    def add(self, needle, replacement):
+        self.table[needle] = replacement
+
+    def compile(self):
+        if len(self.table) > 1:
+            self.pattern = re.compile('|'.join(re.escape(needle) for needle in self.table))
+
+    def mayReshape(self):
+        return any('\n' in replacement for replacement in self.table.values())
+
+    def sub(self, text):
+        if self.pattern is None:
+            needle, replacement = next(iter(self.table.items()))
+            return text.replace(needle, replacement)
+        table = self.table
+        return self.pattern.sub(lambda m: table[m.group(0)], text)
+
+    subLine = sub
+
+
+class _RegexStep(object):
+    '''
+    One regex, applied a line at a time so ^, $ and friends mean what they did when every line was processed alone.
+    '''
+
+    def __init__(self, needle, replacement, flags=0, perLine=True):
+        self.pattern = re.compile(needle, flags)
+        self.replacement = replacement
+        self.perLine = perLine
+        # Finds the lines worth handing to pattern, without splitting the chunk up.  A line can only match pattern if
+        # this matches somewhere in it, as long as pattern doesn't care where the string ends or what's around it.
+        # With re.MULTILINE, $ would also match before every line break, so \s+$ would skip lines it should have hit.
+        self.finder = None
+        if perLine and not any(token in self.pattern.pattern for token in _SEES_PAST_LINE):
+            self.finder = re.compile(needle, flags | re.MULTILINE)
+
+    def mayReshape(self):
+        # Could this add, move or remove line breaks?  Erring on the side of yes.
+        if not isinstance(self.replacement, str) or '\n' in self.replacement or '\\' in self.replacement:
+            return True
+        if self.pattern.flags & re.DOTALL or any(token in self.pattern.pattern for token in _MAY_MATCH_NEWLINE):
+            return True
+        # A match at the very end of a line, after its line break, puts text at the start of the next one.
+        return self.pattern.search('\n', 1) is not None
+
+    def subLine(self, line):
+        return self.pattern.sub(self.replacement, line)
+
+    def sub(self, text):
+        if not self.perLine:
+            return self.pattern.sub(self.replacement, text)
+        sub = self.pattern.sub
+        replacement = self.replacement
+        if self.finder is None:
+            return ''.join([sub(replacement, line) for line in split_lines(text)])
+        out = []
+        done = 0
+        search = self.finder.search
+        while True:
+            m = search(text, done)
+            if m is None or (m.start() == len(text) and text.endswith('\n')):
+                # The second is ^ matching after the final line break, where there's no line.
+                break
+            start = text.rfind('\n', 0, m.start()) + 1
+            end = text.find('\n', m.start()) + 1 or len(text)
+            out.append(text[done:start])
+            out.append(sub(replacement, text[start:end]))
+            # Next line, not the end of the match: it may have run into lines that have matches of their own.
+            done = end
+            if done >= len(text):
+                break
+        if not out:
+            return text
+        out.append(text[done:])
+        return ''.join(out)
+
+
+class Replacer(object):
+    '''
+    Applies ReplaceTextTarget.replacements, in order, with every pattern compiled once.
+
+    Runs of plain-text needles are merged into a single alternation when that gives the same result as replacing them
+    one after another.
+    '''
+
+    def __init__(self, replacements, multiline=False):
+        '''
+        :param replacements: needle -> replacement, as for re.sub().
+        :param multiline: sub() gets the whole file: patterns may span lines, and ^ and $ match at each line.
+        '''
+        self.steps = []
+        literals = None
+        for needle, replacement in replacements.items():
+            needle = callLambda(needle)
+            if not multiline and _isLiteral(needle, replacement):
+                if literals is None or not literals.canAdd(needle, replacement):
+                    literals = _LiteralStep()
+                    self.steps.append(literals)
+                literals.add(needle, replacement)
+            else:
+                literals = None
+                if multiline:
+                    self.steps.append(_RegexStep(needle, replacement, re.MULTILINE, perLine=False))
+                else:
+                    self.steps.append(_RegexStep(needle, replacement))
+        for step in self.steps:
+            if isinstance(step, _LiteralStep):
+                step.compile()
+        # Each step normally runs over a whole chunk.  That's only the same as running them all on one line, then the
+        # next, if no step followed by another can change where lines start and end.  Literal steps count too: 'ab'
+        # mustn't match across a line break that an earlier \s removed.
+        self.chunked = multiline or not any(step.mayReshape() for step in self.steps[:-1])
+
+    def sub(self, text):
+        '''
+        :param text: Whole lines, ending in \\n (except at EOF), or the whole file in multiline mode.
+        '''
+        if not self.chunked:
+            return ''.join([self.subLine(line) for line in split_lines(text)])
+        for step in self.steps:
+            text = step.sub(text)
+        return text
+
+    def subLine(self, line):
+        for step in self.steps:
+            line = step.subLine(line)
+        return line
@@ -23,7 +23,10 @@ SOFTWARE.
 
 '''
 import codecs
+import enum
+import os
 
+from buildtools.bt_logging import log
 from buildtools.utils import img2blob
 
 #from ruamel.yaml import YAML
@@ -62,3 +65,100 @@ def callLambda(var):
     elif isinstance(var, SerializableFileLambda):
         var = var()
     return var
+
+
+def hashConfig(value, hasher):
+    '''
+    Feeds a canonical encoding of value (usually BuildTarget.get_config()) to hasher and returns hasher.hexdigest().
+
+    Takes JSON-like values (str, int, float, bool, None, and lists, tuples, dicts and sets of them), plus bytes, paths,
+    enums, SerializableLambda and SerializableFileLambda.  Dicts and sets are order-independent, lists and tuples hash
+    the same, and enums go by class and value, so the result is stable between runs.
+
+    Anything else is hashed by its class and repr(), with a warning the first time each type turns up, since that
+    may not be stable (functions, objects whose repr() has an address in it).
+
+    :raises TypeError: value contains itself.
+    '''
+    out = []
+    _encodeConfig(value, out, set())
+    hasher.update(b''.join(out))
+    return hasher.hexdigest()
+
+
+def _encodeBlob(tag, data, out):
+    out.append(tag + str(len(data)).encode('ascii') + b':' + data)
+
+
+def _encodeConfig(value, out, active):
+    # Ordered roughly by how often they turn up in get_config().
+    if isinstance(value, str):
+        _encodeBlob(b's', value.encode('utf-8', 'surrogatepass'), out)
+    elif value is None:
+        out.append(b'N')
+    elif value is True or value is False:
+        out.append(b'T' if value else b'F')
+    elif isinstance(value, enum.Enum):
+        _encodeBlob(b'e', '{}.{}'.format(type(value).__module__, type(value).__qualname__).encode('utf-8'), out)
+        _encodeConfig(value.value, out, active)
+    elif isinstance(value, int):
+        _encodeBlob(b'i', str(value).encode('ascii'), out)
+    elif isinstance(value, float):
+        _encodeBlob(b'f', value.hex().encode('ascii'), out)
+    elif isinstance(value, (list, tuple, dict, set, frozenset, SerializableLambda, SerializableFileLambda)):
+        if id(value) in active:
+            raise TypeError('Config contains itself.')
+        active.add(id(value))
+        try:
+            _encodeContainer(value, out, active)
+        finally:
+            active.discard(id(value))
+    elif isinstance(value, (bytes, bytearray)):
+        _encodeBlob(b'b', bytes(value), out)
+    elif isinstance(value, os.PathLike):
+        _encodeBlob(b'p', os.fspath(value).encode('utf-8', 'surrogateescape'), out)
+    else:
+        typename = '{}.{}'.format(type(value).__module__, type(value).__qualname__)
+        if typename not in _warnedTypes:
+            _warnedTypes.add(typename)
+            log.warning('Hashing %s in a config by its repr(), which may change between runs.  Use JSON-like values, enums or SerializableLambda.', typename)
+        _encodeBlob(b'r', typename.encode('utf-8'), out)
+        _encodeBlob(b's', repr(value).encode('utf-8', 'surrogatepass'), out)
+
+
+#: Types _encodeConfig() has already warned about.
+_warnedTypes = set()
+
+
+def _encodeSorted(tag, encoded, out):
+    encoded.sort()
+    out.append(tag + str(len(encoded)).encode('ascii') + b'[')
+    out.extend(encoded)
+    out.append(b']')
+
+
+def _encodeContainer(value, out, active):
+    if isinstance(value, (list, tuple)):
+        out.append(b'l' + str(len(value)).encode('ascii') + b'[')
+        for item in value:
+            _encodeConfig(item, out, active)
+        out.append(b']')
+    elif isinstance(value, dict):
+        items = []
+        for k, v in value.items():
+            item = []
+            _encodeConfig(k, item, active)
+            _encodeConfig(v, item, active)
+            items.append(b''.join(item))
+        _encodeSorted(b'd', items, out)
+    elif isinstance(value, (set, frozenset)):
+        items = []
+        for v in value:
+            item = []
+            _encodeConfig(v, item, active)
+            items.append(b''.join(item))
+        _encodeSorted(b'S', items, out)
+    else:
+        # SerializableLambda and SerializableFileLambda: class name plus attributes.
+        _encodeBlob(b'o', '{}.{}'.format(type(value).__module__, type(value).__qualname__).encode('utf-8'), out)
+        _encodeConfig(vars(value), out, active)
@@ -0,0 +1,227 @@
+'''
+File watchers for BuildMaestro.watch().
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from buildtools.bt_logging import log
+
+
+class FileWatcher(object):
+    '''
+    Reports which of a set of files changed.  Paths are absolute.
+    '''
+
+    def setPaths(self, paths):
+        '''
+        Replace the set of files being watched.
+        '''
+        raise NotImplementedError()
+
+    def wait(self, timeout=None):
+        '''
+        Block until something changes, or timeout seconds pass.
+
+        :returns set: Watched paths that were changed, created, deleted or renamed.  Empty on timeout.
+        '''
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class PollingWatcher(FileWatcher):
+    '''
+    stat()s every file each interval.  Works anywhere, including network filesystems inotify can't see into.
+    '''
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self._signatures = {}
+
+    @staticmethod
+    def _signature(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def setPaths(self, paths):
+        old = self._signatures
+        self._signatures = {path: old[path] if path in old else self._signature(path) for path in paths}
+
+    def poll(self):
+        changed = set()
+        for path, signature in self._signatures.items():
+            current = self._signature(path)
+            if current != signature:
+                self._signatures[path] = current
+                changed.add(path)
+        return changed
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self.poll()
+            if changed:
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+                continue
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return changed
+            time.sleep(min(self.interval, left))
+
+
+class InotifyWatcher(FileWatcher):
+    '''
+    Linux inotify, through libc.  Watches the directory each file is in rather than the file itself, so editors that
+    save by writing a new file and renaming it over the old one are still seen.  Watched directories are also watched
+    themselves, and reported when anything in them changes.
+    '''
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    _EVENT = struct.Struct('iIII')
+
+    _libc = None
+
+    @classmethod
+    def isAvailable(cls):
+        if not sys.platform.startswith('linux'):
+            return False
+        if cls._libc is None:
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+                libc.inotify_init1
+            except (OSError, AttributeError):
+                return False
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+            cls._libc = libc
+        return True
+
+    def __init__(self):
+        if not self.isAvailable():
+            raise OSError('inotify is not available.')
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._paths = set()
+        # dirname -> watch descriptor, and back.
+        self._wds = {}
+        self._dirs = {}
+
+    def setPaths(self, paths):
+        self._paths = set(paths)
+        dirs = {os.path.dirname(path) for path in self._paths}
+        dirs.update(path for path in self._paths if os.path.isdir(path))
+        for dirname in set(self._wds) - dirs:
+            self._libc.inotify_rm_watch(self._fd, self._wds.pop(dirname))
+        for dirname in dirs - set(self._wds):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirname), self.MASK)
+            if wd < 0:
+                # Doesn't exist (yet), or we've hit fs.inotify.max_user_watches.
+                errno = ctypes.get_errno()
+                log.warning('Cannot watch %s: %s', dirname, os.strerror(errno))
+                continue
+            self._wds[dirname] = wd
+            self._dirs[wd] = dirname
+
+    def _readEvents(self):
+        changed = set()
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, namelen = self._EVENT.unpack_from(buf, offset)
+            offset += self._EVENT.size
+            name = buf[offset:offset + namelen].rstrip(b'\0')
+            offset += namelen
+            if mask & self.IN_Q_OVERFLOW:
+                # Lost events: assume everything changed.
+                return set(self._paths)
+            if mask & self.IN_IGNORED:
+                # The directory went away.
+                self._wds.pop(self._dirs.pop(wd, None), None)
+                continue
+            dirname = self._dirs.get(wd)
+            if dirname is None or not name:
+                continue
+            path = os.path.join(dirname, os.fsdecode(name))
+            if path in self._paths:
+                changed.add(path)
+            elif dirname in self._paths:
+                # Something new in a watched directory.
+                changed.add(dirname)
+        return changed
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            left = None if deadline is None else max(0.0, deadline - time.monotonic())
+            readable, _, _ = select.select([self._fd], [], [], left)
+            if not readable:
+                return set()
+            changed = self._readEvents()
+            if changed:
+                return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def new_watcher(poll_interval=None):
+    '''
+    :param poll_interval: Force a PollingWatcher that checks this often, in seconds.
+    :returns FileWatcher: inotify where we have it, polling otherwise.
+    '''
+    if poll_interval is None and InotifyWatcher.isAvailable():
+        try:
+            return InotifyWatcher()
+        except OSError as e:
+            log.warning('inotify failed (%s), falling back to polling.', e)
+    return PollingWatcher(poll_interval or 0.5)
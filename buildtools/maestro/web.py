@@ -35,6 +35,8 @@ from buildtools.maestro.base_target import SingleBuildTarget
 
 REG_SCSS_IMPORT = re.compile(r"@import '([^']+)';")
 class _BaseSCSSBuildTarget(SingleBuildTarget):
+    CACHE_ARTIFACTS = True
+
     def __init__(self, target=None, files=[], dependencies=[], import_paths=[], output_style='compact', sass_path=None, imported=[]):
         super().__init__(target, files, dependencies)
 
@@ -81,6 +83,7 @@ class _BaseSCSSBuildTarget(SingleBuildTarget):
         dat['imports'] = self.import_paths
         dat['style'] = self.output_style
         dat['imported'] = self.imported
+        dat['sass-path'] = self.sass_path
         return dat
 
     def deserialize(self, data):
@@ -89,6 +92,7 @@ class _BaseSCSSBuildTarget(SingleBuildTarget):
         self.import_paths = data.get('imports', [])
         self.output_style = data.get('style', 'compact')
         self.imported = data.get('imported', [])
+        self.sass_path = data.get('sass-path')
 
     def get_config(self):
         return {
@@ -111,6 +115,15 @@ class DartSCSSBuildTarget(_BaseSCSSBuildTarget):
                 log.warn('Unable to find sass on this OS.  Is it in PATH?  Remember to run `npm install -g sass`!')
         super().__init__(target, files, dependencies, import_paths=import_paths, output_style=output_style, sass_path=sass_path, imported=imported)
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['source-map'] = self.source_map
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.source_map = data.get('source-map', self.output_style == 'expanded')
+
     def build(self):
         sass_cmd = []
 
@@ -177,6 +190,7 @@ class RubySCSSBuildTarget(_BaseSCSSBuildTarget):
 class SCSSConvertTarget(SingleBuildTarget):
     BT_TYPE = 'SCSSConvert'
     BT_LABEL = 'SCSSCONVERT'
+    CACHE_ARTIFACTS = True
 
     def __init__(self, target=None, files=[], dependencies=[], sass_convert_path=None):
         super(SCSSConvertTarget, self).__init__(target, files, dependencies)
@@ -186,6 +200,15 @@ class SCSSConvertTarget(SingleBuildTarget):
                 log.warn('Unable to find sass-convert on this OS.  Is it in PATH?  Remember to run `gem install sass compass`!')
         self.sass_convert_path = sass_convert_path
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['sass-convert-path'] = self.sass_convert_path
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.sass_convert_path = data.get('sass-convert-path')
+
     def get_config(self):
         return [self.sass_convert_path]
 
@@ -205,6 +228,7 @@ class SCSSConvertTarget(SingleBuildTarget):
 class SVG2PNGBuildTarget(SingleBuildTarget):
     BT_TYPE = 'SVG2PNG'
     BT_LABEL = 'SVG2PNG'
+    CACHE_ARTIFACTS = True
 
     def __init__(self, target, inputfile, height, width, dependencies=[], inkscape=None):
         self.height = height
@@ -217,6 +241,19 @@ class SVG2PNGBuildTarget(SingleBuildTarget):
 
         super(SVG2PNGBuildTarget, self).__init__(target, files=[inputfile], dependencies=dependencies)
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['height'] = self.height
+        dat['width'] = self.width
+        dat['inkscape'] = self.inkscape
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.height = data['height']
+        self.width = data['width']
+        self.inkscape = data['inkscape']
+
     def get_config(self):
         return {'height': self.height, 'width': self.width, 'path': self.inkscape}
 
@@ -228,6 +265,7 @@ class SVG2PNGBuildTarget(SingleBuildTarget):
 class ICOBuildTarget(SingleBuildTarget):
     BT_TYPE = 'ICO'
     BT_LABEL = 'ICO'
+    CACHE_ARTIFACTS = True
 
     def __init__(self, target, inputfiles, dependencies=[], convert_executable=None):
         self.convert_executable = convert_executable
@@ -235,6 +273,15 @@ class ICOBuildTarget(SingleBuildTarget):
             self.convert_executable = os_utils.which('convert')
         super(ICOBuildTarget, self).__init__(target, files=inputfiles, dependencies=dependencies)
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['convert-executable'] = self.convert_executable
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.convert_executable = data.get('convert-executable')
+
     def get_config(self):
         return {'path': self.convert_executable}
 
@@ -249,6 +296,7 @@ class ICOBuildTarget(SingleBuildTarget):
 class UglifyJSTarget(SingleBuildTarget):
     BT_TYPE = 'UglifyJS'
     BT_LABEL = 'UGLIFYJS'
+    CACHE_ARTIFACTS = True
 
     def __init__(self, target, inputfile, dependencies=[], compress=True, mangle=True, options=[], compress_opts=[], mangle_opts=[], uglify_executable=None):
         self.uglifyjs_executable = uglify_executable
@@ -264,6 +312,17 @@ class UglifyJSTarget(SingleBuildTarget):
         self.options += options
         super(UglifyJSTarget, self).__init__(target, files=[inputfile], dependencies=dependencies)
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['uglifyjs-executable'] = self.uglifyjs_executable
+        dat['options'] = self.options
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.uglifyjs_executable = data.get('uglifyjs-executable')
+        self.options = data.get('options', [])
+
     def get_config(self):
         return {'path': self.uglifyjs_executable, 'opts':self.options}
 
@@ -276,6 +335,7 @@ class UglifyJSTarget(SingleBuildTarget):
 class MinifySVGTarget(SingleBuildTarget):
     BT_TYPE = 'MinifySVG'
     BT_LABEL = 'SVGO'
+    CACHE_ARTIFACTS = True
 
     def __init__(self, target, source, dependencies=[], svgo_opts=['-q'], svgo_executable=None):
         self.source = source
@@ -289,6 +349,18 @@ class MinifySVGTarget(SingleBuildTarget):
         super(MinifySVGTarget, self).__init__(target, dependencies=dependencies, files=[
             self.source, os.path.abspath(__file__)])
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['svgo-opts'] = self.svgo_opts
+        dat['svgo-cmd'] = self.svgo_cmd
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.source = self.files[0]
+        self.svgo_opts = data.get('svgo-opts', ['-q'])
+        self.svgo_cmd = data.get('svgo-cmd')
+
     def build(self):
         os_utils.ensureDirExists(os.path.dirname(self.target))
         os_utils.cmd([self.svgo_cmd, '-i', self.source, '-o', self.target] + self.svgo_opts, echo=self.should_echo_commands(), show_output=True, critical=True)
@@ -317,6 +389,16 @@ class DatafyImagesTarget(SingleBuildTarget):
         self.basedir = basedir
         super().__init__(target, dependencies=dependencies, files=[infile, os.path.abspath(__file__)])
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['basedir'] = self.basedir
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.infile = self.files[0]
+        self.basedir = data['basedir']
+
     def build(self):
         convert_imgurls_to_dataurls(self.infile, self.target, self.basedir)
 
@@ -341,6 +423,28 @@ class CacheBashifyFiles(SingleBuildTarget):
         self.flags       = flags if flags is not None else (EBashLayoutFlags.PREFIX|EBashLayoutFlags.NAME)
         target = self.genVirtualTarget(self.source.replace(os.sep, '_').replace('.','_'))
         super().__init__(target=target, dependencies=dependencies, files=[source, os.path.abspath(__file__)])
+        # calcFilename(), until resetMemos().
+        self._filenames = None
+
+    def serialize(self):
+        dat = super().serialize()
+        dat['source'] = self.source
+        dat['destdir'] = self.destdir
+        dat['basedirsrc'] = self.basedirsrc
+        dat['basedirdest'] = self.basedirdest
+        dat['manifest'] = self.manifest
+        dat['flags'] = int(self.flags)
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.source = data['source']
+        self.destdir = data['destdir']
+        self.basedirsrc = data.get('basedirsrc', '.')
+        self.basedirdest = data.get('basedirdest')
+        self.manifest = data['manifest']
+        self.flags = EBashLayoutFlags(data.get('flags', EBashLayoutFlags.PREFIX|EBashLayoutFlags.NAME))
+        self._filenames = None
 
     def get_config(self):
         return {
@@ -361,7 +465,20 @@ class CacheBashifyFiles(SingleBuildTarget):
             self.removeFile(self.manifest)
         super().clean()
 
+    def resetMemos(self):
+        super().resetMemos()
+        self._filenames = None
+
     def calcFilename(self):
+        '''
+        :returns tuple: (source relative to basedirsrc, output relative to destdir, absolute output).  Hashes the
+            source once per run.
+        '''
+        if self._filenames is None:
+            self._filenames = self._calcFilename()
+        return self._filenames
+
+    def _calcFilename(self):
         srchash = utils.md5sum(self.source)
         sourcefilerel = os.path.relpath(self.source, self.basedirsrc)
         dirname = os.path.dirname(sourcefilerel)
@@ -396,14 +513,14 @@ class CacheBashifyFiles(SingleBuildTarget):
             _, relfilename, _ = self.calcFilename()
         return relfilename
 
-    def provides(self):
-        o = super().provides()
+    def calcProvides(self):
+        o = list(super().calcProvides())
         #o += [self.manifest]
         if os.path.isfile(self.source):
             o += [self.get_displayed_name()]
         return o
 
-    def is_stale(self):
+    def iterStaleReasons(self):
         '''
         sourcefilerel, reloutfile, absoutfile = self.calcFilename()
         #print(absoutfile)
@@ -420,7 +537,7 @@ class CacheBashifyFiles(SingleBuildTarget):
                 json.dump(manifest_data, f, indent=2)
             return False
         '''
-        return True
+        yield {'reason': 'always'}
 
     def build(self):
         sourcefilerel, reloutfile, absoutfile = self.calcFilename()
@@ -443,7 +560,7 @@ class CacheBashifyFiles(SingleBuildTarget):
                 self.removeFile(oldfilename)
 
         os_utils.ensureDirExists(os.path.dirname(absoutfile), noisy=True)
-        os_utils.single_copy(self.source, absoutfile, verbose=False)
+        os_utils.single_copy(self.source, absoutfile, verbose=False, file_cache=self.maestro.fileCache)
 
         manifest_data[sourcefilerel] = outfile
 
@@ -472,6 +589,25 @@ class DownloadFileTarget(SingleBuildTarget):
         self.etagfile: str = ''
         super().__init__(target, dependencies=dependencies, files=[url, os.path.abspath(__file__)])
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['cache'] = self.cache
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.url = self.files[0]
+        self.urlchunks = urlparse(self.url)
+        self.cache = data.get('cache', True)
+        # Filled in by _updateCacheInfo().
+        self.cache_dir = ''
+        self.fileid = ''
+        self.etagdir = ''
+        self.old_uri_id = ''
+        self.uri_id = ''
+        self.cached_dl = ''
+        self.etagfile = ''
+
 
     def get_displayed_name(self):
         return '{} -> {}'.format(self.url, self.target)
@@ -522,7 +658,7 @@ class DownloadFileTarget(SingleBuildTarget):
         os_utils.ensureDirExists(os.path.dirname(self.cached_dl))
         http.DownloadFile(self.url, self.cached_dl, log_after=True, print_status=True, log_before=True)
         os_utils.ensureDirExists(os.path.dirname(self.target))
-        os_utils.single_copy(self.cached_dl, self.target, as_file=True, verbose=True)
+        os_utils.single_copy(self.cached_dl, self.target, as_file=True, verbose=True, file_cache=self.maestro.fileCache)
         if not self.cache:
             os.remove(self.cached_dl)
 
@@ -545,6 +681,21 @@ class WebifyTarget(SingleBuildTarget):
         self.intermediate_filename = destbasename + '.' + (srcext.strip('.'))
         super().__init__(destination, dependencies=dependencies, files=[os.path.abspath(__file__), self.source, self.webify])
 
+    def serialize(self):
+        dat = super().serialize()
+        dat['source'] = self.source
+        dat['destination'] = self.destination
+        dat['webify'] = self.webify
+        dat['intermediate-filename'] = self.intermediate_filename
+        return dat
+
+    def deserialize(self, data):
+        super().deserialize(data)
+        self.source = data['source']
+        self.destination = self.target = data['destination']
+        self.webify = data['webify']
+        self.intermediate_filename = data['intermediate-filename']
+
     def get_config(self):
         return {
             'source': self.source,
@@ -553,7 +704,7 @@ class WebifyTarget(SingleBuildTarget):
             'intermediate_filename': self.intermediate_filename,
         }
 
-    def provides(self):
+    def calcProvides(self):
         base,_ = os.path.splitext(self.intermediate_filename)
         o=[]
         for ext in ['eot', 'woff', 'ttf', 'svg']:
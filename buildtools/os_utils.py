@@ -23,6 +23,7 @@ SOFTWARE.
 
 '''
 import codecs
+import errno
 import filecmp
 import glob
 import os
@@ -30,6 +31,7 @@ import platform
 import re
 import shlex
 import shutil
+import stat
 import subprocess
 import sys
 import tarfile
@@ -38,7 +40,9 @@ import tqdm
 import typing
 import zipfile
 
+from buildtools import tracing
 from buildtools.bt_logging import log
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 from subprocess import CalledProcessError
 
@@ -193,7 +197,8 @@ class BuildEnv(object):
 
 def ensureDirExists(path, mode=0o777, noisy=False):
     if path != '' and not os.path.isdir(path):
-        os.makedirs(path, mode)
+        # Another thread may get there first.
+        os.makedirs(path, mode, exist_ok=True)
         if noisy:
             log.info('Created %s.', path)
 
@@ -287,6 +292,13 @@ def _cmd_handle_env(env):
     return new_env
 
 
+def _cmd_span(command):
+    # Only build the command line if someone's going to see it.
+    if not tracing.active() or not command:
+        return tracing.NULL_SPAN
+    return tracing.span(os.path.basename(command[0]), 'subprocess', command=_args2str(command))
+
+
 def _cmd_handle_args(command, globbify):
     # Shell-style globbin'.
     new_args = []  # command[0]]
@@ -375,7 +387,10 @@ def cmd(command, echo=False, env=None, show_output=True, critical=False, globbif
     output = ''
     try:
         if show_output:
-            code = subprocess.call(command, env=new_env, shell=False)
+            with _cmd_span(command) as args:
+                code = subprocess.call(command, env=new_env, shell=False)
+                if args is not None:
+                    args['exit-code'] = code
             #print(repr(code))
             success = code in acceptable_exit_codes
             if critical and not success:
@@ -383,7 +398,8 @@ def cmd(command, echo=False, env=None, show_output=True, critical=False, globbif
             return success
         else:
             # Using our own customized check_output for acceptable_exit_codes.
-            output = check_output(command, env=new_env, stderr=subprocess.STDOUT, acceptable_exit_codes=acceptable_exit_codes)
+            with _cmd_span(command):
+                output = check_output(command, env=new_env, stderr=subprocess.STDOUT, acceptable_exit_codes=acceptable_exit_codes)
             return True
     except CalledProcessError as cpe:
         log.error(cpe.output)
@@ -409,7 +425,8 @@ def cmd_output(command, echo=False, env=None, critical=False, globbify=True) ->
         log.info('$ ' + _args2str(command))
 
     try:
-        return subprocess.Popen(command, env=new_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
+        with _cmd_span(command):
+            return subprocess.Popen(command, env=new_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
     except Exception as e:
         log.error(repr(command))
         if critical:
@@ -427,8 +444,9 @@ def cmd_out(command: Union[List[str], str], echo=False, env=None, critical=False
         log.info('$ ' + _args2str(command))
 
     try:
-        p = subprocess.Popen(command, env=new_env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=True)
-        return p.stdout.read().decode('utf-8')
+        with _cmd_span(command):
+            p = subprocess.Popen(command, env=new_env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=True)
+            return p.stdout.read().decode('utf-8')
     except Exception as e:
         log.error(repr(command))
         if critical:
@@ -476,21 +494,42 @@ def old_copytree(src, dst, symlinks=False, ignore=None):
 
 def canCopy(src, dest, **op_args):
     '''
+    Does dest need (re)copying from src?  Never reads either file: a copy that still has src's size and mtime, or is
+    src (hardlinked or symlinked), is up to date.  Files with the same size but different mtimes are compared by hash
+    if file_cache is given, and copied otherwise, which costs no more than comparing them would.
+
     :param ignore_mtime bool:
         Ignore file modification timestamps.
     :param ignore_filecmp bool:
-        Disable byte-to-byte comparison AND os.stat checks.
+        Disable content AND os.stat checks.
     :param ignore_bytecmp bool:
-        Do not check each file byte-for-byte, perform shallow os.stat checks.
+        Ignored.  Contents are never compared byte for byte any more.
+    :param file_cache FileInfoCache:
+        Hashes files with same sizes but different mtimes, and remembers them.  BuildTargets can pass
+        self.maestro.fileCache.
     '''
-    if not os.path.isfile(dest):
+    try:
+        dest_st = os.stat(dest)
+    except OSError:
+        return True
+    if not stat.S_ISREG(dest_st.st_mode):
         return True
+    src_st = os.stat(src)
     if not op_args.get('ignore_mtime', False):
-        if os.path.getmtime(src) - os.path.getmtime(dest) > 1.0:
+        if src_st.st_mtime - dest_st.st_mtime > 1.0:
             return True
     if not op_args.get('ignore_filecmp', False):
-        if not filecmp.cmp(src, dest, op_args.get('ignore_bytecmp', False)):
+        if os.path.samestat(src_st, dest_st):
+            return False
+        if src_st.st_size != dest_st.st_size:
+            return True
+        if src_st.st_mtime_ns == dest_st.st_mtime_ns:
+            return False
+        file_cache = op_args.get('file_cache')
+        if file_cache is None:
             return True
+        src_hash = file_cache.hash(os.path.abspath(src), file_cache.getSignature(src_st))
+        return src_hash != file_cache.hash(os.path.abspath(dest), file_cache.getSignature(dest_st))
     return False
 
 
@@ -500,35 +539,339 @@ def single_copy(fromfile: str, newroot: str, **op_args):
         Copy to new name rather than to new directory. False by default.
     :param verbose bool:
         Log copying action.
+    :param strategy str:
+        'copy' (default), 'reflink', 'hardlink' or 'symlink'.  See clone_file().
     :param ignore_mtime bool:
         Ignore file modification timestamps.
     :param ignore_filecmp bool:
-        Disable byte-to-byte comparison AND os.stat checks.
-    :param ignore_bytecmp bool:
-        Do not check each file byte-for-byte, perform shallow os.stat checks.
+        Disable content AND os.stat checks.
+    :param file_cache FileInfoCache:
+        See canCopy().
+    :returns bool: Whether anything was copied.
     '''
     newfile = os.path.join(newroot, os.path.basename(fromfile))
     if op_args.get('as_file', False) or '.' in newroot:
         newfile = newroot
-    if canCopy(fromfile, newfile, **op_args):
+        if os.path.isdir(newfile):
+            # What copy2() would have done.
+            newfile = os.path.join(newfile, os.path.basename(fromfile))
+    strategy = op_args.get('strategy', 'copy')
+    # A link left by another strategy would look up to date, being the same file.
+    if canCopy(fromfile, newfile, **op_args) or (strategy != 'symlink' and os.path.islink(newfile)):
         if op_args.get('verbose', False):
             log.info('Copying {} -> {}'.format(fromfile, newfile))
-        shutil.copy2(fromfile, newfile)
+        clone_file(fromfile, newfile, strategy, copy_stat=True)
+        return True
+    return False
+
+
+# From linux/fs.h
+_FICLONE = 0x40049409
+
+
+def reflink(src: str, dst: str) -> None:
+    '''
+    Makes dst a copy-on-write clone of src.  Raises OSError if the OS or filesystem can't.
+    '''
+    if not is_linux():
+        raise OSError(errno.EOPNOTSUPP, 'reflink is only supported on Linux', dst)
+    import fcntl
+    with open(src, 'rb') as inf, open(dst, 'wb') as outf:
+        try:
+            fcntl.ioctl(outf.fileno(), _FICLONE, inf.fileno())
+        except OSError:
+            outf.close()
+            os.remove(dst)
+            raise
+
+
+def clone_file(src: str, dst: str, strategy: str = 'reflink', copy_stat: bool = False) -> str:
+    '''
+    Puts a copy of src at dst, replacing whatever is there.
+
+    :param strategy: 'hardlink', 'reflink', 'symlink' or 'copy'.  The rest fall back to copy if the OS or filesystem
+        can't do them.  A symlink points at src's absolute path.
+    :param copy_stat: Copy times and the rest along with the mode, like shutil.copy2().
+    :returns str: The strategy that was actually used.
+    '''
+    try:
+        os.remove(dst)
+    except FileNotFoundError:
+        pass
+    copymeta = shutil.copystat if copy_stat else shutil.copymode
+    if strategy == 'symlink':
+        try:
+            os.symlink(os.path.abspath(src), dst)
+            return 'symlink'
+        except (OSError, NotImplementedError):
+            pass
+    elif strategy == 'hardlink':
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    elif strategy == 'reflink':
+        try:
+            reflink(src, dst)
+            copymeta(src, dst)
+            return 'reflink'
+        except OSError:
+            pass
+    copy_file(src, dst)
+    copymeta(src, dst)
+    return 'copy'
+
+
+def copy_file(src: str, dst: str) -> None:
+    '''
+    shutil.copyfile(), but with copy_file_range() where it can, so filesystems that can share extents or copy
+    server-side (btrfs, XFS, NFS 4.2) get the chance to.  Works on raw file descriptors, which matters when copying
+    lots of small files.
+    '''
+    infd = os.open(src, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        outfd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            size = os.fstat(infd).st_size
+            # Files that claim to be empty (like most of /proc) may not be.
+            if not size or _kernel_copy(infd, outfd, 0, size) is None:
+                while True:
+                    buf = os.read(infd, 1024 * 1024)
+                    if not buf:
+                        break
+                    view = memoryview(buf)
+                    while view:
+                        view = view[os.write(outfd, view):]
+        finally:
+            os.close(outfd)
+    finally:
+        os.close(infd)
+
+
+def _kernel_copy(infd: int, outfd: int, offset: int, length: int):
+    '''
+    Copies length bytes from offset in infd to outfd's position with copy_file_range() or sendfile().
+
+    :returns int: Bytes copied, or None if neither works on these files and nothing was copied.  That includes both
+        of them copying nothing at all, which some filesystems do instead of failing.
+    '''
+    copied = 0
+    for kernel_copy in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+        if kernel_copy is None:
+            continue
+        try:
+            while copied < length:
+                if kernel_copy is os.sendfile:
+                    n = os.sendfile(outfd, infd, offset + copied, min(length - copied, 1 << 30))
+                else:
+                    n = kernel_copy(infd, outfd, min(length - copied, 1 << 30), offset + copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError as e:
+            if copied == 0 and e.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSOCK):
+                # Not on these filesystems/file types.  Try the next way.
+                continue
+            raise
+        if copied == 0 and length > 0:
+            continue
+        return copied
+    return None
+
+
+def copy_fileobj(fsrc, fdst, length=None) -> int:
+    '''
+    Copies from fsrc's position to fdst's, in the kernel where it can (copy_file_range(), then sendfile()), and with
+    shutil.copyfileobj() where it can't.  Both must be binary files.  Leaves both positioned after what was copied.
+
+    :param length: Bytes to copy.  Default: the rest of fsrc.
+    :returns int: Bytes copied.
+    '''
+    fdst.flush()
+    try:
+        infd = fsrc.fileno()
+        outfd = fdst.fileno()
+    except (AttributeError, OSError, ValueError):
+        infd = outfd = None
+    if infd is not None:
+        # Buffered readers may have read ahead of where they say they are.
+        offset = fsrc.tell()
+        fsrc.seek(offset)
+        size = length
+        if size is None:
+            size = max(0, os.fstat(infd).st_size - offset)
+        # As in copy_file(), a size of 0 may just be what fstat() says, so those get read until EOF below.
+        copied = _kernel_copy(infd, outfd, offset, size) if size else None
+        if copied is not None:
+            fsrc.seek(offset + copied)
+            # Let fdst know where the kernel left its file position.
+            fdst.seek(os.lseek(outfd, 0, os.SEEK_CUR))
+            return copied
+    copied = 0
+    remaining = length
+    while remaining is None or remaining > 0:
+        buf = fsrc.read(1024 * 1024 if remaining is None else min(remaining, 1024 * 1024))
+        if not buf:
+            break
+        fdst.write(buf)
+        copied += len(buf)
+        if remaining is not None:
+            remaining -= len(buf)
+    return copied
+
+
+def scan_tree(root: str, ignore=None, stat=True):
+    '''
+    Lists the files under root, one os.scandir() per directory, skipping what optree() would skip.  Symlinks to
+    directories aren't followed, same as os.walk().
+
+    :param ignore: Same as optree(): 'name/' skips directories called name, '.ext' skips files ending in .ext.
+    :param stat: Also stat each file.  Without it only directory entries are read.
+    :returns: (dirs, files): subdirectories relative to root, parents before children, and a dict of file paths
+        relative to root -> os.stat_result (None if stat is False).
+    '''
+    if ignore is None:
+        ignore = []
+    dirs = []
+    files = {}
+    if any([(x + '/' in ignore) for x in root.split(os.sep)]):
+        return dirs, files
+    stack = ['']
+    while stack:
+        rel = stack.pop()
+        try:
+            it = os.scandir(os.path.join(root, rel) if rel else root)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                relpath = os.path.join(rel, entry.name) if rel else entry.name
+                try:
+                    if entry.is_dir():
+                        if entry.name + '/' not in ignore and not entry.is_symlink():
+                            dirs.append(relpath)
+                            stack.append(relpath)
+                        continue
+                    if not entry.is_file() or os.path.splitext(entry.name)[1] in ignore:
+                        continue
+                    files[relpath] = entry.stat() if stat else None
+                except OSError:
+                    # Vanished, or a dangling symlink.
+                    continue
+    return dirs, files
+
+
+#: copy_files() doesn't bother with threads for fewer files than this.
+COPY_PARALLEL_MIN = 16
 
 
-def copytree(fromdir, todir, ignore=None, verbose=False, ignore_mtime=False, progress=False):
+def copy_files(pairs, strategy: str = 'copy', jobs: int = None, verbose: bool = False, progress=None) -> int:
+    '''
+    Copies each (src, dst) in pairs with clone_file() on a pool of threads, keeping mode and times like shutil.copy2()
+    does.  The directories dst goes in must already exist.
+
+    :param strategy: See clone_file().
+    :param jobs: Most files copied at once.  Default: what ThreadPoolExecutor would pick.
+    :param progress: A tqdm to update() for each file.
+    :returns int: Files copied.
+    '''
+    pairs = list(pairs)
+    if jobs is None:
+        jobs = min(32, (os.cpu_count() or 1) + 4)
+
+    def copy(pair):
+        src, dst = pair
+        if verbose:
+            log.info('Copying {} -> {}'.format(src, dst))
+        clone_file(src, dst, strategy, copy_stat=True)
+
+    if jobs <= 1 or len(pairs) < COPY_PARALLEL_MIN:
+        for pair in pairs:
+            copy(pair)
+            if progress is not None:
+                progress.update(1)
+        return len(pairs)
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='copy') as pool:
+        for _ in pool.map(copy, pairs):
+            if progress is not None:
+                progress.update(1)
+    return len(pairs)
+
+
+def _isCopyOf(dst: str, src: str, st, ignore_mtime: bool) -> bool:
+    try:
+        dst_st = os.stat(dst)
+    except OSError:
+        return False
+    if os.path.samestat(st, dst_st):
+        # Hardlinked.
+        return True
+    if st.st_size != dst_st.st_size:
+        return False
+    if ignore_mtime:
+        return filecmp.cmp(src, dst, shallow=False)
+    # copy2() and copy_files() keep mtimes, so anything else has changed since.
+    return st.st_mtime_ns == dst_st.st_mtime_ns
+
+
+def copytree(fromdir, todir, ignore=None, verbose=False, ignore_mtime=False, progress=False, strategy='copy', jobs=None):
+    '''
+    Copies the files under fromdir into todir, skipping those whose copy has the same size and mtime already.
+
+    fromdir is scanned once, every directory in it (even empty ones) is made in one pass up front, and the copying is
+    done by copy_files().
+
+    :param ignore: See optree().
+    :param ignore_mtime: Compare contents instead of mtimes.
+    :param strategy: 'copy', 'reflink', 'hardlink' or 'symlink' (see clone_file()).  Links share their source's data,
+        so only use them for outputs nothing writes to.
+    :param jobs: See copy_files().
+    :returns int: Files copied.
+    '''
+    reldirs, files = scan_tree(fromdir, ignore=ignore)
+    # Make the whole tree, empty directories included, before any copying starts.  scan_tree() lists parents before
+    # children.  Directory relative to todir -> made just now, so nothing in it needs checking.
+    fresh = {}
+    if reldirs or files:
+        for reldir in [''] + reldirs:
+            dstdir = os.path.join(todir, reldir) if reldir else todir
+            fresh[reldir] = _makeDirs(dstdir)
+            if fresh[reldir] and verbose:
+                log.info(u'mkdir {}'.format(dstdir))
+    prog = None
     if progress:
-        count={'a':0}
-        def incrementCount(a,b,**c):
-            count['a']+=1
-        optree(fromdir, todir, incrementCount, ignore,
-               verbose=False, ignore_mtime=ignore_mtime)
-        optree(fromdir, todir, single_copy, ignore,
-               verbose=verbose, ignore_mtime=ignore_mtime, tqdm_total=count['a'],
-               tqdm_desc='Copying...', progress=True)
-    else:
-        optree(fromdir, todir, single_copy, ignore,
-                verbose=verbose, ignore_mtime=ignore_mtime)
+        prog = tqdm.tqdm(total=len(files),
+            desc='Copying...',
+            leave=True,
+            ascii=sys.platform.startswith('win'), # *shakes fist*
+            unit='file')
+    tocopy = []
+    for relpath, st in files.items():
+        src = os.path.join(fromdir, relpath)
+        dst = os.path.join(todir, relpath)
+        if fresh[os.path.dirname(relpath)] or not _isCopyOf(dst, src, st, ignore_mtime):
+            tocopy.append((src, dst))
+        elif prog:
+            prog.update(1)
+    try:
+        return copy_files(tocopy, strategy=strategy, jobs=jobs, verbose=verbose, progress=prog)
+    finally:
+        if prog:
+            prog.close()
+
+
+def _makeDirs(dirname: str) -> bool:
+    '''
+    :returns bool: False if dirname was already there.
+    '''
+    try:
+        os.mkdir(dirname)
+    except FileExistsError:
+        return False
+    except FileNotFoundError:
+        os.makedirs(dirname, exist_ok=True)
+    return True
 
 
 def optree(fromdir, todir, op, ignore=None, **op_args):
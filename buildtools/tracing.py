@@ -0,0 +1,138 @@
+'''
+Chrome trace-event recorder, for loading builds into chrome://tracing or Perfetto.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+class TraceRecorder(object):
+    '''
+    Collects complete ("X") events, one lane per thread, and writes them out in the Trace Event Format.
+    '''
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._events = []
+        # threading.get_ident() -> small lane number.
+        self._tids = {}
+
+    def _tid(self):
+        ident = threading.get_ident()
+        tid = self._tids.get(ident)
+        if tid is None:
+            with self._lock:
+                tid = self._tids.get(ident)
+                if tid is None:
+                    tid = len(self._tids) + 1
+                    self._tids[ident] = tid
+                    self._events.append({'ph': 'M', 'name': 'thread_name', 'pid': self.pid, 'tid': tid,
+                                         'args': {'name': threading.current_thread().name}})
+                    self._events.append({'ph': 'M', 'name': 'thread_sort_index', 'pid': self.pid, 'tid': tid,
+                                         'args': {'sort_index': tid}})
+        return tid
+
+    def complete(self, name, cat, start, end, args=None):
+        '''
+        Record a span that ran on this thread from start to end (perf_counter() seconds).
+        '''
+        event = {
+            'ph': 'X',
+            'name': name,
+            'cat': cat,
+            'pid': self.pid,
+            'tid': self._tid(),
+            'ts': (start - self._origin) * 1e6,
+            'dur': (end - start) * 1e6,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self._events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name, cat, **args):
+        '''
+        Records the with block as a span.  Yields args, so the block can add to them.
+        '''
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.complete(name, cat, start, time.perf_counter(), args)
+
+    def getEvents(self):
+        with self._lock:
+            events = list(self._events)
+        events.insert(0, {'ph': 'M', 'name': 'process_name', 'pid': self.pid, 'tid': 0, 'args': {'name': 'maestro'}})
+        return events
+
+    def write(self, filename):
+        dirname = os.path.dirname(filename)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': self.getEvents(), 'displayTimeUnit': 'ms'}, f)
+
+
+_recorder = None
+#: What span() returns when tracing is off.
+NULL_SPAN = contextlib.nullcontext()
+
+
+def start():
+    '''
+    Start recording spans from every thread.  Replaces any recorder already running.
+    '''
+    global _recorder
+    _recorder = TraceRecorder()
+    return _recorder
+
+
+def stop():
+    '''
+    :returns TraceRecorder: The recorder that was running, or None.
+    '''
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+
+def active():
+    return _recorder is not None
+
+
+def span(name, cat='', **args):
+    '''
+    Records the with block as a span if tracing is on, and does nothing otherwise.  Yields a dict of args to add to,
+    or None when not tracing.
+    '''
+    recorder = _recorder
+    if recorder is None:
+        return NULL_SPAN
+    return recorder.span(name, cat, **args)
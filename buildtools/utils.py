@@ -28,6 +28,18 @@ import sys
 import mimetypes
 import binascii
 import mmap
+import os
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+#: Files at least this big are hashed straight out of an mmap instead of being read() in blocks.
+MMAP_THRESHOLD = 1024 * 1024
+
+#: What Maestro hashes files and configs with when nobody asks for something else.
+DEFAULT_HASH_ALGORITHM = 'xxh3_128' if xxhash is not None and hasattr(xxhash, 'xxh3_128') else 'blake2b'
 
 def getClass(thing):
     return thing.__class__
@@ -53,25 +65,69 @@ else:
     def bytes2str(b):
         return str(b)
 
+def available_hash_algorithms():
+    '''
+    Names new_hasher() will accept.  The xxh* ones are only there if xxhash is installed.
+    '''
+    algos = ['md5', 'sha1', 'sha256', 'blake2b', 'blake2s']
+    if xxhash is not None:
+        algos += [name for name in ('xxh64', 'xxh3_64', 'xxh3_128') if hasattr(xxhash, name)]
+    return algos
+
+
+def new_hasher(algorithm=DEFAULT_HASH_ALGORITHM):
+    '''
+    :param algorithm: A name from available_hash_algorithms().
+    :returns: A fresh hashlib-style object (update()/hexdigest()).
+    '''
+    if algorithm.startswith('xxh'):
+        if xxhash is None:
+            raise ValueError('Hash algorithm {!r} needs the xxhash package, which is not installed.'.format(algorithm))
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
 def hashfile(afile, hasher, blocksize=65536):
     if isinstance(afile, str):
         with open(afile, 'rb') as f:
-            return hashfile(f,hasher,blocksize)
-    buf = afile.read(blocksize)
-    while len(buf) > 0:
-        hasher.update(buf)
+            size = os.fstat(f.fileno()).st_size
+            if size < blocksize:
+                # Most source files: one read, no scratch buffer.
+                hasher.update(f.read())
+                return hasher.hexdigest()
+            if size >= MMAP_THRESHOLD:
+                # One update() over the whole mapping: no copies, and hashlib drops the GIL while it works.
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    hasher.update(mm)
+                return hasher.hexdigest()
+            return hashfile(f, hasher, blocksize)
+    readinto = getattr(afile, 'readinto', None)
+    if readinto is None:
         buf = afile.read(blocksize)
+        while len(buf) > 0:
+            hasher.update(buf)
+            buf = afile.read(blocksize)
+        return hasher.hexdigest()
+    buf = bytearray(blocksize)
+    view = memoryview(buf)
+    while True:
+        n = readinto(buf)
+        if not n:
+            break
+        hasher.update(view[:n])
     return hasher.hexdigest()
 
 
+def hashsum(filename, algorithm=DEFAULT_HASH_ALGORITHM):
+    return hashfile(filename, new_hasher(algorithm))
+
+
 def md5sum(filename, blocksize=65536):
-    with open(filename, 'rb') as f:
-        return hashfile(f, hashlib.md5())
+    return hashfile(filename, hashlib.md5(), blocksize)
 
 
 def sha256sum(filename, blocksize=65536):
-    with open(filename, 'rb') as f:
-        return hashfile(f, hashlib.sha256())
+    return hashfile(filename, hashlib.sha256(), blocksize)
 
 def img2blob(filename):
     mime, _ = mimetypes.guess_type(filename)
@@ -0,0 +1,233 @@
+'''
+Tests for the artifact cache and its remote tier.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import io
+import os
+
+import pytest
+import requests
+
+from buildtools import utils
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.artifacts import ArtifactCache
+from buildtools.maestro.fileio import ConcatenateBuildTarget
+from buildtools.maestro.remote_cache import DirectoryBackend, HTTPBackend, serve_directory
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    built = []
+    build = ConcatenateBuildTarget.build
+
+    def counting_build(self):
+        built.append(os.getcwd())
+        build(self)
+    monkeypatch.setattr(ConcatenateBuildTarget, 'build', counting_build)
+    return built
+
+
+def checkout(root, monkeypatch, text='hello\n'):
+    os.makedirs(os.path.join(root, 'src'), exist_ok=True)
+    with open(os.path.join(root, 'src', 'a.txt'), 'w') as f:
+        f.write(text)
+    with open(os.path.join(root, 'src', 'b.txt'), 'w') as f:
+        f.write('world\n')
+    monkeypatch.chdir(root)
+
+
+def build(remote=None):
+    bm = BuildMaestro()
+    bm.jobs = 1
+    bm.enableArtifactCache(strategy='copy', remote=remote)
+    bt = bm.add(ConcatenateBuildTarget('all.txt', ['src/a.txt', 'src/b.txt'], write_encoding='utf-8'))
+    assert bm.run()
+    with open('all.txt') as f:
+        return bt.getArtifactKey(), f.read()
+
+
+def write(filename, data):
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+
+def test_restores_instead_of_rebuilding(workdir, monkeypatch, builds):
+    checkout(workdir, monkeypatch)
+    assert build()[1] == 'hello\nworld\n'
+    checkout(workdir, monkeypatch, text='changed\n')
+    assert build()[1] == 'changed\nworld\n'
+    checkout(workdir, monkeypatch)
+    assert build()[1] == 'hello\nworld\n'
+    assert len(builds) == 2
+
+
+def test_keys_are_the_same_in_every_checkout(tmp_path, monkeypatch, builds):
+    checkout(tmp_path / 'a', monkeypatch)
+    a, _ = build()
+    checkout(tmp_path / 'elsewhere' / 'b', monkeypatch)
+    b, _ = build()
+    assert a == b
+
+    checkout(tmp_path / 'c', monkeypatch, text='changed\n')
+    c, _ = build()
+    assert c != a
+
+
+def test_evicts_least_recently_used(workdir):
+    cache = ArtifactCache('cache', max_size=250, strategy='copy')
+    for i, key in enumerate(('aa1', 'bb2', 'cc3')):
+        write('out.bin', bytes(100))
+        assert cache.store(key, ['out.bin'])
+        manifest = os.path.join(cache._getEntryDir(key), cache.MANIFEST)
+        os.utime(manifest, (1000000000 + i, 1000000000 + i))
+    # Using aa1 makes bb2 the oldest.
+    assert cache.restore('aa1', ['out.bin'])
+    assert cache.evict() == (1, 100)
+    assert not cache.restore('bb2', ['out.bin'])
+    assert cache.restore('aa1', ['out.bin']) and cache.restore('cc3', ['out.bin'])
+    assert cache.evict() == (0, 0)
+
+
+def test_restore_needs_the_same_outputs(workdir):
+    cache = ArtifactCache('cache', strategy='copy')
+    write('a.bin', b'a')
+    cache.store('aa1', ['a.bin'])
+    assert not cache.restore('aa1', ['b.bin'])
+    assert not cache.restore('bb2', ['a.bin'])
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_hardlinked_outputs_are_detached(workdir):
+    cache = ArtifactCache('cache', strategy='hardlink')
+    write('a.bin', b'stored')
+    cache.store('aa1', ['a.bin'])
+    os.remove('a.bin')
+    assert cache.restore('aa1', ['a.bin'])
+    cache.detach(['a.bin'])
+    write('a.bin', b'overwritten')
+    assert cache.restore('aa1', ['a.bin'])
+    with open('a.bin', 'rb') as f:
+        assert f.read() == b'stored'
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        ArtifactCache('cache', strategy='symlink')
+
+
+def test_local_cache_does_not_hash_outputs(tmp_path, monkeypatch):
+    hashed = []
+    monkeypatch.setattr(utils, 'sha256sum', lambda filename, blocksize=65536: hashed.append(filename))
+    monkeypatch.chdir(tmp_path)
+    write('a.bin', b'a')
+    assert ArtifactCache('cache', strategy='copy').store('aa1', ['a.bin'])
+    assert hashed == []
+    assert ArtifactCache('remote-cache', strategy='copy', remote=DirectoryBackend('remote')).store('aa1', ['a.bin'])
+    assert len(hashed) == 1
+
+
+def test_remote_tier_is_shared_between_checkouts(tmp_path, monkeypatch, builds):
+    remote = DirectoryBackend(str(tmp_path / 'remote'))
+    checkout(tmp_path / 'a', monkeypatch)
+    build(remote)
+    checkout(tmp_path / 'b', monkeypatch)
+    assert build(remote)[1] == 'hello\nworld\n'
+    assert builds == [str(tmp_path / 'a')]
+
+
+def test_corrupt_remote_entry_is_rebuilt(tmp_path, monkeypatch, builds):
+    remote = DirectoryBackend(str(tmp_path / 'remote'))
+    checkout(tmp_path / 'a', monkeypatch)
+    key, _ = build(remote)
+    blob = remote.getBlobFile(key)
+    with open(blob, 'r+b') as f:
+        data = f.read()
+        f.seek(0)
+        f.write(data.replace(b'hello', b'HELLO'))
+    checkout(tmp_path / 'b', monkeypatch)
+    assert build(remote)[1] == 'hello\nworld\n'
+    assert len(builds) == 2
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = serve_directory(str(tmp_path / 'served'))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def http_backend(server):
+    host, port = server.server_address[:2]
+    return HTTPBackend('http://{}:{}/'.format(host, port))
+
+
+def test_http_remote_is_shared_between_caches(workdir, server):
+    write('a.bin', b'artifact')
+    pusher = ArtifactCache('pusher', strategy='copy', remote=http_backend(server))
+    assert pusher.store('aa1', ['a.bin'])
+    assert pusher.remote_stores == 1
+    os.remove('a.bin')
+
+    puller = ArtifactCache('puller', strategy='copy', remote=http_backend(server))
+    assert puller.restore('aa1', ['a.bin'])
+    assert (puller.hits, puller.remote_hits) == (1, 1)
+    with open('a.bin', 'rb') as f:
+        assert f.read() == b'artifact'
+    # It's local now.
+    assert puller.restore('aa1', ['a.bin'])
+    assert puller.remote_hits == 1
+
+
+def test_http_missing_key_is_a_miss(workdir, server):
+    backend = http_backend(server)
+    assert not backend.get('nothere', io.BytesIO())
+    cache = ArtifactCache('cache', strategy='copy', remote=backend)
+    assert not cache.restore('nothere', ['a.bin'])
+    assert (cache.misses, cache.remote_misses) == (1, 1)
+    assert not os.path.exists('a.bin')
+
+
+def test_http_errors_are_raised(workdir, server):
+    backend = http_backend(server)
+    with pytest.raises(requests.HTTPError):
+        backend.get('.hidden', io.BytesIO())
+    with pytest.raises(requests.HTTPError):
+        backend.put('.hidden', io.BytesIO(b'data'))
+
+
+def test_http_tampered_blob_is_rejected(workdir, server, tmp_path):
+    write('a.bin', b'artifact')
+    ArtifactCache('pusher', strategy='copy', remote=http_backend(server)).store('aa1', ['a.bin'])
+    os.remove('a.bin')
+    blob = DirectoryBackend(str(tmp_path / 'served')).getBlobFile('aa1')
+    with open(blob, 'r+b') as f:
+        data = f.read()
+        f.seek(0)
+        f.write(data.replace(b'artifact', b'ARTIFACT'))
+
+    puller = ArtifactCache('puller', strategy='copy', remote=http_backend(server))
+    assert not puller.restore('aa1', ['a.bin'])
+    assert puller.remote_misses == 1
+    assert not os.path.exists('a.bin')
+    assert not os.path.exists(puller._getEntryDir('aa1'))
@@ -0,0 +1,132 @@
+'''
+Tests for how targets decide their input files changed.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import collections
+import os
+
+import pytest
+
+from buildtools import utils
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.base_target import SingleBuildTarget
+
+
+class ConcatTarget(SingleBuildTarget):
+    BT_LABEL = 'CONCAT'
+
+    def __init__(self, target, files):
+        self.builds = 0
+        super().__init__(target, files=files)
+
+    def build(self):
+        self.builds += 1
+        with open(self.target, 'w') as w:
+            for filename in self.files:
+                with open(filename) as r:
+                    w.write(r.read())
+
+
+class HashOnlyTarget(ConcatTarget):
+    CHECK_MTIMES = False
+
+
+@pytest.fixture
+def hashed(monkeypatch):
+    hashed = collections.Counter()
+    hashsum = utils.hashsum
+
+    def counting_hashsum(filename, algorithm=utils.DEFAULT_HASH_ALGORITHM):
+        hashed[os.path.relpath(filename)] += 1
+        return hashsum(filename, algorithm)
+    monkeypatch.setattr(utils, 'hashsum', counting_hashsum)
+    return hashed
+
+
+def write(filename, text, mtime=None):
+    with open(filename, 'w') as f:
+        f.write(text)
+    if mtime is not None:
+        os.utime(filename, (mtime, mtime))
+
+
+def build(cls=ConcatTarget, files=['a.txt', 'b.txt']):
+    bm = BuildMaestro()
+    bt = bm.add(cls('out.txt', files=list(files)))
+    assert bm.run()
+    return bt
+
+
+def test_unchanged_inputs_are_not_hashed(workdir, hashed):
+    write('a.txt', 'a')
+    write('b.txt', 'b')
+    assert build().builds == 1
+    hashed.clear()
+    assert build().builds == 0
+    assert hashed == {}
+
+
+def test_changed_mtime_rebuilds_without_hashing(workdir, hashed):
+    write('a.txt', 'a', 1000000000)
+    write('b.txt', 'b')
+    build()
+    hashed.clear()
+    write('a.txt', 'a', 1000000100)
+    bt = build()
+    assert bt.builds == 1
+    # a.txt is only hashed once, for the new cache record, and b.txt's old hash is reused.
+    assert hashed['a.txt'] == 1
+    assert 'b.txt' not in hashed
+
+
+def test_touched_file_with_same_content_is_hashed_not_rebuilt(workdir, hashed):
+    write('a.txt', 'a', 1000000000)
+    write('b.txt', 'b')
+    build(HashOnlyTarget)
+    hashed.clear()
+    write('a.txt', 'a', 1000000100)
+    assert build(HashOnlyTarget).builds == 0
+    assert dict(hashed) == {'a.txt': 1}
+
+
+def test_same_mtime_new_content_is_caught(workdir):
+    write('a.txt', 'a', 1000000000)
+    write('b.txt', 'b')
+    build(HashOnlyTarget)
+    write('a.txt', 'A', 1000000000)
+    assert build(HashOnlyTarget).builds == 1
+    with open('out.txt') as f:
+        assert f.read() == 'Ab'
+
+
+def test_reasons(workdir):
+    write('a.txt', 'a')
+    write('b.txt', 'b')
+    write('c.txt', 'c')
+    build()
+    bm = BuildMaestro()
+    bt = bm.add(ConcatTarget('out.txt', files=['a.txt', 'c.txt']))
+    bm._prepare()
+    changes = {os.path.relpath(filename): change for filename, change in bt.iterChangedFiles()}
+    assert changes == {'c.txt': 'new', 'b.txt': 'missing'}
+    assert sorted(bt.getChangedFiles()) == sorted(os.path.abspath(filename) for filename in ('b.txt', 'c.txt'))
@@ -0,0 +1,147 @@
+'''
+Tests for ConcatenateBuildTarget and its source maps.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import codecs
+import json
+import os
+
+import pytest
+
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.fileio import ConcatenateBuildTarget
+
+_BASE64 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+SOURCES = {
+    'a.js': 'var a = 1;\r\nvar b = "é";\n',
+    'b.js': 'no newline at the end 😀',
+    'empty.js': '',
+    'c.js': '\n\nvar c = [\n  "ü",\n];\n',
+    'd.js': 'last();',
+}
+
+
+def vlq_decode(segment):
+    values = []
+    value = shift = 0
+    for char in segment:
+        digit = _BASE64.index(char)
+        value += (digit & 0x1F) << shift
+        shift += 5
+        if not digit & 0x20:
+            values.append(-(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    return values
+
+
+def decode_mappings(mappings):
+    '''
+    :returns list: For each generated line, a list of absolute (column, source, line, column) segments.
+    '''
+    lines = []
+    source = line = column = 0
+    for encoded in mappings.split(';'):
+        segments = []
+        gencolumn = 0
+        for segment in filter(None, encoded.split(',')):
+            fields = vlq_decode(segment)
+            gencolumn += fields[0]
+            source += fields[1]
+            line += fields[2]
+            column += fields[3]
+            segments.append((gencolumn, source, line, column))
+        lines.append(segments)
+    return lines
+
+
+def write_sources(encoding='utf-8', bom=False):
+    for filename, text in SOURCES.items():
+        with open(filename, 'wb') as f:
+            f.write((codecs.BOM_UTF8 if bom and text else b'') + text.encode(encoding))
+    return list(SOURCES)
+
+
+def concat(files, **kwargs):
+    bm = BuildMaestro()
+    bt = bm.add(ConcatenateBuildTarget('out.js', files, **kwargs))
+    assert bm.run()
+    return bt
+
+
+@pytest.mark.parametrize('read_encoding,write_encoding,bom', [
+    ('utf-8-sig', 'utf-8-sig', True),
+    ('utf-8-sig', 'utf-8', True),
+    ('utf-8', 'utf-8', False),
+    ('utf-8-sig', 'utf-16', True),
+])
+def test_same_output_as_before(workdir, read_encoding, write_encoding, bom):
+    files = write_sources(bom=bom)
+    concat(files, read_encoding=read_encoding, write_encoding=write_encoding)
+    # What the old codecs.open() read()/write() loop made.
+    expected = ''.join(codecs.open(filename, 'r', encoding=read_encoding).read() for filename in files)
+    with open('out.js', 'rb') as f:
+        assert f.read() == codecs.encode(expected, write_encoding)
+
+
+@pytest.mark.parametrize('read_encoding,write_encoding', [
+    ('utf-8-sig', 'utf-8'),
+    ('utf-8', 'utf-16'),
+])
+def test_source_map_points_at_every_line(workdir, read_encoding, write_encoding):
+    files = write_sources()
+    bt = concat(files, read_encoding=read_encoding, write_encoding=write_encoding, source_map=True)
+    assert bt.provides() == ('out.js', 'out.js.map')
+    with open('out.js', encoding=write_encoding, newline='') as f:
+        generated = f.read().split('\n')
+    with open('out.js.map') as f:
+        smap = json.load(f)
+    assert smap['version'] == 3
+    assert smap['file'] == 'out.js'
+    assert smap['sources'] == [filename for filename in files if SOURCES[filename]]
+    assert generated[-2] == '//# sourceMappingURL=out.js.map'
+
+    lines = decode_mappings(smap['mappings'])
+    sourcelines = [SOURCES[filename].split('\n') for filename in smap['sources']]
+    mapped = 0
+    for genline, segments in enumerate(lines):
+        # Columns are counted in UTF-16 code units.
+        utf16 = generated[genline].encode('utf-16-le')
+        for i, (gencolumn, source, line, column) in enumerate(segments):
+            assert column == 0
+            end = segments[i + 1][0] if i + 1 < len(segments) else None
+            text = utf16[gencolumn * 2:end * 2 if end is not None else None].decode('utf-16-le')
+            assert text == sourcelines[source][line]
+            mapped += 1
+    # Everything but what follows a source's last newline, when there's nothing there.
+    assert mapped == sum(len(source) - (source[-1] == '') for source in sourcelines)
+
+
+def test_css_map_comment(workdir):
+    with open('a.css', 'w') as f:
+        f.write('a { color: red }')
+    bm = BuildMaestro()
+    bm.add(ConcatenateBuildTarget('out.css', ['a.css'], write_encoding='utf-8', source_map=True))
+    assert bm.run()
+    with open('out.css') as f:
+        assert f.read() == 'a { color: red }\n/*# sourceMappingURL=out.css.map */\n'
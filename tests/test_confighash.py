@@ -0,0 +1,105 @@
+'''
+Tests for buildtools.maestro.utils.hashConfig().
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import enum
+import hashlib
+import logging
+import os
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+from buildtools.maestro import utils
+from buildtools.maestro.utils import SerializableFileLambda, SerializableLambda, hashConfig
+
+
+class Mode(enum.Enum):
+    FAST = 1
+    SLOW = 2
+
+
+CONFIG = {'replacements': {'a': SerializableLambda('b')}, 'flags': {'x', 'y', 'z'}, 'mode': Mode.FAST, 'opts': ['-q']}
+
+
+def h(value):
+    return hashConfig(value, hashlib.sha256())
+
+
+def test_order_independent():
+    assert h({'a': 1, 'b': [1, 2]}) == h({'b': [1, 2], 'a': 1})
+    assert h({1, 2, 3}) == h({3, 2, 1})
+    assert h([1, 2]) == h((1, 2))
+    assert h([1, 2]) != h([2, 1])
+
+
+def test_types_are_distinct():
+    values = ['1', 1, 1.0, True, None, b'1', [1], {1}, {'1': 1}, Mode.FAST, pathlib.PurePosixPath('1')]
+    assert len({h(value) for value in values}) == len(values)
+
+
+def test_lambdas_and_enums():
+    assert h(SerializableLambda('x')) == h(SerializableLambda('x'))
+    assert h(SerializableLambda('x')) != h(SerializableLambda('y'))
+    assert h(SerializableFileLambda('a.txt')) != h(SerializableFileLambda('a.txt', as_blob=True))
+    assert h(Mode.FAST) != h(Mode.SLOW)
+
+
+class Opaque(object):
+    def __init__(self, value=1):
+        self.value = value
+
+    def __repr__(self):
+        return 'Opaque({!r})'.format(self.value)
+
+
+def test_anything_else_is_hashed_by_repr(caplog, monkeypatch):
+    monkeypatch.setattr(utils, '_warnedTypes', set())
+    assert h(Opaque()) == h(Opaque())
+    assert h({'nested': [Opaque()]}) == h({'nested': [Opaque()]})
+    assert h(Opaque(1)) != h(Opaque(2))
+    # Tagged with its type, so it can't collide with its repr() as a string.
+    assert h(Opaque()) != h('Opaque(1)')
+    assert h(object()) != h(Opaque())
+    warnings = [record for record in caplog.records if 'Opaque' in record.getMessage()]
+    assert len(warnings) == 1 and warnings[0].levelno == logging.WARNING
+
+
+def test_rejects_itself():
+    value = []
+    value.append(value)
+    with pytest.raises(TypeError):
+        h(value)
+
+
+def test_stable_between_processes():
+    # Set and dict iteration order depends on PYTHONHASHSEED, and objects' addresses change from run to run.
+    code = 'from test_confighash import CONFIG, h; print(h(CONFIG))'
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(__file__)] + sys.path))
+    hashes = set()
+    for seed in ('1', '2', '3'):
+        env['PYTHONHASHSEED'] = seed
+        hashes.add(subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True).stdout)
+    assert hashes == {h(CONFIG) + '\n'}
@@ -0,0 +1,122 @@
+'''
+Tests for CopyFilesTarget's manifest-backed incremental copies.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import json
+import os
+
+import pytest
+
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.fileio import ConcatenateBuildTarget, CopyFilesTarget
+
+
+def write(filename, text):
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    with open(filename, 'w') as f:
+        f.write(text)
+
+
+def read(filename):
+    with open(filename) as f:
+        return f.read()
+
+
+@pytest.fixture
+def built(monkeypatch):
+    built = []
+    build = ConcatenateBuildTarget.build
+
+    def counting_build(self):
+        built.append(self.target)
+        build(self)
+    monkeypatch.setattr(ConcatenateBuildTarget, 'build', counting_build)
+    return built
+
+
+def run(**kwargs):
+    bm = BuildMaestro()
+    bm.jobs = 1
+    copy = bm.add(CopyFilesTarget('.build/copy.json', 'src', 'dest', **kwargs))
+    bm.add(ConcatenateBuildTarget('a-out.txt', ['dest/a.txt'], write_encoding='utf-8'))
+    assert bm.run()
+    return bm, copy
+
+
+@pytest.fixture
+def tree(workdir):
+    write('src/a.txt', 'a\n')
+    write('src/sub/b.txt', 'b\n')
+    write('src/skip.tmp', 'tmp\n')
+    return workdir
+
+
+def test_copies_and_writes_manifest(tree, built):
+    bm, copy = run(ignore=['.tmp'])
+    assert read('dest/a.txt') == 'a\n'
+    assert read('dest/sub/b.txt') == 'b\n'
+    assert not os.path.exists('dest/skip.tmp')
+    with open('.build/copy.json') as f:
+        manifest = json.load(f)
+    assert sorted(manifest['files']) == ['a.txt', os.path.join('sub', 'b.txt')]
+    assert built == ['a-out.txt']
+
+
+def test_only_copies_what_changed(tree, built):
+    run()
+    # Changes in size, so coarse mtimes can't hide them.
+    write('src/sub/b.txt', 'b2\n')
+    write('src/c.txt', 'c\n')
+    os.remove('src/skip.tmp')
+    bm, copy = run()
+    assert sorted(copy.getChangedOutputs()) == sorted(['.build/copy.json', os.path.join('dest', 'sub', 'b.txt'), os.path.join('dest', 'c.txt'), os.path.join('dest', 'skip.tmp')])
+    assert read('dest/sub/b.txt') == 'b2\n'
+    assert read('dest/c.txt') == 'c\n'
+    assert not os.path.exists('dest/skip.tmp')
+    assert os.path.abspath('dest/a.txt') not in bm.targetsDirty
+    assert os.path.abspath('dest/c.txt') in bm.targetsDirty
+    # a-out.txt only reads dest/a.txt, which wasn't touched.
+    assert built == ['a-out.txt']
+
+
+def test_downstream_rebuilds_when_its_input_is_copied(tree, built):
+    run()
+    write('src/a.txt', 'a2\n')
+    run()
+    assert read('a-out.txt') == 'a2\n'
+    assert built == ['a-out.txt', 'a-out.txt']
+
+
+def test_up_to_date_copies_nothing(tree, built):
+    run()
+    bm, copy = run()
+    assert not copy.dirty
+    assert built == ['a-out.txt']
+
+
+def test_recopies_missing_files(tree, built):
+    run()
+    os.remove('dest/sub/b.txt')
+    bm, copy = run()
+    assert read('dest/sub/b.txt') == 'b\n'
+    assert copy.getChangedOutputs() == ['.build/copy.json', os.path.join('dest', 'sub', 'b.txt')]
@@ -0,0 +1,100 @@
+'''
+Tests for BuildMaestro's --dry-run and --explain modes.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import os
+
+import pytest
+
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.base_target import SingleBuildTarget
+
+
+class WriteTarget(SingleBuildTarget):
+    BT_LABEL = 'WRITE'
+
+    def __init__(self, target, text='hello', fail_with=None):
+        self.text = text
+        self.fail_with = fail_with
+        super().__init__(target, files=[])
+
+    def get_config(self):
+        return {'text': self.text}
+
+    def iterStaleReasons(self):
+        if self.fail_with is not None:
+            raise self.fail_with
+        yield from super().iterStaleReasons()
+
+    def build(self):
+        os.makedirs(os.path.dirname(self.target), exist_ok=True)
+        with open(self.target, 'w') as f:
+            f.write(self.text)
+
+
+def make_maestro(*targets, dry_run=True):
+    bm = BuildMaestro()
+    bm.jobs = 1
+    bm.dry_run = dry_run
+    for bt in targets:
+        bm.add(bt)
+    return bm
+
+
+def test_dry_run_builds_nothing(workdir):
+    bm = make_maestro(WriteTarget('out/a.txt'))
+    assert bm.run()
+    assert not os.path.exists('out/a.txt')
+    assert [e['stale'] for e in bm.explanations.values()] == [True]
+    assert bm.explanations[0]['reasons'][0]['reason'] == 'no-cache'
+
+
+def test_dry_run_sees_up_to_date_targets(workdir):
+    assert make_maestro(WriteTarget('out/a.txt'), dry_run=False).run()
+    bm = make_maestro(WriteTarget('out/a.txt'))
+    assert bm.run()
+    assert bm.explanations[0]['stale'] is False
+    bm = make_maestro(WriteTarget('out/a.txt', text='changed'))
+    assert bm.run()
+    assert bm.explanations[0]['reasons'][0]['reason'] == 'config-hash'
+
+
+@pytest.mark.parametrize('exc', [RuntimeError('boom'), KeyboardInterrupt()])
+def test_failed_dry_run_leaves_outputs_alone(workdir, exc):
+    assert make_maestro(WriteTarget('out/flaky.txt'), dry_run=False).run()
+    os.remove('.build/all_targets.yml')
+    state = os.path.getmtime('.build/state.db')
+
+    bm = make_maestro(WriteTarget('out/flaky.txt', fail_with=exc))
+    assert bm.run() is False
+    with open('out/flaky.txt') as f:
+        assert f.read() == 'hello'
+    assert not os.path.exists('.build/all_targets.yml')
+    assert os.path.getmtime('.build/state.db') == state
+
+
+def test_failed_build_cleans_outputs(workdir):
+    assert make_maestro(WriteTarget('out/flaky.txt'), dry_run=False).run()
+    bm = make_maestro(WriteTarget('out/flaky.txt', fail_with=RuntimeError('boom')), dry_run=False)
+    assert bm.run() is False
+    assert not os.path.exists('out/flaky.txt')
@@ -0,0 +1,154 @@
+'''
+Tests for FileInfoCache, the stat/hash memo every target in a BuildMaestro shares.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import collections
+import os
+import threading
+import time
+
+import pytest
+
+from buildtools import utils
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.base_target import SingleBuildTarget
+from buildtools.maestro.filecache import FileInfoCache
+
+
+class ConcatTarget(SingleBuildTarget):
+    BT_LABEL = 'CONCAT'
+
+    def build(self):
+        with open(self.target, 'w') as w:
+            for filename in self.files:
+                with open(filename) as r:
+                    w.write(r.read())
+
+
+def write(filename, text):
+    with open(filename, 'w') as f:
+        f.write(text)
+    return os.path.abspath(filename)
+
+
+def test_stat_is_memoized_until_invalidated(workdir):
+    cache = FileInfoCache()
+    filename = write('a.txt', 'a')
+    assert cache.stat(filename).st_size == 1
+    write('a.txt', 'aaa')
+    assert cache.stat(filename).st_size == 1
+    assert (cache.stat_hits, cache.stat_misses) == (1, 1)
+    cache.invalidate(['a.txt'])
+    assert cache.stat(filename).st_size == 3
+
+
+def test_stat_of_missing_file_or_directory(workdir):
+    cache = FileInfoCache()
+    os.mkdir('dir')
+    assert cache.stat(os.path.abspath('dir')) is None
+    assert cache.stat(os.path.abspath('missing')) is None
+
+
+def test_hash_is_keyed_by_signature(workdir):
+    cache = FileInfoCache('sha256')
+    filename = write('a.txt', 'a')
+    signature = cache.getSignature(os.stat(filename))
+    assert cache.hash(filename, signature) == utils.sha256sum(filename)
+    assert cache.hash(filename, signature) == utils.sha256sum(filename)
+    assert (cache.hash_hits, cache.hash_misses) == (1, 1)
+
+    write('a.txt', 'bb')
+    newsignature = cache.getSignature(os.stat(filename))
+    assert newsignature != signature
+    assert cache.hash(filename, newsignature) == utils.sha256sum(filename)
+    assert cache.hash_misses == 2
+
+
+def test_shared_input_is_hashed_once_per_run(workdir, monkeypatch):
+    hashed = collections.Counter()
+    hashsum = utils.hashsum
+
+    def counting_hashsum(filename, algorithm=utils.DEFAULT_HASH_ALGORITHM):
+        hashed[filename] += 1
+        return hashsum(filename, algorithm)
+    monkeypatch.setattr(utils, 'hashsum', counting_hashsum)
+
+    shared = write('shared.txt', 'shared')
+    for run in range(2):
+        bm = BuildMaestro()
+        for i in range(10):
+            bm.add(ConcatTarget('out{}.txt'.format(i), files=['shared.txt', write('own{}.txt'.format(i), str(i))]))
+        write('shared.txt', 'changed' * run)
+        hashed.clear()
+        assert bm.run()
+        assert hashed[shared] == 1
+        assert all(hashed[os.path.abspath('own{}.txt'.format(i))] <= 1 for i in range(10))
+
+
+def test_hash_many_in_parallel(workdir):
+    cache = FileInfoCache('sha256', jobs=4)
+    cache.PARALLEL_MIN_BYTES = 0
+    files = []
+    for i in range(20):
+        filename = write('{}.txt'.format(i), str(i) * 1000)
+        files.append((filename, cache.getSignature(os.stat(filename))))
+    try:
+        assert cache.hashMany(files) == {filename: utils.sha256sum(filename) for filename, _ in files}
+        assert cache.hash_misses == 20
+        cache.hashMany(files)
+        assert cache.hash_hits == 20
+    finally:
+        cache.shutdown()
+
+
+def test_concurrent_hashes_of_one_file_are_shared(workdir, monkeypatch):
+    calls = []
+    hashsum = utils.hashsum
+
+    def slow_hashsum(filename, algorithm=utils.DEFAULT_HASH_ALGORITHM):
+        calls.append(filename)
+        time.sleep(0.1)
+        return hashsum(filename, algorithm)
+    monkeypatch.setattr(utils, 'hashsum', slow_hashsum)
+
+    cache = FileInfoCache()
+    filename = write('a.txt', 'a')
+    signature = cache.getSignature(os.stat(filename))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.hash(filename, signature))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [filename]
+    assert results == [hashsum(filename)] * 8
+
+
+def test_failed_hash_is_not_cached(workdir):
+    cache = FileInfoCache()
+    filename = os.path.abspath('missing.txt')
+    with pytest.raises(OSError):
+        cache.hash(filename, [1, 0, 0, 0])
+    write('missing.txt', 'a')
+    signature = cache.getSignature(os.stat(filename))
+    assert cache.hash(filename, signature) == utils.hashsum(filename)
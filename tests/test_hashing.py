@@ -0,0 +1,93 @@
+'''
+Tests for the pluggable hash algorithms used by the build cache.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import hashlib
+import io
+import os
+
+import pytest
+
+from buildtools import utils
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.base_target import SingleBuildTarget
+
+
+class CopyTarget(SingleBuildTarget):
+    BT_LABEL = 'COPY'
+
+    def __init__(self, target, files):
+        self.builds = 0
+        super().__init__(target, files=files)
+
+    def build(self):
+        self.builds += 1
+        with open(self.files[0], 'rb') as r, open(self.target, 'wb') as w:
+            w.write(r.read())
+
+
+def reference(algorithm, data):
+    if algorithm.startswith('xxh'):
+        import xxhash
+        hasher = getattr(xxhash, algorithm)()
+    else:
+        hasher = hashlib.new(algorithm)
+    hasher.update(data)
+    return hasher.hexdigest()
+
+
+# Below the block size, between it and the mmap threshold, and above that.
+@pytest.mark.parametrize('size', [0, 100, 65536 * 3 + 7, utils.MMAP_THRESHOLD + 1])
+@pytest.mark.parametrize('algorithm', utils.available_hash_algorithms())
+def test_hashsum_matches_reference(tmp_path, algorithm, size):
+    data = os.urandom(size)
+    filename = str(tmp_path / 'data.bin')
+    with open(filename, 'wb') as f:
+        f.write(data)
+    assert utils.hashsum(filename, algorithm) == reference(algorithm, data)
+    assert utils.hashfile(io.BytesIO(data), utils.new_hasher(algorithm)) == reference(algorithm, data)
+
+
+def test_new_hasher_rejects_unknown_algorithm():
+    with pytest.raises(ValueError):
+        utils.new_hasher('not-a-hash')
+
+
+def test_default_algorithm_is_available():
+    assert utils.DEFAULT_HASH_ALGORITHM in utils.available_hash_algorithms()
+
+
+def test_changing_algorithm_rebuilds(workdir):
+    with open('in.txt', 'w') as f:
+        f.write('hello')
+
+    def build(algorithm):
+        bm = BuildMaestro()
+        bm.hash_algorithm = algorithm
+        bt = bm.add(CopyTarget('out.txt', files=['in.txt']))
+        assert bm.run()
+        return bt.builds
+    assert build('sha256') == 1
+    assert build('sha256') == 0
+    assert build('blake2b') == 1
+    assert build('blake2b') == 0
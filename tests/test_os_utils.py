@@ -0,0 +1,241 @@
+'''
+Tests for the file copying helpers in buildtools.os_utils.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import io
+import os
+
+import pytest
+
+from buildtools import os_utils
+from buildtools.maestro.filecache import FileInfoCache
+
+
+@pytest.fixture(params=['copy_file_range', 'sendfile', 'neither'])
+def lazy_kernel(request, monkeypatch):
+    '''
+    Kernel copies that copy nothing and say so, like copy_file_range() on some filesystems.
+    '''
+    for name in ('copy_file_range', 'sendfile'):
+        if request.param in (name, 'neither'):
+            monkeypatch.setattr(os, name, lambda *args: 0, raising=False)
+    return request.param
+
+
+def test_copy_file_falls_back_when_the_kernel_copies_nothing(workdir, lazy_kernel):
+    with open('src.bin', 'wb') as f:
+        f.write(b'x' * 100000)
+    os_utils.copy_file('src.bin', 'dst.bin')
+    with open('dst.bin', 'rb') as f:
+        assert f.read() == b'x' * 100000
+
+
+def test_copy_fileobj_falls_back_when_the_kernel_copies_nothing(workdir, lazy_kernel):
+    with open('src.bin', 'wb') as f:
+        f.write(b'0123456789')
+    with open('src.bin', 'rb') as fsrc, open('dst.bin', 'wb') as fdst:
+        fsrc.read(2)
+        fdst.write(b'>')
+        assert os_utils.copy_fileobj(fsrc, fdst) == 8
+        assert fsrc.tell() == 10
+        fdst.write(b'<')
+    with open('dst.bin', 'rb') as f:
+        assert f.read() == b'>23456789<'
+
+
+def test_copy_empty_file(workdir):
+    open('empty', 'wb').close()
+    os_utils.copy_file('empty', 'copy')
+    assert os.path.getsize('copy') == 0
+
+
+@pytest.mark.skipif(not os.path.isfile('/proc/self/status'), reason='No procfs.')
+def test_copy_file_that_claims_to_be_empty(workdir):
+    assert os.stat('/proc/self/status').st_size == 0
+    os_utils.copy_file('/proc/self/status', 'status')
+    assert os.path.getsize('status') > 0
+    with open('/proc/self/status', 'rb') as fsrc:
+        out = io.BytesIO()
+        assert os_utils.copy_fileobj(fsrc, out) > 0
+
+
+def test_copy_fileobj_length(workdir):
+    with open('src.bin', 'wb') as f:
+        f.write(b'0123456789')
+    with open('src.bin', 'rb') as fsrc, open('dst.bin', 'wb') as fdst:
+        assert os_utils.copy_fileobj(fsrc, fdst, 4) == 4
+        assert os_utils.copy_fileobj(fsrc, fdst, 0) == 0
+        assert fsrc.read() == b'456789'
+    with open('dst.bin', 'rb') as f:
+        assert f.read() == b'0123'
+
+
+def make_tree(root, count=20):
+    files = {
+        'top.txt': b'top',
+        'skip.tmp': b'ignored by extension',
+        'sub/a.txt': b'a',
+        'sub/deeper/b.bin': bytes(range(256)),
+        'node_modules/c.txt': b'ignored by directory',
+        'sub/node_modules/d.txt': b'ignored by directory',
+    }
+    for i in range(count):
+        files['many/{}.txt'.format(i)] = str(i).encode()
+    for relpath, data in files.items():
+        path = os.path.join(root, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+    return files
+
+
+def read_tree(root):
+    tree = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            with open(path, 'rb') as f:
+                tree[os.path.relpath(path, root).replace(os.sep, '/')] = f.read()
+    return tree
+
+
+IGNORE = ['node_modules/', '.tmp']
+
+
+@pytest.mark.parametrize('jobs', [1, 4])
+def test_copytree_copies_what_optree_visits(workdir, jobs):
+    files = make_tree('src')
+    visited = []
+    os_utils.optree('src', 'dst', lambda src, dst, **kwargs: visited.append(os.path.relpath(src, 'src').replace(os.sep, '/')), IGNORE)
+    assert os_utils.copytree('src', 'dst', ignore=IGNORE, jobs=jobs) == len(visited)
+    assert read_tree('dst') == {relpath: files[relpath] for relpath in visited}
+    assert not any(relpath.endswith('.tmp') or 'node_modules' in relpath for relpath in visited)
+    for relpath in visited:
+        assert os.stat(os.path.join('src', relpath)).st_mtime_ns == os.stat(os.path.join('dst', relpath)).st_mtime_ns
+
+
+def test_copytree_makes_every_directory_first(workdir, monkeypatch):
+    make_tree('src')
+    os.makedirs(os.path.join('src', 'empty', 'nested'))
+    os.makedirs(os.path.join('src', 'node_modules', 'empty'))
+    copied = []
+
+    def copy_files(pairs, **kwargs):
+        # Everything has somewhere to go before the first file is copied.
+        assert all(os.path.isdir(os.path.dirname(dst)) for _, dst in pairs)
+        copied.extend(pairs)
+        return len(pairs)
+    monkeypatch.setattr(os_utils, 'copy_files', copy_files)
+    os_utils.copytree('src/', 'dst/', ignore=IGNORE)
+    assert copied
+    assert os.path.isdir(os.path.join('dst', 'empty', 'nested'))
+    assert not os.path.exists(os.path.join('dst', 'node_modules'))
+
+
+def test_copytree_only_copies_what_changed(workdir):
+    make_tree('src')
+    os_utils.copytree('src', 'dst', ignore=IGNORE)
+    assert os_utils.copytree('src', 'dst', ignore=IGNORE) == 0
+
+    with open(os.path.join('src', 'sub', 'a.txt'), 'wb') as f:
+        f.write(b'A')
+    os.remove(os.path.join('dst', 'many', '3.txt'))
+    assert os_utils.copytree('src', 'dst', ignore=IGNORE) == 2
+    tree = read_tree('dst')
+    assert (tree['sub/a.txt'], tree['many/3.txt']) == (b'A', b'3')
+
+
+def test_copytree_ignore_mtime_compares_contents(workdir):
+    make_tree('src', count=0)
+    os_utils.copytree('src', 'dst', ignore=IGNORE)
+    os.utime(os.path.join('src', 'top.txt'), (0, 0))
+    assert os_utils.copytree('src', 'dst', ignore=IGNORE, ignore_mtime=True) == 0
+    with open(os.path.join('dst', 'top.txt'), 'wb') as f:
+        f.write(b'TOP')
+    assert os_utils.copytree('src', 'dst', ignore=IGNORE, ignore_mtime=True) == 1
+    assert read_tree('dst')['top.txt'] == b'top'
+
+
+@pytest.mark.parametrize('strategy', ['copy', 'reflink', 'hardlink', 'symlink'])
+def test_single_copy_strategies(workdir, strategy):
+    with open('src.txt', 'wb') as f:
+        f.write(b'data')
+    os.mkdir('out')
+    assert os_utils.single_copy('src.txt', 'out', strategy=strategy)
+    with open(os.path.join('out', 'src.txt'), 'rb') as f:
+        assert f.read() == b'data'
+    dst_st = os.stat(os.path.join('out', 'src.txt'))
+    assert os.path.islink(os.path.join('out', 'src.txt')) == (strategy == 'symlink')
+    assert os.path.samestat(os.stat('src.txt'), dst_st) == (strategy in ('hardlink', 'symlink'))
+    assert dst_st.st_mtime_ns == os.stat('src.txt').st_mtime_ns
+    # Up to date now, whatever it is.
+    assert not os_utils.single_copy('src.txt', 'out', strategy=strategy)
+
+
+def test_single_copy_replaces_links(workdir):
+    with open('src.txt', 'wb') as f:
+        f.write(b'data')
+    os_utils.single_copy('src.txt', 'dst.txt', as_file=True, strategy='symlink')
+    assert os_utils.single_copy('src.txt', 'dst.txt', as_file=True, strategy='copy')
+    assert not os.path.islink('dst.txt')
+    with open('dst.txt', 'wb') as f:
+        f.write(b'changed')
+    with open('src.txt', 'rb') as f:
+        assert f.read() == b'data'
+
+
+def test_can_copy(workdir):
+    with open('src.txt', 'wb') as f:
+        f.write(b'data')
+    assert os_utils.canCopy('src.txt', 'missing.txt')
+    os_utils.clone_file('src.txt', 'dst.txt', 'copy', copy_stat=True)
+    assert not os_utils.canCopy('src.txt', 'dst.txt')
+
+    # Same size, different times: copied unless a file cache shows the contents match.
+    os.utime('dst.txt', (1000000000, 1000000000))
+    os.utime('src.txt', (1000000000, 1000000000.5))
+    assert os_utils.canCopy('src.txt', 'dst.txt')
+    assert not os_utils.canCopy('src.txt', 'dst.txt', file_cache=FileInfoCache())
+    with open('dst.txt', 'wb') as f:
+        f.write(b'DATA')
+    os.utime('dst.txt', (1000000000, 1000000000))
+    assert os_utils.canCopy('src.txt', 'dst.txt', file_cache=FileInfoCache())
+
+    with open('dst.txt', 'wb') as f:
+        f.write(b'longer')
+    os.utime('dst.txt', (1000000000, 1000000000.5))
+    assert os_utils.canCopy('src.txt', 'dst.txt')
+    assert not os_utils.canCopy('src.txt', 'dst.txt', ignore_filecmp=True)
+
+
+def test_clone_file_falls_back_to_copy(workdir, monkeypatch):
+    def unsupported(*args):
+        raise OSError('nope')
+    monkeypatch.setattr(os, 'link', unsupported)
+    monkeypatch.setattr(os_utils, 'reflink', unsupported)
+    with open('src.txt', 'wb') as f:
+        f.write(b'data')
+    for strategy in ('hardlink', 'reflink'):
+        assert os_utils.clone_file('src.txt', 'dst.txt', strategy) == 'copy'
+        with open('dst.txt', 'rb') as f:
+            assert f.read() == b'data'
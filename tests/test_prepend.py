@@ -0,0 +1,84 @@
+'''
+Tests for PrependToFileTarget and the newline handling it streams through.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import codecs
+import io
+
+import pytest
+
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.fileio import PrependToFileTarget
+from buildtools.maestro.textstream import copy_normalizing_newlines
+
+TEXT = '/* Header é */\n'
+BODY = 'first\r\nsecond\rthird\n\r\nfourth éè \r' * 1000 + 'last'
+
+
+def reference(data, read_encoding, write_encoding, normalize_newlines=True):
+    '''
+    What the old character-at-a-time loop wrote, less its habit of doubling a \\r\\n split between two blocks.
+    '''
+    body = codecs.decode(data, read_encoding)
+    if normalize_newlines:
+        body = body.replace('\r\n', '\n').replace('\r', '\n')
+    return codecs.encode(TEXT + body, write_encoding)
+
+
+@pytest.mark.parametrize('read_encoding,write_encoding,bom', [
+    ('utf-8-sig', 'utf-8-sig', True),
+    ('utf-8-sig', 'utf-8-sig', False),
+    ('utf-8-sig', 'utf-8', True),
+    ('utf-8', 'utf-8-sig', False),
+    ('latin-1', 'latin-1', False),
+    ('latin-1', 'utf-8', False),
+    ('utf-8-sig', 'utf-16', True),
+])
+@pytest.mark.parametrize('normalize_newlines', [True, False])
+def test_same_output_as_before(workdir, read_encoding, write_encoding, bom, normalize_newlines):
+    data = (codecs.BOM_UTF8 if bom else b'') + BODY.encode(codecs.lookup(read_encoding).name.replace('-sig', ''))
+    with open('in.txt', 'wb') as f:
+        f.write(data)
+    bm = BuildMaestro()
+    bm.add(PrependToFileTarget('out/out.txt', 'in.txt', TEXT, read_encoding=read_encoding, write_encoding=write_encoding,
+                               normalize_newlines=normalize_newlines))
+    assert bm.run()
+    with open('out/out.txt', 'rb') as f:
+        assert f.read() == reference(data, read_encoding, write_encoding, normalize_newlines)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 4096])
+def test_newlines_split_between_chunks(chunk_size):
+    data = b'a\r\n\r\rb\r\r\nc\n\r' * 5 + b'\r'
+    out = io.BytesIO()
+    assert copy_normalizing_newlines(io.BytesIO(data), out, chunk_size) == len(data)
+    assert out.getvalue() == data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+
+def test_empty_subject(workdir):
+    open('in.txt', 'wb').close()
+    bm = BuildMaestro()
+    bm.add(PrependToFileTarget('out.txt', 'in.txt', TEXT, write_encoding='utf-8'))
+    assert bm.run()
+    with open('out.txt', 'rb') as f:
+        assert f.read() == TEXT.encode('utf-8')
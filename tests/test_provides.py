@@ -0,0 +1,83 @@
+'''
+Tests for the once-per-run provides() memo.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.base_target import BuildTarget
+
+
+class ListTarget(BuildTarget):
+    '''
+    Provides whatever is in self.outputs, and counts how often it was asked.
+    '''
+    BT_LABEL = 'LIST'
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.calls = 0
+        super().__init__(list(outputs), files=[], name='list')
+
+    def calcProvides(self):
+        self.calls += 1
+        return self.outputs
+
+    def get_config(self):
+        return {}
+
+    def build(self):
+        for filename in self.outputs:
+            with open(filename, 'w') as f:
+                f.write(filename)
+
+
+def test_provides_is_deduplicated_in_order():
+    bt = ListTarget(['b', 'a', 'b', 'c', 'a'])
+    assert bt.provides() == ('b', 'a', 'c')
+
+
+def test_provides_is_computed_once_until_reset():
+    bt = ListTarget(['a'])
+    assert bt.provides() is bt.provides()
+    assert bt.calls == 1
+    bt.outputs = ['a', 'b']
+    assert bt.provides() == ('a',)
+    bt.invalidateProvides()
+    assert bt.provides() == ('a', 'b')
+    bt.outputs = ['c']
+    bt.resetMemos()
+    assert bt.provides() == ('c',)
+    assert bt.calls == 3
+
+
+def test_each_run_asks_once(workdir):
+    bm = BuildMaestro()
+    bt = bm.add(ListTarget(['a.txt', 'b.txt']))
+    for run in range(2):
+        bt.calls = 0
+        assert bm.run()
+        assert bt.calls == 1
+
+    bt.outputs = ['a.txt', 'c.txt']
+    assert bm.run()
+    assert bm.findProviderIDs('c.txt') == [bt.ID]
+    assert bm.findProviderIDs('b.txt') == []
@@ -0,0 +1,143 @@
+'''
+Saves a target of every BT_TYPE with saveRules() and loads it back with loadRules().
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import importlib
+import inspect
+import os
+
+import pytest
+
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.base_target import BuildTarget
+
+
+def make_fileio(m):
+    os.makedirs(os.path.join('src', 'sub'))
+    for filename in ('a.txt', os.path.join('sub', 'b.txt')):
+        with open(os.path.join('src', filename), 'w') as f:
+            f.write(filename)
+    return [
+        m.CopyFileTarget('out/copy.txt', 'src/a.txt', strategy='hardlink'),
+        m.MoveFileTarget('out/moved.txt', 'src/a.txt'),
+        m.ReplaceTextTarget('out/replaced.txt', 'src/a.txt', {'a': 'b'}, read_encoding='utf-8', multiline=True),
+        m.PrependToFileTarget('out/prepended.txt', 'src/a.txt', '# header\n', normalize_newlines=False),
+        m.ConcatenateBuildTarget('out/concat.js', ['src/a.txt', 'src/sub/b.txt'], write_encoding='utf-8', source_map=True),
+        m.CopyFilesTarget('.build/copyfiles.json', 'src', 'dest', ignore=['*.tmp'], verbose=True, show_progress=True, strategy='reflink'),
+        m.ExtractArchiveTarget('extracted', 'archive.zip'),
+    ]
+
+
+def make_web(m):
+    return [
+        m.DartSCSSBuildTarget('out/dart.css', ['style.scss'], import_paths=['inc'], output_style='compressed', sass_path='/bin/sass', imported=['inc/_a.scss'], source_map=True),
+        m.RubySCSSBuildTarget('out/ruby.css', ['style.scss'], compass=True, sass_path='/bin/sass'),
+        m.SCSSConvertTarget('out/converted.scss', ['style.css'], sass_convert_path='/bin/sass-convert'),
+        m.SVG2PNGBuildTarget('out/icon.png', 'icon.svg', 32, 64, inkscape='/bin/inkscape'),
+        m.ICOBuildTarget('out/icon.ico', ['a.png', 'b.png'], convert_executable='/bin/convert'),
+        m.UglifyJSTarget('out/min.js', 'in.js', mangle=False, options=['--ie8'], uglify_executable='/bin/uglifyjs'),
+        m.MinifySVGTarget('out/min.svg', 'icon.svg', svgo_opts=['-q', '--pretty'], svgo_executable='/bin/svgo'),
+        m.DatafyImagesTarget('out/data.css', 'style.css', 'img'),
+        m.CacheBashifyFiles('out/cache', 'img/logo.png', 'out/manifest.json', basedirdest='cache', flags=m.EBashLayoutFlags.HASHDIR),
+        m.DownloadFileTarget('out/dl.bin', 'https://example.com/a/b.bin', cache=False),
+        m.WebifyTarget('out/font.css', 'font.ttf'),
+    ]
+
+
+def make_coffeescript(m):
+    return [
+        m.CoffeeBuildTarget('out/a.js', ['a.coffee', 'b.coffee'], coffee_executable='/bin/coffee', coffee_concat_executable='/bin/coffee-concat', make_map=True),
+        m.JS2CoffeeBuildTarget('out/a.coffee', ['a.js'], j2coffee_opts=['-i', '4'], js2coffee_path='/bin/js2coffee'),
+    ]
+
+
+def make_convert_data(m):
+    return [m.ConvertDataBuildTarget('out/data.yml', 'data.json', from_type=m.EDataType.JSON, to_type=m.EDataType.YAML, indent_chars=2, pretty_print=True)]
+
+
+def make_git(m):
+    return [m.GitSubmoduleCheckTarget(gitmodulesfile='modules.txt', gitconfigfile='config.txt')]
+
+
+def make_package_managers(m):
+    # get_config() hashes them.
+    for filename in ('composer.json', 'composer.lock'):
+        with open(filename, 'w') as f:
+            f.write('{}')
+    return [
+        m.YarnBuildTarget(working_dir='js', opts=['--frozen-lockfile'], yarn_path='/bin/yarn', lockfile='js/yarn.lock'),
+        m.NPMBuildTarget(working_dir='npm', npm_path='/bin/npm'),
+        m.BowerBuildTarget(bower_path='/bin/bower'),
+        m.GruntBuildTarget(grunt_path='/bin/grunt'),
+        m.ComposerBuildTarget(opts=['--no-dev'], composer_path='/bin/composer', composer_bin_dir='bin'),
+        m.BrowserifyBuildTarget(target='out/bundle.js', files=['main.js'], browserify_path='/bin/browserify'),
+    ]
+
+
+MAKERS = {
+    'buildtools.maestro.fileio': make_fileio,
+    'buildtools.maestro.web': make_web,
+    'buildtools.maestro.coffeescript': make_coffeescript,
+    'buildtools.maestro.convert_data': make_convert_data,
+    'buildtools.maestro.git': make_git,
+    'buildtools.maestro.package_managers': make_package_managers,
+}
+
+
+@pytest.fixture
+def targets(workdir):
+    out = [BuildTarget('virtual', files=['a.txt'], name='base')]
+    for modname, make in MAKERS.items():
+        try:
+            module = importlib.import_module(modname)
+        except ImportError:
+            # git.py needs pygit2.
+            continue
+        made = make(module)
+        for cls in vars(module).values():
+            if inspect.isclass(cls) and issubclass(cls, BuildTarget) and 'BT_TYPE' in vars(cls):
+                assert any(type(bt) is cls for bt in made), f'{cls.__name__} is missing from {make.__name__}()'
+        out += made
+    return out
+
+
+@pytest.mark.parametrize('binary', [False, True], ids=['text', 'binary'])
+def test_every_type_round_trips(targets, binary):
+    saved = BuildMaestro()
+    for bt in targets:
+        BuildMaestro.RecognizeType(type(bt))
+        saved.add(bt)
+    saved.saveRules('rules', binary=binary)
+
+    loaded = BuildMaestro()
+    loaded.loadRules('rules')
+    assert len(loaded.alltargets) == len(targets)
+    by_name = {bt.name: bt for bt in loaded.alltargets}
+    for bt in targets:
+        copy = by_name[bt.name]
+        assert type(copy) is type(bt)
+        assert copy.serialize() == bt.serialize(), bt.BT_TYPE
+        assert copy.provides() == bt.provides(), bt.BT_TYPE
+        assert copy.get_config() == bt.get_config(), bt.BT_TYPE
+        assert copy.getConfigHash() == bt.getConfigHash(), bt.BT_TYPE
+        assert set(vars(bt)) - set(vars(copy)) == set(), bt.BT_TYPE
@@ -0,0 +1,136 @@
+'''
+Tests for the binary rules file codec.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import enum
+import os
+
+import pytest
+
+from buildtools.maestro import rulesfile
+from buildtools.maestro.rulesfile import EXT_ENUM, EXT_OBJECT, RulesFile, RulesFormatError, packb, unpackb, write_rules
+from buildtools.maestro.utils import SerializableFileLambda, SerializableLambda
+
+
+class Color(enum.Enum):
+    RED = 1
+    GREEN = 'green'
+
+
+class Unregistered(object):
+    def __init__(self):
+        self.value = 1
+
+
+@pytest.fixture(params=['msgpack', 'pure'])
+def codec(request, monkeypatch):
+    if request.param == 'msgpack':
+        pytest.importorskip('msgpack')
+    else:
+        monkeypatch.setattr(rulesfile, 'msgpack', None)
+    return request.param
+
+
+def ext(code, value):
+    out = []
+    rulesfile._packExt(code, packb(value), out)
+    return b''.join(out)
+
+
+def test_values_round_trip(codec):
+    value = {
+        'str': 'ünï', 'int': [0, -1, 127, -33, 255, 65536, 2 ** 40, -2 ** 40], 'float': 1.5, 'none': None,
+        'bool': [True, False], 'bytes': b'\x00\xff', 'tuple': (1, (2, 3)), 'set': {1, 2}, 'frozenset': frozenset('ab'),
+        'enum': [Color.RED, Color.GREEN], 'lambda': SerializableLambda('x'),
+        'filelambda': SerializableFileLambda('a.txt', as_blob=True), 'long': 'x' * 70000, 'list': list(range(20)),
+    }
+    decoded = unpackb(packb(value))
+    assert decoded['lambda'].string == 'x'
+    assert vars(decoded['filelambda']) == vars(value['filelambda'])
+    for k in ('lambda', 'filelambda'):
+        del decoded[k], value[k]
+    assert decoded == value
+    assert type(decoded['tuple']) is tuple and type(decoded['set']) is set and type(decoded['frozenset']) is frozenset
+
+
+def test_codecs_agree():
+    msgpack = pytest.importorskip('msgpack')
+    value = {'a': (1, 2), 'b': {Color.RED}, 'c': SerializableLambda('x'), 'd': [1.5, None, 'x' * 300]}
+    with_msgpack = packb(value)
+    rulesfile.msgpack = None
+    try:
+        assert packb(value) == with_msgpack
+    finally:
+        rulesfile.msgpack = msgpack
+
+
+def test_unregistered_objects_are_not_written(codec):
+    with pytest.raises(TypeError):
+        packb({'x': Unregistered()})
+
+
+@pytest.mark.parametrize('path', ['os:system', 'builtins:eval', 'subprocess:Popen', 'os:path.join'])
+def test_enum_must_be_an_enum(codec, path, tmp_path):
+    with pytest.raises(RulesFormatError):
+        unpackb(ext(EXT_ENUM, [path, 'touch ' + str(tmp_path / 'pwned')]))
+    assert not os.path.exists(tmp_path / 'pwned')
+
+
+def test_enum_module_is_never_imported(codec):
+    with pytest.raises(RulesFormatError, match='has not been imported'):
+        unpackb(ext(EXT_ENUM, ['antigravity:Foo', 1]))
+
+
+@pytest.mark.parametrize('path', ['os:_wrap_close', __name__ + ':Unregistered', 'subprocess:Popen'])
+def test_object_types_are_allow_listed(codec, path):
+    with pytest.raises(RulesFormatError, match='not an allowed object type'):
+        unpackb(ext(EXT_OBJECT, [path, {'args': 'id'}]))
+
+
+def test_crafted_rules_file_is_rejected(codec, tmp_path, monkeypatch):
+    filename = str(tmp_path / 'rules.bin')
+    monkeypatch.setitem(rulesfile.OBJECT_TYPES, __name__ + ':Unregistered', Unregistered)
+    write_rules(filename, [{'type': 'Evil', 'name': 'x', 'payload': Unregistered()}])
+    monkeypatch.delitem(rulesfile.OBJECT_TYPES, __name__ + ':Unregistered')
+    with pytest.raises(RulesFormatError):
+        list(RulesFile(filename).iterRules())
+
+
+def test_rules_file_keeps_order_and_skips_types(codec, tmp_path):
+    filename = str(tmp_path / 'rules.bin')
+    rules = [{'type': 'A' if i % 3 else 'B', 'name': str(i), 'files': ['f{}'.format(i)]} for i in range(600)]
+    rules[5]['extra'] = Color.RED
+    write_rules(filename, rules)
+    assert rulesfile.is_rules_file(filename)
+    rf = RulesFile(filename)
+    assert sorted(rf.getTypes()) == ['A', 'B']
+    assert list(rf.iterRules()) == rules
+    assert list(rf.iterRules(types=['B'])) == [rule for rule in rules if rule['type'] == 'B']
+
+
+def test_bad_header(tmp_path):
+    filename = str(tmp_path / 'rules.bin')
+    with open(filename, 'wb') as f:
+        f.write(rulesfile.MAGIC + b'\x63\x00\x00\x00\x00')
+    with pytest.raises(RulesFormatError, match='version'):
+        RulesFile(filename)
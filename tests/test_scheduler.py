@@ -0,0 +1,268 @@
+'''
+Tests for how BuildMaestro orders, schedules and checks targets.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import _thread
+import os
+import threading
+import time
+
+import pytest
+
+from buildtools.maestro import BuildMaestro, TarjanGraph
+from buildtools.maestro.base_target import SingleBuildTarget
+from buildtools.maestro.fileio import PrependToFileTarget
+
+
+class StepTarget(SingleBuildTarget):
+    '''
+    Writes its target after running `action`, and records when it ran in `log`.
+    '''
+    BT_LABEL = 'STEP'
+
+    def __init__(self, target, dependencies=[], log=None, action=None, parallel_safe=True):
+        self.log = log if log is not None else []
+        self.action = action
+        self.parallel_safe = parallel_safe
+        self.builds = 0
+        super().__init__(target, files=list(dependencies), dependencies=dependencies)
+
+    def get_config(self):
+        return {}
+
+    def is_parallel_safe(self):
+        return self.parallel_safe
+
+    def build(self):
+        self.builds += 1
+        self.log.append(('start', self.target))
+        if self.action is not None:
+            self.action(self)
+        with open(self.target, 'w') as f:
+            f.write(self.target)
+        self.log.append(('end', self.target))
+
+
+def diamond(bm, log, **kwargs):
+    return [
+        bm.add(StepTarget('a.txt', log=log, **kwargs)),
+        bm.add(StepTarget('b.txt', ['a.txt'], log=log, **kwargs)),
+        bm.add(StepTarget('c.txt', ['a.txt'], log=log, **kwargs)),
+        bm.add(StepTarget('d.txt', ['b.txt', 'c.txt'], log=log, **kwargs)),
+    ]
+
+
+def assert_deps_first(log, bts):
+    for bt in bts:
+        for dep in bt.dependencies:
+            assert log.index(('end', dep)) < log.index(('start', bt.target))
+
+
+@pytest.mark.parametrize('jobs', [1, 4])
+def test_dependencies_build_first(workdir, jobs):
+    log = []
+    bm = BuildMaestro()
+    bts = diamond(bm, log)
+    assert bm.run(jobs=jobs)
+    assert all(bt.builds == 1 for bt in bts)
+    assert_deps_first(log, bts)
+
+
+def test_independent_targets_run_at_once(workdir):
+    barrier = threading.Barrier(2, timeout=5)
+    bm = BuildMaestro()
+    bm.add(StepTarget('b.txt', action=lambda bt: barrier.wait()))
+    bm.add(StepTarget('c.txt', action=lambda bt: barrier.wait()))
+    # Would time out the barrier, and fail, if they were built one after the other.
+    assert bm.run(jobs=2)
+
+
+def test_unsafe_targets_run_alone(workdir):
+    running = []
+    overlaps = []
+
+    def action(bt):
+        running.append(bt.target)
+        if len(running) > 1 and not all(other.parallel_safe for other in bts if other.target in running):
+            overlaps.append(list(running))
+        time.sleep(0.05)
+        running.remove(bt.target)
+    bm = BuildMaestro()
+    bts = [bm.add(StepTarget('{}.txt'.format(i), action=action, parallel_safe=i % 3 != 0)) for i in range(9)]
+    assert bm.run(jobs=4)
+    assert overlaps == []
+
+
+def test_failure_halts_dependents(workdir):
+    def fail(bt):
+        raise RuntimeError('nope')
+    log = []
+    bm = BuildMaestro()
+    bts = diamond(bm, log)
+    bts[1].action = fail
+    assert bm.run(jobs=4) is False
+    assert bts[3].builds == 0
+
+
+def test_parallel_targets_share_a_new_directory(workdir, monkeypatch):
+    isdir = os.path.isdir
+
+    def slow_isdir(path):
+        # Like a network filesystem: long enough for every worker to see the directory missing.
+        found = isdir(path)
+        time.sleep(0.05)
+        return found
+    monkeypatch.setattr(os.path, 'isdir', slow_isdir)
+    with open('in.js', 'w') as f:
+        f.write('body();\n')
+    bm = BuildMaestro()
+    for i in range(8):
+        bm.add(PrependToFileTarget('out/deep/{}.js'.format(i), 'in.js', '// {}\n'.format(i)))
+    assert bm.run(jobs=8)
+    assert sorted(os.listdir('out/deep')) == ['{}.js'.format(i) for i in range(8)]
+
+
+def test_interrupt_waits_for_running_targets_before_cleaning(workdir):
+    def slow(bt):
+        with open(bt.target, 'w') as f:
+            f.write('partial')
+        time.sleep(0.3)
+
+    def interrupt(bt):
+        time.sleep(0.05)
+        # What Ctrl+C does to the main thread.
+        _thread.interrupt_main()
+    bm = BuildMaestro()
+    bts = [
+        bm.add(StepTarget('slow.txt', action=slow)),
+        bm.add(StepTarget('interrupt.txt', action=interrupt)),
+        bm.add(StepTarget('after.txt', ['slow.txt'])),
+    ]
+    assert bm.run(jobs=2) is False
+    assert bts[0].log[-1] == ('end', 'slow.txt')
+    assert not os.path.exists('slow.txt')
+    assert bts[2].builds == 0
+
+
+def started(log):
+    return [target for event, target in log if event == 'start']
+
+
+def test_single_job_builds_in_order_added(workdir):
+    log = []
+    bm = BuildMaestro()
+    for name in ('z', 'y', 'x', 'w'):
+        bm.add(StepTarget(name + '.txt', log=log))
+    bm.add(StepTarget('v.txt', ['x.txt'], log=log))
+    assert bm.run(jobs=1)
+    assert started(log) == ['z.txt', 'y.txt', 'x.txt', 'w.txt', 'v.txt']
+
+
+def test_rebuilt_target_rebuilds_downstream(workdir):
+    def build():
+        log = []
+        bm = BuildMaestro()
+        bts = diamond(bm, log)
+        assert bm.run(jobs=4)
+        return [bt.builds for bt in bts]
+    assert build() == [1, 1, 1, 1]
+    assert build() == [0, 0, 0, 0]
+    os.remove('c.txt')
+    assert build() == [0, 0, 1, 1]
+
+
+def test_build_only_builds_upstream(workdir):
+    log = []
+    bm = BuildMaestro()
+    bts = diamond(bm, log)
+    assert bm.build_only(['b.txt'])
+    assert [bt.builds for bt in bts] == [1, 1, 0, 0]
+    assert bm.build_only(['missing.txt']) is False
+
+
+def test_cycle_stops_the_build(workdir):
+    bm = BuildMaestro()
+    bts = [
+        bm.add(StepTarget('a.txt', ['c.txt'])),
+        bm.add(StepTarget('b.txt', ['a.txt'])),
+        bm.add(StepTarget('c.txt', ['b.txt'])),
+        bm.add(StepTarget('d.txt')),
+    ]
+    assert bm.run() is None
+    assert all(bt.builds == 0 for bt in bts)
+
+
+def test_missing_provider_exits(workdir):
+    bm = BuildMaestro()
+    bm.add(StepTarget('a.txt', ['nothing-makes-this.txt']))
+    with pytest.raises(SystemExit):
+        bm.run()
+
+
+def test_provider_index(workdir):
+    bm = BuildMaestro()
+    a = bm.add(StepTarget('a.txt'))
+    b = bm.add(StepTarget('sub/b.txt'))
+    bm.buildProviderIndex()
+    assert bm.findProviderIDs('a.txt') == [a.ID]
+    assert bm.findProviderIDs(os.path.abspath('sub/b.txt')) == [b.ID]
+    assert bm.findProviderIDs('c.txt') == []
+    assert bm.findProvider(os.path.abspath('a.txt')) == a.name
+    assert bm.findProvider(os.path.abspath('c.txt')) is None
+    assert sorted(bm.targets) == ['a.txt', 'sub/b.txt']
+
+
+def test_tarjan_finds_every_cycle():
+    tg = TarjanGraph()
+    edges = {0: [1], 1: [2], 2: [0], 3: [4], 4: [3, 5], 5: [], 6: [6], 7: [0, 5]}
+    for ID, refs in edges.items():
+        tg.add_edge(ID, refs)
+    tg.SCC()
+    assert sorted(sorted(cycle) for cycle in tg.cycles) == [[0, 1, 2], [3, 4]]
+
+
+def test_tarjan_handles_deep_chains():
+    n = 200000
+    tg = TarjanGraph()
+    for ID in range(n):
+        tg.add_edge(ID, [ID + 1] if ID + 1 < n else [])
+    tg.SCC()
+    assert tg.cycles == []
+
+    tg = TarjanGraph()
+    for ID in range(n):
+        tg.add_edge(ID, [(ID + 1) % n])
+    tg.SCC()
+    assert [len(cycle) for cycle in tg.cycles] == [n]
+
+
+def test_deep_chain_of_targets(workdir):
+    log = []
+    bm = BuildMaestro()
+    previous = []
+    # Deeper than the default recursion limit.
+    for i in range(1500):
+        bt = bm.add(StepTarget('{}.txt'.format(i), previous, log=log))
+        previous = [bt.target]
+    assert bm.run(jobs=2)
+    assert started(log) == ['{}.txt'.format(i) for i in range(1500)]
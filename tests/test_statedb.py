@@ -0,0 +1,132 @@
+'''
+Tests for BuildStateDB, where target cache records are kept.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import hashlib
+import os
+import sqlite3
+import threading
+
+from ruamel.yaml import YAML
+
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.base_target import SingleBuildTarget
+from buildtools.maestro.statedb import BuildStateDB
+
+
+class WriteTarget(SingleBuildTarget):
+    BT_LABEL = 'WRITE'
+
+    def __init__(self, target, text='hello'):
+        self.text = text
+        self.builds = 0
+        super().__init__(target, files=[])
+
+    def get_config(self):
+        return {'text': self.text}
+
+    def build(self):
+        self.builds += 1
+        with open(self.target, 'w') as f:
+            f.write(self.text)
+
+
+def test_writes_wait_for_flush(tmp_path):
+    filename = str(tmp_path / 'sub' / 'state.db')
+    db = BuildStateDB(filename)
+    db.put('a', {'x': 1})
+    assert db.get('a') == {'x': 1}
+    assert BuildStateDB(filename).get('a') is None
+    db.flush()
+    db.close()
+    assert BuildStateDB(filename).get('a') == {'x': 1}
+
+
+def test_prune(tmp_path):
+    db = BuildStateDB(str(tmp_path / 'state.db'))
+    for name in 'abc':
+        db.put(name, {'name': name})
+    db.flush()
+    db.put('d', {'name': 'd'})
+    assert db.prune(['a', 'd']) == 2
+    assert [db.get(name) is not None for name in 'abcd'] == [True, False, False, True]
+
+
+def test_schema_change_drops_records(tmp_path, monkeypatch):
+    filename = str(tmp_path / 'state.db')
+    db = BuildStateDB(filename)
+    db.put('a', {})
+    db.flush()
+    db.close()
+    monkeypatch.setattr(BuildStateDB, 'SCHEMA_VER', BuildStateDB.SCHEMA_VER + 1)
+    assert BuildStateDB(filename).get('a') is None
+
+
+def test_concurrent_puts(tmp_path):
+    db = BuildStateDB(str(tmp_path / 'state.db'))
+
+    def put_many(prefix):
+        for i in range(200):
+            db.put('{}{}'.format(prefix, i), {'i': i})
+    threads = [threading.Thread(target=put_many, args=(prefix,)) for prefix in 'abcd']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    db.flush()
+    conn = sqlite3.connect(db.filename)
+    assert conn.execute('SELECT COUNT(*) FROM targets').fetchone()[0] == 800
+
+
+def test_maestro_keeps_records_in_one_file(workdir):
+    for expected_builds in (1, 0):
+        bm = BuildMaestro()
+        bt = bm.add(WriteTarget('a.txt'))
+        assert bm.run()
+        assert bt.builds == expected_builds
+    assert not os.path.exists(os.path.join('.build', 'cache'))
+    assert bm.state.get('a.txt')['config'] == {'text': 'hello'}
+
+
+def test_legacy_cache_is_migrated(workdir):
+    def build():
+        bm = BuildMaestro()
+        bm.hash_algorithm = 'md5'
+        bt = bm.add(WriteTarget('a.txt'))
+        assert bm.run()
+        return bm, bt
+    bm, _ = build()
+    record = bm.state.get('a.txt')
+    os.remove(bm.state.filename)
+
+    # Write it back out the way buildtools did before state.db, one YAML file per target.
+    legacy = os.path.join('.build', 'cache', hashlib.md5(b'a.txt').hexdigest() + '.yml')
+    os.makedirs(os.path.dirname(legacy))
+    yaml = YAML(typ='safe', pure=True)
+    with open(legacy, 'w') as f:
+        yaml.dump_all([record[key] for key in ('version', 'config-hash', 'target-hash', 'file-times', 'file-hashes', 'config')], f)
+
+    bm, bt = build()
+    assert bt.builds == 0
+    assert not os.path.exists(os.path.join('.build', 'cache'))
+    assert bm.state.get('a.txt')['target-hash'] == record['target-hash']
@@ -0,0 +1,85 @@
+'''
+Checks ReplaceTextTarget's Replacer against the line-by-line loop it replaced.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import io
+import random
+import re
+
+import pytest
+
+from buildtools.maestro.textstream import Replacer, iter_line_chunks
+
+NEEDLES = ['a', 'b', 'ab', 'ba', ' ', r'\s', r'\B', r'\w+', r'\s+$', r'\W$', r'\W', '^a', 'a$', '[ab]+', r'\n', r'b\s', r'(?<=a)b',
+           r'a(?=\n)', r'(?!a)b', r'\bab', r'\Ab', r'a\Z', 'x*', '^', '$', 'a.b']
+REPLACEMENTS = ['', 'x', '\n', 'a', 'b ', r'\g<0>\g<0>', 'ba']
+
+
+def legacy(replacements, text):
+    # What ReplaceTextTarget.build() used to do: every replacement on each line, line break included, then the rest.
+    lines = text.split('\n')
+    lines = [line + '\n' for line in lines[:-1]] + [lines[-1]]
+    out = []
+    for line in lines:
+        for needle, replacement in replacements.items():
+            line = re.sub(needle, replacement, line)
+        out.append(line)
+    return ''.join(out)
+
+
+def streamed(replacements, text, chunk_size=3):
+    replacer = Replacer(replacements)
+    return ''.join(replacer.sub(chunk) for chunk in iter_line_chunks(io.StringIO(text), chunk_size))
+
+
+@pytest.mark.parametrize('replacements,text', [
+    ({r'\s+$': ''}, 'foo\nbar\n'),
+    ({r'\W$': ''}, 'foo.\nbar\n'),
+    ({r'\s': '', 'ab': ''}, 'a\nba\nb \nba'),
+    ({'a': '\n', '^b': 'x'}, 'ab\nb'),
+    ({r'a(?=\n)': 'x'}, 'a\na'),
+    ({'x*': 'a', r'\W$': 'a'}, 'aa\n.\n'),
+    ({' ': '', 'ab': 'a'}, 'a bab'),
+])
+def test_matches_legacy(replacements, text):
+    assert streamed(replacements, text) == legacy(replacements, text)
+
+
+def test_whole_text_at_once():
+    assert Replacer({r'\s+$': ''}).sub('foo\nbar\n') == 'foobar'
+    assert Replacer({r'\s': '', 'ab': ''}).sub('a\nba\nb \nba') == 'ababba'
+
+
+def test_fuzz_matches_legacy():
+    rng = random.Random(20)
+    for _ in range(3000):
+        replacements = {}
+        for _ in range(rng.randint(1, 4)):
+            replacements[rng.choice(NEEDLES)] = rng.choice(REPLACEMENTS)
+        text = ''.join(rng.choice('ab. \n') for _ in range(rng.randint(0, 24)))
+        assert streamed(replacements, text, rng.randint(1, 8)) == legacy(replacements, text), (replacements, text)
+
+
+def test_multiline():
+    replacer = Replacer({r'a\nb': 'ab', '^b$': 'B'}, multiline=True)
+    assert replacer.sub('a\nb\nb\n') == 'ab\nB\n'
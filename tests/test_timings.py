@@ -0,0 +1,90 @@
+'''
+Tests for per-target timings and the critical path report.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import json
+import os
+import time
+
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.base_target import SingleBuildTarget
+
+
+class SleepTarget(SingleBuildTarget):
+    BT_LABEL = 'SLEEP'
+
+    def __init__(self, target, seconds, dependencies=[]):
+        self.seconds = seconds
+        super().__init__(target, files=[], dependencies=dependencies)
+
+    def get_config(self):
+        return {'seconds': self.seconds}
+
+    def build(self):
+        time.sleep(self.seconds)
+        with open(self.target, 'w') as f:
+            f.write(self.target)
+
+
+def build_graph(bm):
+    # a -> b is the long way round, even though c alone takes longer than either.
+    bm.add(SleepTarget('a.txt', 0.1))
+    bm.add(SleepTarget('b.txt', 0.1, ['a.txt']))
+    bm.add(SleepTarget('c.txt', 0.15))
+    bm.add(SleepTarget('d.txt', 0.0, ['b.txt', 'c.txt']))
+
+
+def test_critical_path(workdir):
+    bm = BuildMaestro()
+    build_graph(bm)
+    assert bm.run(jobs=3)
+    seconds, path = bm.getCriticalPath()
+    assert [bt.target for bt in path] == ['a.txt', 'b.txt', 'd.txt']
+    assert seconds >= 0.2
+    assert seconds == sum(bt.timings['wall'] for bt in path)
+
+
+def test_timings_file(workdir):
+    bm = BuildMaestro()
+    bm.report_timings = 2
+    build_graph(bm)
+    assert bm.run(jobs=3)
+    with open(os.path.join('.build', 'timings.json')) as f:
+        data = json.load(f)
+    assert data['jobs'] == 3
+    assert data['critical-path']['targets'] == ['a.txt', 'b.txt', 'd.txt']
+    entries = {entry['target']: entry for entry in data['targets']}
+    assert sorted(entries) == ['a.txt', 'b.txt', 'c.txt', 'd.txt']
+    for entry in entries.values():
+        assert entry['dirty']
+        assert 0 <= entry['start'] <= entry['end'] <= data['wall']
+        assert {'wall', 'cpu', 'staleness', 'cache-io'} <= set(entry)
+    assert entries['c.txt']['wall'] >= 0.15
+    # b waited for a.
+    assert entries['b.txt']['start'] >= entries['a.txt']['end']
+
+
+def test_empty_run(workdir):
+    bm = BuildMaestro()
+    assert bm.run()
+    assert bm.getCriticalPath() == (0.0, [])
@@ -0,0 +1,93 @@
+'''
+Tests for the Chrome trace-event export.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import json
+import threading
+
+from buildtools import tracing
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.base_target import SingleBuildTarget
+
+
+class WriteTarget(SingleBuildTarget):
+    BT_LABEL = 'WRITE'
+
+    def __init__(self, target, dependencies=[]):
+        super().__init__(target, files=[], dependencies=dependencies)
+
+    def get_config(self):
+        return {}
+
+    def build(self):
+        with open(self.target, 'w') as f:
+            f.write(self.target)
+
+
+def test_span_is_a_no_op_when_off():
+    assert not tracing.active()
+    with tracing.span('nothing') as args:
+        assert args is None
+
+
+def test_recorder_gives_each_thread_a_lane():
+    # Keep every thread alive until they've all recorded something, so none of them reuses another's ident.
+    barrier = threading.Barrier(3, timeout=5)
+    recorder = tracing.start()
+    try:
+        def work(name):
+            with tracing.span(name, 'test', n=1) as args:
+                args['more'] = 2
+            barrier.wait()
+        threads = [threading.Thread(target=work, args=('t{}'.format(i),), name='worker{}'.format(i)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        assert tracing.stop() is recorder
+    events = recorder.getEvents()
+    spans = [event for event in events if event['ph'] == 'X']
+    assert sorted(event['name'] for event in spans) == ['t0', 't1', 't2']
+    assert len({event['tid'] for event in spans}) == 3
+    assert all(event['args'] == {'n': 1, 'more': 2} and event['dur'] >= 0 for event in spans)
+    lanes = {event['tid']: event['args']['name'] for event in events if event['name'] == 'thread_name'}
+    assert sorted(lanes.values()) == ['worker0', 'worker1', 'worker2']
+
+
+def test_build_writes_trace(workdir):
+    bm = BuildMaestro()
+    bm.trace_file = 'trace/build.json'
+    bm.add(WriteTarget('a.txt'))
+    bm.add(WriteTarget('b.txt', ['a.txt']))
+    assert bm.run(jobs=2)
+    assert not tracing.active()
+    with open('trace/build.json') as f:
+        trace = json.load(f)
+    events = trace['traceEvents']
+    targets = {event['name']: event for event in events if event.get('cat') == 'target'}
+    assert sorted(targets) == ['a.txt', 'b.txt']
+    assert all(event['args']['dirty'] and event['args']['type'] == 'WriteTarget' for event in targets.values())
+    assert targets['b.txt']['ts'] >= targets['a.txt']['ts'] + targets['a.txt']['dur']
+    assert any(event.get('cat') == 'phase' for event in events)
+    assert any(event['name'] == 'flush' for event in events)
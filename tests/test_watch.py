@@ -0,0 +1,95 @@
+'''
+Tests for the source index behind --watch and --affected-by, and the file watchers.
+
+Copyright (c) 2015 - 2021 Rob "N3X15" Nelson <nexisentertainment@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+'''
+import os
+
+import pytest
+
+from buildtools.maestro import BuildMaestro
+from buildtools.maestro.fileio import ConcatenateBuildTarget, CopyFilesTarget, CopyFileTarget
+from buildtools.maestro.watch import InotifyWatcher, PollingWatcher
+
+
+def write(filename, text):
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    with open(filename, 'w') as f:
+        f.write(text)
+
+
+@pytest.fixture
+def maestro(workdir):
+    write('src/a.txt', 'a\n')
+    write('src/sub/b.txt', 'b\n')
+    write('other.txt', 'other\n')
+    bm = BuildMaestro()
+    bm.jobs = 1
+    bm.add(CopyFilesTarget('.build/copy.json', 'src', 'dest'))
+    bm.add(ConcatenateBuildTarget('all.txt', ['dest/a.txt', 'dest/sub/b.txt']))
+    bm.add(CopyFileTarget('other-copy.txt', 'other.txt'))
+    assert bm.run()
+    return bm
+
+
+def names(targets):
+    return [bt.name for bt in targets]
+
+
+def test_directory_sources_are_indexed(maestro):
+    index = maestro.getSourceIndex()
+    for filename in ('src', 'src/a.txt', 'src/sub', 'src/sub/b.txt', 'other.txt'):
+        assert os.path.abspath(filename) in index, filename
+    # Outputs are left to the dependency graph.
+    for filename in ('dest', 'dest/a.txt', 'all.txt'):
+        assert os.path.abspath(filename) not in index, filename
+
+
+def test_affected_by_file_in_directory_source(maestro):
+    assert names(maestro.getAffectedBy(['src/sub/b.txt'])) == ['src -> dest', 'all.txt']
+    assert names(maestro.getAffectedBy(['src/new.txt'])) == ['src -> dest', 'all.txt']
+    assert names(maestro.getAffectedBy(['dest/a.txt'])) == ['all.txt']
+    assert names(maestro.getAffectedBy(['other.txt'])) == ['other.txt -> other-copy.txt']
+    assert maestro.getAffectedBy(['unrelated.txt']) == []
+
+
+@pytest.mark.parametrize('kind', ['polling', 'inotify'])
+def test_watcher_sees_new_files_in_directories(workdir, kind):
+    if kind == 'polling':
+        watcher = PollingWatcher(0.01)
+    elif InotifyWatcher.isAvailable():
+        watcher = InotifyWatcher()
+    else:
+        pytest.skip('No inotify here.')
+    write('src/a.txt', 'a\n')
+    src = os.path.abspath('src')
+    a = os.path.join(src, 'a.txt')
+    try:
+        watcher.setPaths([src, a])
+        write('src/a.txt', 'changed\n')
+        assert a in watcher.wait(5)
+        # Poll once more so the directory's mtime can't tick over between the two writes.
+        watcher.wait(0.05)
+        write('src/new.txt', 'new\n')
+        assert src in watcher.wait(5)
+    finally:
+        watcher.close()